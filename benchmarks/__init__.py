@@ -0,0 +1,6 @@
+"""
+Benchmarks of wap's build, TOC generation and publish paths on synthesized projects.
+
+Run them from the repository root with `uv run python -m benchmarks`. They aren't
+collected by pytest.
+"""
@@ -0,0 +1,181 @@
+"""
+Run the benchmarks and store (and optionally compare) their results as JSON.
+"""
+
+from __future__ import annotations
+
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import click
+
+from benchmarks.project import PRESETS, make_project
+from benchmarks.scenarios import SCENARIOS, Scenario
+from wap import __version__ as wap_version
+from wap.timing import profiling
+
+RESULTS_VERSION = 1
+
+
+def run_scenario(
+    scenario: Scenario, config_path: Path, preset: str, repeat: int
+) -> dict[str, Any]:
+    seconds: list[float] = []
+    phases: dict[str, float] = {}
+    for run in range(repeat):
+        work = scenario.prepare(config_path, PRESETS[preset], run)
+        with profiling() as profiler:
+            start = time.perf_counter()
+            work()
+            seconds.append(time.perf_counter() - start)
+        # phases of the fastest run, summed over addons
+        if seconds[-1] == min(seconds):
+            phases = {}
+            for timing in profiler.phase_timings():
+                phases[timing.phase] = (
+                    phases.get(timing.phase, 0) + timing.total_ns / 1e9
+                )
+    return {
+        "seconds": seconds,
+        "min": min(seconds),
+        "median": statistics.median(seconds),
+        "phases": phases,
+    }
+
+
+def compare(
+    baseline: dict[str, Any], current: dict[str, Any], max_slowdown: float | None
+) -> bool:
+    """
+    Print how the median of each scenario changed from baseline. Returns False if any
+    got slower by more than max_slowdown percent.
+    """
+    ok = True
+    click.echo(f"\n{'scenario':<20} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["median"]
+        after = result["median"]
+        change = (after - before) / before * 100
+        flag = ""
+        if max_slowdown is not None and change > max_slowdown:
+            flag = "  REGRESSION"
+            ok = False
+        click.echo(f"{name:<20} {before:>9.3f}s {after:>9.3f}s {change:>+7.1f}%{flag}")
+    return ok
+
+
+@click.command()
+@click.option(
+    "--preset",
+    type=click.Choice(list(PRESETS)),
+    default="small",
+    show_default=True,
+    help="The size of the synthesized project.",
+)
+@click.option(
+    "--scenario",
+    "scenario_names",
+    type=click.Choice([scenario.name for scenario in SCENARIOS]),
+    multiple=True,
+    help="A scenario to run. Can be given multiple times. Defaults to all of them.",
+)
+@click.option(
+    "--repeat",
+    type=click.IntRange(min=1),
+    default=5,
+    show_default=True,
+    help="How many times to run each scenario.",
+)
+@click.option(
+    "--output",
+    "output_path",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Write the results to this JSON file.",
+)
+@click.option(
+    "--compare",
+    "baseline_path",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Compare the results to those in this JSON file.",
+)
+@click.option(
+    "--max-slowdown",
+    type=float,
+    default=None,
+    help=(
+        "With --compare, exit with an error if any scenario's median is this many "
+        "percent slower than the baseline."
+    ),
+)
+@click.option(
+    "--work-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Synthesize the project here (and keep it) instead of in a temp directory.",
+)
+def main(
+    preset: str,
+    scenario_names: tuple[str, ...],
+    repeat: int,
+    output_path: Path | None,
+    baseline_path: Path | None,
+    max_slowdown: float | None,
+    work_dir: Path | None,
+) -> None:
+    """
+    Benchmark wap on a synthesized project.
+    """
+    scenarios = [
+        scenario
+        for scenario in SCENARIOS
+        if not scenario_names or scenario.name in scenario_names
+    ]
+
+    with tempfile.TemporaryDirectory(prefix="wap-bench-") as temp_dir:
+        root = work_dir or Path(temp_dir)
+        click.echo(f"Synthesizing {preset} project in {root}...")
+        config_path = make_project(root, PRESETS[preset])
+
+        results: dict[str, Any] = {}
+        for scenario in scenarios:
+            click.echo(f"{scenario.name}: {scenario.description}...", nl=False)
+            results[scenario.name] = run_scenario(scenario, config_path, preset, repeat)
+            click.echo(f" {results[scenario.name]['median']:.3f}s (median)")
+
+    report = {
+        "version": RESULTS_VERSION,
+        "wapVersion": wap_version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "preset": preset,
+        "project": PRESETS[preset].to_python_object(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+    if output_path is not None:
+        output_path.write_text(json.dumps(report, indent=2))
+        click.echo(f"Wrote results to {output_path}")
+
+    if baseline_path is not None:
+        baseline = json.loads(baseline_path.read_text())
+        if baseline.get("preset") != preset:
+            click.echo(
+                f"Warning: baseline is of preset {baseline.get('preset')}, not {preset}"
+            )
+        if not compare(baseline, report, max_slowdown):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
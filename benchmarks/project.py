@@ -0,0 +1,151 @@
+"""
+Synthesized wap projects to benchmark against.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+from pathlib import Path, PurePosixPath
+from typing import Any, ClassVar
+
+from attrs import frozen
+
+from tests.fixture.config import get_basic_config
+
+
+@frozen(kw_only=True)
+class ProjectSpec:
+    """
+    The shape of a synthesized project. Each addon has files_per_addon Lua files spread
+    over directories up to depth deep, plus assets_per_addon binary assets of
+    asset_size bytes each.
+    """
+
+    addons: int
+    files_per_addon: int
+    depth: int
+    assets_per_addon: int
+    asset_size: int
+
+    # how many Lua files of each addon are listed in its TOC
+    TOC_FILES: ClassVar[int] = 50
+
+    def to_python_object(self) -> dict[str, Any]:
+        return {
+            "addons": self.addons,
+            "filesPerAddon": self.files_per_addon,
+            "depth": self.depth,
+            "assetsPerAddon": self.assets_per_addon,
+            "assetSize": self.asset_size,
+        }
+
+
+PRESETS: dict[str, ProjectSpec] = {
+    "small": ProjectSpec(
+        addons=1,
+        files_per_addon=100,
+        depth=2,
+        assets_per_addon=1,
+        asset_size=256 * 1024,
+    ),
+    "medium": ProjectSpec(
+        addons=10,
+        files_per_addon=1_000,
+        depth=4,
+        assets_per_addon=4,
+        asset_size=1024 * 1024,
+    ),
+    "large": ProjectSpec(
+        addons=50,
+        files_per_addon=1_000,
+        depth=8,
+        assets_per_addon=4,
+        asset_size=2 * 1024 * 1024,
+    ),
+}
+
+# ever so slightly more realistic than random bytes
+_LUA_LINE = 'local function f{n}(self, ...) return self.values[{n}] or "{n}" end\n'
+
+
+def addon_name(index: int) -> str:
+    return f"Addon{index:02}"
+
+
+def lua_file_path(index: int, depth: int) -> PurePosixPath:
+    """
+    Returns the path of the index-th Lua file of an addon. Files fan out into
+    directories four at a time, up to depth directories deep.
+    """
+    parts = [f"Dir{(index >> (2 * level)) % 4}" for level in range(index % (depth + 1))]
+    return PurePosixPath(*parts, f"File{index:05}.lua")
+
+
+def make_project(root: Path, spec: ProjectSpec, seed: int = 0) -> Path:
+    """
+    Write a project of the given shape into root, and return the path of its config.
+    The same spec and seed always produce the same project.
+    """
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    (root / "LICENSE").write_text("All rights reserved.\n")
+
+    template = get_basic_config()["package"][0]
+    package: list[dict[str, Any]] = []
+    for addon_index in range(spec.addons):
+        name = addon_name(addon_index)
+        addon_path = root / name
+
+        lua_paths = [
+            lua_file_path(index, spec.depth) for index in range(spec.files_per_addon)
+        ]
+        for index, lua_path in enumerate(lua_paths):
+            path = addon_path / lua_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            lines = rng.randint(20, 80)
+            path.write_text(
+                "".join(_LUA_LINE.format(n=index * 100 + line) for line in range(lines))
+            )
+
+        media_path = addon_path / "Media"
+        media_path.mkdir(parents=True, exist_ok=True)
+        for asset_index in range(spec.assets_per_addon):
+            (media_path / f"Texture{asset_index}.blp").write_bytes(
+                rng.randbytes(spec.asset_size)
+            )
+
+        package.append(
+            {
+                "path": f"./{name}",
+                "toc": {
+                    "tags": template["toc"]["tags"] | {"Title": name},
+                    "files": [
+                        str(lua_path) for lua_path in lua_paths[: spec.TOC_FILES]
+                    ],
+                },
+                "include": ["./LICENSE"],
+            }
+        )
+
+    config = get_basic_config() | {"name": "Bench", "package": package}
+    config_path = root / "wap.json"
+    config_path.write_text(json.dumps(config, indent=2))
+    return config_path
+
+
+def edit_files(
+    root: Path, spec: ProjectSpec, fraction: float, generation: int
+) -> list[Path]:
+    """
+    Change the contents of a fraction (at least one) of each addon's Lua files. Returns
+    the paths of the changed files.
+    """
+    count = max(1, int(spec.files_per_addon * fraction))
+    changed: list[Path] = []
+    for addon_index in range(spec.addons):
+        for index in range(count):
+            path = root / addon_name(addon_index) / lua_file_path(index, spec.depth)
+            path.write_text(f"-- edit {generation}\n{path.read_text()}")
+            changed.append(path.resolve())
+    return changed
@@ -0,0 +1,210 @@
+"""
+The benchmarked scenarios. Each prepares a project (untimed) and returns the work to
+time.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+from collections.abc import Callable, Sequence
+from pathlib import Path
+
+import respx
+from attrs import frozen
+
+from benchmarks.project import ProjectSpec, edit_files
+from tests.cmd_util import invoke
+from tests.fixture.curseforge import CURSEFORGE_TOKEN, setup_mock_cf_api
+from wap.commands import build, publish
+from wap.commands.build import AddonBuildResult, Package
+from wap.config import Config
+from wap.core import CACHE_DIR_ENVVAR_NAME
+from wap.toc import Toc
+
+# prepares a run (given the project config path, its spec and the run's index) and
+# returns the work to time
+Prepare = Callable[[Path, ProjectSpec, int], Callable[[], object]]
+
+
+@frozen(kw_only=True)
+class Scenario:
+    name: str
+    description: str
+    prepare: Prepare
+
+
+def _wap(command: Callable[..., object], args: Sequence[str]) -> None:
+    result = invoke(command, args)  # type: ignore[arg-type]
+    if not result.success:
+        raise RuntimeError(
+            f"wap failed with exit code {result.exit_code}: {result.stderr}"
+        ) from result.exception
+
+
+def _build(config_path: Path) -> None:
+    _wap(build.build, ["--config-path", str(config_path)])
+
+
+def _dist_path(config_path: Path) -> Path:
+    return config_path.parent / "dist"
+
+
+def _prepare_cold_build(
+    config_path: Path, spec: ProjectSpec, run: int
+) -> Callable[[], object]:
+    shutil.rmtree(_dist_path(config_path), ignore_errors=True)
+    return lambda: _build(config_path)
+
+
+def _prepare_warm_build(
+    config_path: Path, spec: ProjectSpec, run: int
+) -> Callable[[], object]:
+    if not _dist_path(config_path).exists():
+        _build(config_path)
+    return lambda: _build(config_path)
+
+
+def _prepare_incremental_build(
+    config_path: Path, spec: ProjectSpec, run: int
+) -> Callable[[], object]:
+    if not _dist_path(config_path).exists():
+        _build(config_path)
+    edit_files(config_path.parent, spec, fraction=0.01, generation=run)
+    return lambda: _build(config_path)
+
+
+def _load_built_package(config_path: Path) -> tuple[Package, list[AddonBuildResult]]:
+    config = Config.from_path(config_path)
+    package = Package.create(
+        config=config, config_path=config_path, output_path=_dist_path(config_path)
+    )
+    return package, list(package.build(clean=False))
+
+
+def _prepare_watch_rebuild(
+    config_path: Path, spec: ProjectSpec, run: int
+) -> Callable[[], object]:
+    package, results = _load_built_package(config_path)
+    index = package.addon_path_index()
+    # just one file, as when saving in an editor
+    changed_paths = edit_files(config_path.parent, spec, fraction=0, generation=run)[:1]
+
+    def rebuild() -> None:
+        package.apply_changes(
+            previous_results=results,
+            changed_paths_by_addon=index.group(changed_paths),
+        )
+
+    return rebuild
+
+
+def _prepare_toc_generation(
+    config_path: Path, spec: ProjectSpec, run: int
+) -> Callable[[], object]:
+    package, results = _load_built_package(config_path)
+    results_by_name = {result.path.name: result for result in results}
+
+    def generate() -> None:
+        for addon in package.addons:
+            result = results_by_name[addon.name]
+            Toc.validate_all(
+                result.tocs, result.path, file_paths=result.file_sources.keys()
+            )
+            for toc in result.tocs:
+                toc.generate()
+
+    return generate
+
+
+def _prepare_publish(
+    config_path: Path, spec: ProjectSpec, run: int
+) -> Callable[[], object]:
+    if not _dist_path(config_path).exists():
+        _build(config_path)
+    # make each run zip again, rather than reusing the last zip
+    edit_files(config_path.parent, spec, fraction=0, generation=run)
+    _build(config_path)
+    # cache version ids with the project rather than in the user's cache directory
+    os.environ[CACHE_DIR_ENVVAR_NAME] = str(config_path.parent / ".cache")
+
+    def zip_and_upload() -> None:
+        with respx.mock(assert_all_called=False) as respx_mock:
+            setup_mock_cf_api(respx_mock)
+            _wap(
+                publish.publish,
+                [
+                    "--config-path",
+                    str(config_path),
+                    "--curseforge-token",
+                    CURSEFORGE_TOKEN,
+                ],
+            )
+
+    return zip_and_upload
+
+
+def _prepare_build_and_publish(
+    config_path: Path, spec: ProjectSpec, run: int
+) -> Callable[[], object]:
+    if not _dist_path(config_path).exists():
+        _build(config_path)
+    edit_files(config_path.parent, spec, fraction=0.01, generation=run)
+    os.environ[CACHE_DIR_ENVVAR_NAME] = str(config_path.parent / ".cache")
+
+    def build_zip_and_upload() -> None:
+        with respx.mock(assert_all_called=False) as respx_mock:
+            setup_mock_cf_api(respx_mock)
+            _wap(
+                publish.publish,
+                [
+                    "--config-path",
+                    str(config_path),
+                    "--curseforge-token",
+                    CURSEFORGE_TOKEN,
+                    "--build",
+                ],
+            )
+
+    return build_zip_and_upload
+
+
+SCENARIOS: list[Scenario] = [
+    Scenario(
+        name="cold-build",
+        description="wap build into an empty output directory",
+        prepare=_prepare_cold_build,
+    ),
+    Scenario(
+        name="warm-build",
+        description="wap build again without any changes",
+        prepare=_prepare_warm_build,
+    ),
+    Scenario(
+        name="incremental-build",
+        description="wap build after changing 1% of the files of each addon",
+        prepare=_prepare_incremental_build,
+    ),
+    Scenario(
+        name="watch-rebuild",
+        description="applying one changed file to the build, as in watch mode",
+        prepare=_prepare_watch_rebuild,
+    ),
+    Scenario(
+        name="toc-generation",
+        description="validating and generating every TOC file",
+        prepare=_prepare_toc_generation,
+    ),
+    Scenario(
+        name="publish",
+        description="wap publish (zip and upload) to a mock CurseForge API",
+        prepare=_prepare_publish,
+    ),
+    Scenario(
+        name="build-and-publish",
+        description=(
+            "wap publish --build (build, zip and upload) after changing 1% of the files"
+        ),
+        prepare=_prepare_build_and_publish,
+    ),
+]
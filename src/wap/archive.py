@@ -0,0 +1,274 @@
+"""
+Zip archives of built packages, suitable for uploading.
+
+Archives are deterministic: entries are written in sorted order with fixed timestamps
+and permissions, so the same files always produce the same archive. That lets archives
+be cached by a digest of their inputs.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import zipfile
+from collections.abc import Collection, Iterator, Mapping, Sequence
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, ClassVar
+
+import arrow
+from attrs import frozen
+
+from wap.fileops import copy_file
+from wap.manifest import Manifest, hash_file
+
+DEFAULT_COMPRESSION_LEVEL = 6
+
+# these formats are already compressed, so deflating them just costs time
+DEFAULT_STORED_SUFFIXES = frozenset({".blp", ".mp3", ".ogg"})
+
+# the earliest time a zip file can represent
+ZIP_EPOCH_DATE_TIME: ZipDateTime = (1980, 1, 1, 0, 0, 0)
+
+ZipDateTime = tuple[int, int, int, int, int, int]
+
+_FILE_MODE = 0o100644
+_DIR_MODE = 0o040755
+_MS_DOS_DIRECTORY_FLAG = 0x10
+_COPY_BUFFER_SIZE = 1024 * 1024
+
+
+@frozen(kw_only=True)
+class ArchiveEntry:
+    """
+    A file or directory to write into an archive, named by its posix-style path in the
+    archive.
+    """
+
+    arcname: str
+    # the file to write, or None for a directory
+    path: Path | None
+    size: int = 0
+    # the SHA-256 of the file, if it is already known
+    content_hash: str | None = None
+
+    @property
+    def is_dir(self) -> bool:
+        return self.path is None
+
+
+def _walk_sorted(root: Path) -> Iterator[tuple[Path, bool]]:
+    """
+    Yield (path, is_dir) for everything under root in a stable, sorted order.
+    """
+    for dir_path_str, dir_names, file_names in os.walk(root, followlinks=True):
+        dir_names.sort()
+        dir_path = Path(dir_path_str)
+        # sorting dir_names in place also makes os.walk descend in sorted order
+        entries = [(dir_path / name, True) for name in dir_names] + [
+            (dir_path / name, False) for name in file_names
+        ]
+        yield from sorted(entries, key=lambda entry: entry[0].name)
+
+
+def _walk_order(arcname: str) -> tuple[tuple[str, ...], str]:
+    # the order of _walk_sorted: the entries of a directory, by name, before those of
+    # its subdirectories
+    arc_path = PurePosixPath(arcname)
+    return arc_path.parent.parts, arc_path.name
+
+
+def scan_archive_entries(root: Path, manifests_path: Path) -> list[ArchiveEntry]:
+    """
+    Returns the entries of an archive of everything under root, in sorted order.
+
+    root is expected to be a package directory, whose addon directories have manifests
+    in manifests_path. Content hashes are taken from those manifests when the files are
+    unchanged since they were built.
+    """
+    entries: list[ArchiveEntry] = []
+    manifests: dict[str, Manifest] = {}
+    for path, is_dir in _walk_sorted(root):
+        arcname = path.relative_to(root).as_posix()
+        if is_dir:
+            entries.append(ArchiveEntry(arcname=arcname, path=None))
+            continue
+
+        addon_name, _, addon_rel_path = arcname.partition("/")
+        if addon_name not in manifests:
+            manifests[addon_name] = Manifest.from_path(
+                manifests_path / f"{addon_name}.json"
+            )
+        stat = path.stat()
+        manifest_entry = manifests[addon_name].files.get(addon_rel_path)
+        entries.append(
+            ArchiveEntry(
+                arcname=arcname,
+                path=path,
+                size=stat.st_size,
+                content_hash=(
+                    manifest_entry.content_hash
+                    if manifest_entry is not None and manifest_entry.matches_stat(stat)
+                    else None
+                ),
+            )
+        )
+    return entries
+
+
+def manifest_archive_entries(
+    root: Path, manifests: Mapping[str, Manifest]
+) -> list[ArchiveEntry]:
+    """
+    Returns the entries of an archive of the addons just built into the package
+    directory root, from their manifests (keyed by addon directory name), in the same
+    order as scan_archive_entries. Nothing under root is read.
+    """
+    entries: list[ArchiveEntry] = []
+    for addon_name, manifest in manifests.items():
+        entries.append(ArchiveEntry(arcname=addon_name, path=None))
+        entries.extend(
+            ArchiveEntry(arcname=f"{addon_name}/{rel_path}", path=None)
+            for rel_path in manifest.dirs
+        )
+        entries.extend(
+            ArchiveEntry(
+                arcname=f"{addon_name}/{rel_path}",
+                path=root / addon_name / rel_path,
+                size=manifest_entry.size,
+                content_hash=manifest_entry.content_hash,
+            )
+            for rel_path, manifest_entry in manifest.files.items()
+        )
+    return sorted(entries, key=lambda entry: _walk_order(entry.arcname))
+
+
+def to_zip_date_time(when: arrow.Arrow | None) -> ZipDateTime:
+    """
+    Convert a time to a zip entry timestamp (in UTC), clamped to the earliest time zips
+    can represent. If None, returns that earliest time.
+    """
+    if when is None:
+        return ZIP_EPOCH_DATE_TIME
+    when = when.to("UTC")
+    return max(
+        ZIP_EPOCH_DATE_TIME,
+        (when.year, when.month, when.day, when.hour, when.minute, when.second),
+    )
+
+
+def write_zip(
+    *,
+    entries: Sequence[ArchiveEntry],
+    file: BinaryIO,
+    compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+    stored_suffixes: Collection[str] = DEFAULT_STORED_SUFFIXES,
+    date_time: ZipDateTime = ZIP_EPOCH_DATE_TIME,
+) -> None:
+    """
+    Write a zip archive of entries (see scan_archive_entries) to file, in their order.
+
+    Files are streamed into the archive in chunks, so they are never read into memory
+    whole. Files whose suffix (case-insensitively) is in stored_suffixes are stored
+    without compression, and all others are deflated at compression_level (0-9).
+    """
+    stored_suffixes = {suffix.lower() for suffix in stored_suffixes}
+
+    with zipfile.ZipFile(file, mode="w") as zip_file:
+        for entry in entries:
+            if entry.path is None:
+                zip_info = zipfile.ZipInfo(f"{entry.arcname}/", date_time=date_time)
+                zip_info.external_attr = (_DIR_MODE << 16) | _MS_DOS_DIRECTORY_FLAG
+                zip_file.writestr(zip_info, b"")
+                continue
+
+            zip_info = zipfile.ZipInfo(entry.arcname, date_time=date_time)
+            zip_info.external_attr = _FILE_MODE << 16
+            if entry.path.suffix.lower() in stored_suffixes or compression_level == 0:
+                zip_info.compress_type = zipfile.ZIP_STORED
+            else:
+                zip_info.compress_type = zipfile.ZIP_DEFLATED
+                zip_info.compress_level = compression_level
+            zip_info.file_size = entry.size
+
+            with (
+                entry.path.open("rb") as src_file,
+                zip_file.open(zip_info, mode="w") as dst_file,
+            ):
+                shutil.copyfileobj(src_file, dst_file, _COPY_BUFFER_SIZE)
+
+
+def archive_digest(
+    *,
+    entries: Sequence[ArchiveEntry],
+    compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+    stored_suffixes: Collection[str] = DEFAULT_STORED_SUFFIXES,
+    date_time: ZipDateTime = ZIP_EPOCH_DATE_TIME,
+) -> str:
+    """
+    Returns a digest of everything that goes into a zip of entries written with these
+    options. Equal digests mean the zips would be byte-for-byte identical.
+
+    Only the files of entries without a content hash need to be read.
+    """
+    digest = hashlib.sha256()
+    digest.update(
+        json.dumps(
+            {
+                "compressionLevel": compression_level,
+                "storedSuffixes": sorted(
+                    {suffix.lower() for suffix in stored_suffixes}
+                ),
+                "dateTime": date_time,
+            }
+        ).encode("utf-8")
+    )
+
+    for entry in entries:
+        if entry.path is None:
+            digest.update(f"\0d {entry.arcname}".encode())
+            continue
+        content_hash = entry.content_hash or hash_file(entry.path)
+        digest.update(f"\0f {entry.arcname} {content_hash}".encode())
+
+    return digest.hexdigest()
+
+
+@frozen(kw_only=True)
+class ArtifactCache:
+    """
+    A directory of previously written zips, named by their archive digest.
+    """
+
+    path: Path
+
+    MAX_ARTIFACTS: ClassVar[int] = 10
+
+    def _artifact_path(self, digest: str) -> Path:
+        return self.path / f"{digest}.zip"
+
+    def get(self, digest: str) -> Path | None:
+        artifact_path = self._artifact_path(digest)
+        if not artifact_path.is_file():
+            return None
+        # mark as recently used, so it isn't pruned
+        artifact_path.touch()
+        return artifact_path
+
+    def put(self, digest: str, zip_path: Path) -> None:
+        """
+        Store the zip at zip_path under digest, and then prune the least recently used
+        artifacts so that at most MAX_ARTIFACTS are kept.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        copy_file(zip_path, self._artifact_path(digest), "hardlink")
+        self._artifact_path(digest).touch()
+
+        artifact_paths = sorted(
+            self.path.glob("*.zip"),
+            key=lambda artifact_path: artifact_path.stat().st_mtime_ns,
+            reverse=True,
+        )
+        for stale_path in artifact_paths[self.MAX_ARTIFACTS :]:
+            stale_path.unlink(missing_ok=True)
@@ -1,15 +1,13 @@
+import importlib
 import webbrowser
+from collections.abc import Mapping
 from textwrap import dedent
+from typing import Any
 
 import click
 
 from wap import __name__ as package_name
 from wap import __version__
-from wap.commands.build import build
-from wap.commands.new_config import new_config
-from wap.commands.new_project import new_project
-from wap.commands.publish import publish
-from wap.commands.validate import validate
 from wap.console import print
 
 
@@ -42,19 +40,55 @@ def help_command(subcommand: str | None) -> None:
         open_or_print_help_url(subcommand)
 
 
-SUBCOMMANDS = [
-    build,
-    help_command,
-    new_config,
-    new_project,
-    publish,
-    validate,
-]
-SUBCOMMAND_NAMES = {command.name for command in SUBCOMMANDS}
+# subcommand name to "module:attribute" of its command. these are imported only when
+# needed, because some of them (and their dependencies) take a while to import, and we
+# don't want to pay for that on every invocation.
+LAZY_SUBCOMMANDS = {
+    "build": "wap.commands.build:build",
+    "new-config": "wap.commands.new_config:new_config",
+    "new-project": "wap.commands.new_project:new_project",
+    "publish": "wap.commands.publish:publish",
+    "validate": "wap.commands.validate:validate",
+}
+SUBCOMMAND_NAMES = {help_command.name, *LAZY_SUBCOMMANDS}
 BASE_HELP_URL = "http://t-mart.github.io/wap"
 
 
-@click.group()
+def _add_help_hint(command: click.Command) -> None:
+    if command.help:
+        command.help = (
+            dedent(command.help)
+            + f"\n\nRun `wap help {command.name}` for more information."
+        )
+
+
+class LazyGroup(click.Group):
+    """
+    A group whose subcommands, given as "module:attribute" strings, are imported the
+    first time they are looked up.
+    """
+
+    def __init__(
+        self, *args: Any, lazy_subcommands: Mapping[str, str], **kwargs: Any
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted({*super().list_commands(ctx), *self.lazy_subcommands})
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> click.Command | None:
+        if cmd_name not in self.commands and cmd_name in self.lazy_subcommands:
+            module_name, attribute = self.lazy_subcommands[cmd_name].split(":")
+            command: click.Command = getattr(
+                importlib.import_module(module_name), attribute
+            )
+            _add_help_hint(command)
+            self.add_command(command, cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+
+@click.group(cls=LazyGroup, lazy_subcommands=LAZY_SUBCOMMANDS)
 @click.version_option(
     package_name=package_name,
     message=f"wap version {__version__}",
@@ -63,10 +97,5 @@ def base() -> int | None:
     """World of Warcraft addon packager"""
 
 
-for subcommand in SUBCOMMANDS:
-    base.add_command(subcommand)
-    if subcommand.help:
-        subcommand.help = (
-            dedent(subcommand.help)
-            + f"\n\nRun `wap help {subcommand.name}` for more information."
-        )
+_add_help_hint(help_command)
+base.add_command(help_command)
@@ -1,11 +1,17 @@
 from __future__ import annotations
 
-from collections.abc import Iterable, Iterator, Sequence
-from pathlib import Path
-from typing import Literal, cast, get_args
+import queue
+import threading
+from collections.abc import Callable, Collection, Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from functools import partial
+from pathlib import Path, PurePosixPath, PureWindowsPath
+from typing import ClassVar, Literal, cast, get_args
 
+import arrow
 import click
-from attrs import frozen
+from attrs import evolve, field, frozen
 from watchfiles import watch
 
 from wap.commands.util import (
@@ -13,37 +19,70 @@ from wap.commands.util import (
     clean_option,
     config_path_option,
     output_path_option,
+    timings_options,
     wow_addons_dir_options,
 )
 from wap.config import AddonConfig, Config
 from wap.console import print, warn
-from wap.core import get_build_path
+from wap.core import (
+    get_build_path,
+    get_build_time,
+    get_links_path,
+    get_manifests_path,
+    get_references_path,
+)
 from wap.exception import ConfigError, PathExistsError, PathTypeError
-from wap.fileops import clean_dir, copy_path, delete_path, symlink
-from wap.toc import Toc
+from wap.fileops import (
+    COPY_STRATEGIES,
+    DEFAULT_COPY_STRATEGY,
+    CopyStrategy,
+    clean_dir,
+    delete_path,
+    sync_file,
+    write_generated_file,
+)
+from wap.globs import IncludeResolver
+from wap.ignore import IGNORE_FILE_NAME, IgnoreRules
+from wap.links import sync_links
+from wap.manifest import Manifest, ManifestEntry
+from wap.references import (
+    LOADABLE_SUFFIXES,
+    ReferenceCache,
+    find_loaded_files,
+    order_files,
+    parse_xml_references,
+)
+from wap.scan import ScannedPath, scan_path, scan_tree
+from wap.timing import timed
+from wap.toc import Toc, TocTemplate
 from wap.wow import FLAVOR_MAP, FLAVOR_NAMES, FlavorName, Version
 
+# how many unreferenced files a warning lists by name
+_MAX_LISTED_PATHS = 5
 
-@frozen(kw_only=True)
-class AddonBuildResult:
-    path: Path
+# returns True if a build should stop
+CancelCheck = Callable[[], bool]
 
-    def link(self, wow_addons_path: Path, force: bool) -> Path | None:
-        """
-        Links this built addon to a WoW addons directory. Returns the link path.
-        """
-        link_path = wow_addons_path / self.path.name
 
-        if (
-            force
-            and link_path.exists()
-            and (link_path.resolve() != self.path.resolve())
-        ):
-            delete_path(link_path)
+def _never_cancelled() -> bool:
+    return False
 
-        symlink(new_path=link_path, target_path=self.path)
 
-        return link_path
+@frozen(kw_only=True)
+class AddonBuildResult:
+    path: Path
+    copied: int = field(default=0)
+    skipped: int = field(default=0)
+    removed: int = field(default=0)
+    # warnings are collected instead of printed so that, when addons are built
+    # concurrently, they can still be printed in a deterministic order.
+    warnings: Sequence[str] = field(factory=tuple)
+    # what was built, so that later changes can be applied to it (in watch mode)
+    file_sources: Mapping[str, ScannedPath] = field(factory=dict)
+    manifest: Manifest = field(factory=Manifest)
+    tocs: Sequence[Toc] = field(factory=tuple)
+    # Lua files that aren't loaded, which are only warned about when they change
+    unreferenced: Sequence[str] = field(factory=tuple)
 
 
 @frozen(kw_only=True)
@@ -51,7 +90,12 @@ class Addon:
     source_path: Path
     include_paths: Sequence[Path]
     include_path_root: Path
-    tocs: Sequence[Toc]
+    toc_template: TocTemplate | None
+    # the WoW versions and flavor suffix of each TOC file rendered from toc_template
+    toc_renders: Sequence[tuple[Sequence[Version], str | None]]
+    ignore_rules: IgnoreRules
+    # fill in the TOC files list from the addon's files
+    auto_toc_files: bool = field(default=False)
 
     @classmethod
     def create(
@@ -59,53 +103,107 @@ class Addon:
         addon_config: AddonConfig,
         config: Config,
         config_path: Path,
+        include_resolver: IncludeResolver,
     ) -> Addon:
         config_dir = config_path.parent
 
         source_path = (config_dir / addon_config.path).resolve()
 
-        include_paths: list[Path] = (
-            resolve_globs(root_path=config_dir, glob_patterns=addon_config.include)
-            if addon_config.include
-            else []
-        )
+        with timed("resolve-includes", addon=source_path.name):
+            include_paths: list[Path] = (
+                resolve_globs(
+                    root_path=config_dir,
+                    glob_patterns=addon_config.include,
+                    include_resolver=include_resolver,
+                )
+                if addon_config.include
+                else []
+            )
 
-        tocs: list[Toc] = []
+        template = None
+        toc_renders: list[tuple[Sequence[Version], str | None]] = []
         if addon_config.toc is not None:
+            template = TocTemplate.from_toc_config(
+                toc_config=addon_config.toc,
+                source_path=source_path,
+                config=config,
+            )
             wow_versions: list[Version] = []
             for flavor_name, flavor_version in config.wow_versions.items():
                 wow_version = Version.from_dotted(flavor_version)
-                toc = Toc.from_toc_config(
-                    toc_config=addon_config.toc,
-                    wow_version=wow_version,
-                    flavor_suffix=FLAVOR_MAP[flavor_name].toc_suffix,
-                    config=config,
-                    source_path=source_path,
-                )
-                tocs.append(toc)
-                wow_versions.append(wow_version)
-
-            # create just a standard toc with no suffix because curseforge purportedly
-            # requires it. just use the max wow_version from those provided.
-            max_wow_version = max(wow_versions)
-            tocs.append(
-                Toc.from_toc_config(
-                    toc_config=addon_config.toc,
-                    wow_version=max_wow_version,
-                    config=config,
-                    source_path=source_path,
-                )
-            )
+                if addon_config.toc.mode == "perFlavor":
+                    toc_renders.append(
+                        ([wow_version], FLAVOR_MAP[flavor_name].toc_suffix)
+                    )
+                if wow_version not in wow_versions:
+                    wow_versions.append(wow_version)
+
+            if addon_config.toc.mode == "multiInterface":
+                toc_renders.append((wow_versions, None))
+            else:
+                # create just a standard toc with no suffix because curseforge
+                # purportedly requires it. just use the max wow_version from those
+                # provided.
+                toc_renders.append(([max(wow_versions)], None))
 
         return cls(
             source_path=source_path,
-            tocs=tocs,
+            toc_template=template,
+            toc_renders=toc_renders,
             include_paths=include_paths,
             include_path_root=config_path.parent,
+            ignore_rules=IgnoreRules.for_addon(source_path, addon_config.exclude or []),
+            auto_toc_files=addon_config.toc is not None and addon_config.toc.auto_files,
         )
 
-    def build(self, package_path: Path, clean: bool) -> AddonBuildResult:
-        build_path = package_path / self.source_path.name
+    @property
+    def name(self) -> str:
+        return self.source_path.name
+
+    def render_tocs(self, build_time: arrow.Arrow) -> Sequence[Toc]:
+        """
+        Returns the TOC files of this addon, stamped with build_time.
+        """
+        if self.toc_template is None:
+            return []
+        return [
+            self.toc_template.render(
+                wow_versions=wow_versions,
+                build_time=build_time,
+                flavor_suffix=flavor_suffix,
+            )
+            for wow_versions, flavor_suffix in self.toc_renders
+        ]
+
+    def build(
+        self,
+        package_path: Path,
+        state_path: Path,
+        references_path: Path,
+        clean: bool,
+        build_time: arrow.Arrow,
+        copy_strategy: CopyStrategy = DEFAULT_COPY_STRATEGY,
+        is_cancelled: CancelCheck = _never_cancelled,
+        previous_unreferenced: Sequence[str] = (),
+    ) -> AddonBuildResult:
+        """
+        Build this addon into package_path. Unless cleaning, only the files that differ
+        from those recorded in the previous build's manifest (stored in state_path) are
+        written, and files that the previous build wrote but are no longer part of the
+        addon are removed.
+
+        Files are placed into the output directory with copy_strategy. The TOC files are
+        stamped with build_time. The references of XML files, which are followed to
+        check (or fill in) the TOC files lists, are cached in references_path. Lua files
+        that aren't loaded are warned about, unless the previous build in this run had
+        the same ones (previous_unreferenced).
+
+        is_cancelled is checked between files, and if it returns True, BuildCancelled
+        is raised. The manifest is only written once the build is complete, so the next
+        build will fix up whatever the cancelled one left behind.
+        """
+        build_path = package_path / self.name
+        manifest_path = state_path / f"{self.name}.json"
 
         try:
             build_path.mkdir(parents=True, exist_ok=True)
@@ -116,51 +214,434 @@ class Addon:
 
         if clean:
             clean_dir(build_path)
+            previous_manifest = Manifest()
+        else:
+            previous_manifest = Manifest.from_path(manifest_path)
 
         if not self.source_path.is_dir():
             raise PathTypeError(f"Addon path {self.source_path} should be a directory.")
 
-        # copy source to dest
-        copy_path(self.source_path, build_path)
+        warnings: list[str] = []
+        with timed("plan", addon=self.name):
+            file_sources, dir_paths = self._plan(warnings)
+
+        tocs = self.render_tocs(build_time)
+        toc_names = [toc.filename(build_path.name) for toc in tocs]
+        for toc_name in toc_names:
+            if toc_name in dir_paths:
+                raise PathExistsError(
+                    f"Generated TOC file {build_path / toc_name} should not exist in "
+                    "your source files."
+                )
+            if toc_name in file_sources:
+                warnings.append(
+                    f"Generated TOC path {toc_name} already exists in output directory"
+                )
+                del file_sources[toc_name]
+
+        # remove what we built last time but aren't building now. this happens first so
+        # that a path can change from a file to a directory (or vice versa).
+        removed = 0
+        for rel_path in previous_manifest.files.keys() - file_sources - set(toc_names):
+            stale_path = build_path / rel_path
+            if stale_path.is_file() or stale_path.is_symlink():
+                stale_path.unlink()
+                removed += 1
+        # deepest first, so that children are removed before their parents
+        for rel_path in sorted(previous_manifest.dirs - dir_paths, reverse=True):
+            try:
+                (build_path / rel_path).rmdir()
+            except OSError:
+                # not empty (holds files we didn't write) or already gone
+                pass
+
+        for rel_path in sorted(dir_paths):
+            try:
+                (build_path / rel_path).mkdir(exist_ok=True)
+            except FileExistsError as file_exists_error:
+                raise PathExistsError(
+                    f"Cannot copy directory to {build_path / rel_path} because it is a "
+                    "file. Please remove that file or choose a different target."
+                ) from file_exists_error
+
+        entries: dict[str, ManifestEntry] = {}
+        copied, skipped = 0, 0
+        with timed("copy", addon=self.name):
+            for rel_path, source in file_sources.items():
+                if is_cancelled():
+                    raise BuildCancelled()
+                entry, did_copy = sync_file(
+                    src=source.path,
+                    dst=build_path / rel_path,
+                    previous_entry=previous_manifest.files.get(rel_path),
+                    strategy=copy_strategy,
+                    src_stat=source.stat,
+                )
+                entries[rel_path] = entry
+                if did_copy:
+                    copied += 1
+                else:
+                    skipped += 1
+
+        unreferenced: Sequence[str] = ()
+        if tocs:
+            with timed("follow-references", addon=self.name):
+                tocs, unreferenced = self._follow_references(
+                    tocs=tocs,
+                    build_path=build_path,
+                    entries=entries,
+                    file_paths=file_sources.keys(),
+                    cache_path=references_path / f"{self.name}.json",
+                    warnings=warnings,
+                    previous_unreferenced=previous_unreferenced,
+                )
+
+        with timed("write-tocs", addon=self.name):
+            Toc.validate_all(tocs, build_path, file_paths=file_sources.keys())
+            for toc, toc_name in zip(tocs, toc_names, strict=True):
+                toc_path_target = build_path / toc_name
+                entry, did_write = write_generated_file(
+                    text=toc.generate(),
+                    dst=toc_path_target,
+                    previous_entry=previous_manifest.files.get(toc_name),
+                )
+                entries[toc_name] = entry
+                if did_write:
+                    copied += 1
+                else:
+                    skipped += 1
+
+        manifest = Manifest(files=entries, dirs=frozenset(dir_paths))
+        manifest.write_to_path(manifest_path)
+
+        return AddonBuildResult(
+            path=build_path,
+            copied=copied,
+            skipped=skipped,
+            removed=removed,
+            warnings=warnings,
+            file_sources=file_sources,
+            manifest=manifest,
+            tocs=tocs,
+            unreferenced=unreferenced,
+        )
+
+    def _follow_references(
+        self,
+        tocs: Sequence[Toc],
+        build_path: Path,
+        entries: Mapping[str, ManifestEntry],
+        file_paths: Collection[str],
+        cache_path: Path,
+        warnings: list[str],
+        previous_unreferenced: Sequence[str],
+    ) -> tuple[Sequence[Toc], Sequence[str]]:
+        """
+        Follow the references of the XML files in the files list of tocs (filling it in
+        first, if configured) and warn about references to files that don't exist, and
+        about Lua files that aren't loaded if they aren't previous_unreferenced. Returns
+        the TOCs to write and the Lua files that aren't loaded.
+        """
+        cache = ReferenceCache.from_path(cache_path)
+        # only what this build saw, so that the cache doesn't grow forever
+        references: dict[str, Sequence[str]] = {}
+
+        def read_references(rel_path: str) -> Sequence[str]:
+            content_hash = entries[rel_path].content_hash
+            if content_hash not in references:
+                cached = cache.references.get(content_hash)
+                references[content_hash] = (
+                    cached
+                    if cached is not None
+                    else parse_xml_references((build_path / rel_path).read_bytes())
+                )
+            return references[content_hash]
 
-        # keep track of what we've built
-        addon_paths = {
-            path.relative_to(self.source_path) for path in self.source_path.rglob("*")
+        if self.auto_toc_files:
+            files = order_files(
+                tocs[0].files, file_paths, read_references, addon_name=self.name
+            )
+            tocs = [evolve(toc, files=files) for toc in tocs]
+
+        loaded_files = find_loaded_files(
+            tocs[0].files, file_paths, read_references, addon_name=self.name
+        )
+        for xml_path, reference in loaded_files.missing:
+            warnings.append(
+                f"{xml_path} loads {reference}, which does not exist in the output "
+                "directory"
+            )
+        if loaded_files.unreferenced and (
+            loaded_files.unreferenced != list(previous_unreferenced)
+        ):
+            listing = ", ".join(loaded_files.unreferenced[:_MAX_LISTED_PATHS])
+            if len(loaded_files.unreferenced) > _MAX_LISTED_PATHS:
+                listing += (
+                    f", and {len(loaded_files.unreferenced) - _MAX_LISTED_PATHS} more"
+                )
+            warnings.append(
+                f"{len(loaded_files.unreferenced)} Lua file(s) are not loaded by the "
+                f"TOC files or any XML file they load: {listing}"
+            )
+
+        if references != cache.references:
+            ReferenceCache(references=references).write_to_path(cache_path)
+        return tocs, loaded_files.unreferenced
+
+    def apply_changes(
+        self,
+        previous: AddonBuildResult,
+        changed_paths: Collection[Path],
+        state_path: Path,
+        build_time: arrow.Arrow,
+        copy_strategy: CopyStrategy = DEFAULT_COPY_STRATEGY,
+        is_cancelled: CancelCheck = _never_cancelled,
+    ) -> AddonBuildResult | None:
+        """
+        Update previous, a build of this addon, for the changed source paths without
+        scanning the addon again: each changed file is copied to or removed from the
+        output directory, and the TOCs are only validated and written again (stamped
+        with build_time) if a file they list changed.
+
+        Returns None if none of changed_paths belong to this addon. Raises
+        FullBuildRequired for changes that can't be applied one file at a time, such as
+        added or removed directories. Can be cancelled like build.
+        """
+        build_path = previous.path
+        toc_names = {toc.filename(build_path.name) for toc in previous.tocs}
+        toc_file_paths = {
+            PureWindowsPath(file_path).as_posix()
+            for toc in previous.tocs
+            for file_path in toc.files
         }
 
-        # copy includes
-        for include_path in self.include_paths:
-            include_path_target = build_path / include_path.name
-            rel_path = Path(include_path.name)
-            if rel_path in addon_paths:
-                warn(f"Include path {rel_path} already exists in output directory")
-            else:
-                addon_paths.add(rel_path)
-            copy_path(include_path, include_path_target)
-
-        # write tocs
-        toc_paths: list[Path] = []
-        for toc in self.tocs:
-            toc.validate(build_path)
-            toc_path_target = build_path / toc.filename(build_path.name)
-            rel_path = Path(toc_path_target.name)
-            if rel_path in addon_paths:
-                warn(
-                    f"Generated TOC path {rel_path} already exists in output directory"
+        changed_rel_paths: set[str] = set()
+        for changed_path in changed_paths:
+            for root_path, prefix in self._roots:
+                if changed_path.is_relative_to(root_path):
+                    changed_rel_paths.add(
+                        _join_rel_path(prefix, changed_path.relative_to(root_path))
+                    )
+        if not changed_rel_paths:
+            return None
+
+        # first, work out what to do, so that nothing is touched if a full build is
+        # needed after all
+        updates: dict[str, ScannedPath | None] = {}
+        for rel_path in sorted(changed_rel_paths):
+            if rel_path == "":
+                if not self.source_path.is_dir():
+                    raise FullBuildRequired(f"{self.source_path} is not a directory")
+                continue
+            if rel_path in toc_names:
+                # generated, so the source file is ignored
+                continue
+
+            candidates = [
+                scanned
+                for path in self._sources_for(rel_path)
+                if (scanned := scan_path(path)) is not None
+            ]
+            if self.ignore_rules.excludes(
+                rel_path, any(candidate.is_dir for candidate in candidates)
+            ):
+                continue
+            if any(candidate.is_dir for candidate in candidates):
+                if rel_path in previous.manifest.dirs and all(
+                    candidate.is_dir for candidate in candidates
+                ):
+                    # a directory that we already have, whose contents changed. those
+                    # contents are changes of their own.
+                    continue
+                raise FullBuildRequired(f"{rel_path} is a new directory")
+            if rel_path in previous.manifest.dirs:
+                raise FullBuildRequired(f"{rel_path} is no longer a directory")
+            if (
+                previous.tocs
+                and rel_path.lower().endswith(LOADABLE_SUFFIXES)
+                and (
+                    rel_path.lower().endswith(".xml")
+                    or bool(candidates) != (rel_path in previous.file_sources)
                 )
+            ):
+                # the references need to be followed again
+                raise FullBuildRequired(f"{rel_path} may change which files are loaded")
+            if candidates:
+                if any(
+                    parent_path.as_posix() in previous.file_sources
+                    for parent_path in PurePosixPath(rel_path).parents
+                ):
+                    raise FullBuildRequired(f"{rel_path} is inside of a file")
+                # later sources overwrite earlier ones, as in a full build
+                updates[rel_path] = candidates[-1]
+            elif rel_path in previous.file_sources:
+                updates[rel_path] = None
+
+        if not updates:
+            return None
+
+        entries = dict(previous.manifest.files)
+        file_sources = dict(previous.file_sources)
+        dir_paths = set(previous.manifest.dirs)
+        copied, skipped, removed = 0, 0, 0
+
+        for rel_path, source in updates.items():
+            if is_cancelled():
+                raise BuildCancelled()
+            dst_path = build_path / rel_path
+            if source is None:
+                dst_path.unlink(missing_ok=True)
+                del entries[rel_path], file_sources[rel_path]
+                removed += 1
+                continue
+
+            for parent_path in reversed(PurePosixPath(rel_path).parents[:-1]):
+                if parent_path.as_posix() not in dir_paths:
+                    (build_path / parent_path).mkdir(exist_ok=True)
+                    dir_paths.add(parent_path.as_posix())
+
+            entry, did_copy = sync_file(
+                src=source.path,
+                dst=dst_path,
+                previous_entry=entries.get(rel_path),
+                strategy=copy_strategy,
+                src_stat=source.stat,
+            )
+            entries[rel_path] = entry
+            file_sources[rel_path] = source
+            if did_copy:
+                copied += 1
             else:
-                addon_paths.add(rel_path)
-            try:
-                toc_path_target.write_text(toc.generate())
-            except (PermissionError, IsADirectoryError) as error:
-                # on windows, raises PermissionError, linux raises IsADirectoryError
+                skipped += 1
+
+        tocs = previous.tocs
+        if not updates.keys().isdisjoint(toc_file_paths):
+            # the files lists are those of the previous build, which may have been
+            # filled in
+            tocs = [
+                evolve(toc, files=previous_toc.files)
+                for toc, previous_toc in zip(
+                    self.render_tocs(build_time), previous.tocs, strict=True
+                )
+            ]
+            Toc.validate_all(tocs, build_path, file_paths=file_sources.keys())
+            for toc in tocs:
+                toc_name = toc.filename(build_path.name)
+                entry, did_write = write_generated_file(
+                    text=toc.generate(),
+                    dst=build_path / toc_name,
+                    previous_entry=entries.get(toc_name),
+                )
+                entries[toc_name] = entry
+                if did_write:
+                    copied += 1
+                else:
+                    skipped += 1
+
+        manifest = Manifest(files=entries, dirs=frozenset(dir_paths))
+        manifest.write_to_path(state_path / f"{self.name}.json")
+
+        return AddonBuildResult(
+            path=build_path,
+            copied=copied,
+            skipped=skipped,
+            removed=removed,
+            file_sources=file_sources,
+            manifest=manifest,
+            tocs=tocs,
+            unreferenced=previous.unreferenced,
+        )
+
+    @property
+    def _roots(self) -> Sequence[tuple[Path, str]]:
+        """
+        The paths that the output directory is built from, in the order they are
+        applied, each with the output path (relative to the output directory) that it
+        is placed at.
+        """
+        return [
+            (self.source_path, ""),
+            *((include_path, include_path.name) for include_path in self.include_paths),
+        ]
+
+    def _sources_for(self, rel_path: str) -> list[Path]:
+        """
+        The paths that could be placed at rel_path in the output directory, in the order
+        they are applied. They may not exist.
+        """
+        sources: list[Path] = []
+        for root_path, prefix in self._roots:
+            if prefix == "":
+                sources.append(root_path / rel_path)
+            elif rel_path == prefix:
+                sources.append(root_path)
+            elif rel_path.startswith(f"{prefix}/"):
+                sources.append(root_path / rel_path.removeprefix(f"{prefix}/"))
+        return sources
+
+    def _plan(self, warnings: list[str]) -> tuple[dict[str, ScannedPath], set[str]]:
+        """
+        Determine the contents of the output directory. Returns a mapping of output file
+        paths to the (scanned) source file they come from, and the set of output
+        directory paths. Paths are posix-style and relative to the output directory.
+
+        Source files come first, and then includes, each of which overwrites any earlier
+        file of the same path.
+        """
+        file_sources: dict[str, ScannedPath] = {}
+        dir_paths: set[str] = set()
+
+        def add_tree(root: Path, prefix: str) -> None:
+            def exclude(rel_path: str, is_dir: bool) -> bool:
+                return self.ignore_rules.matches(f"{prefix}{rel_path}", is_dir)
+
+            for rel_path, scanned in scan_tree(root, exclude=exclude):
+                if scanned.is_dir:
+                    add_dir(f"{prefix}{rel_path}")
+                else:
+                    add_file(f"{prefix}{rel_path}", scanned)
+
+        def add_dir(rel_path: str) -> None:
+            if rel_path in file_sources:
+                raise PathExistsError(
+                    f"Cannot copy directory to {rel_path} in the output directory "
+                    "because it is a file. Please remove that file or choose a "
+                    "different target."
+                )
+            dir_paths.add(rel_path)
+
+        def add_file(rel_path: str, source: ScannedPath) -> None:
+            if rel_path in dir_paths:
                 raise PathExistsError(
-                    f"Generated TOC file {toc_path_target} should not exist in your "
-                    "source files."
-                ) from error
-            toc_paths.append(toc_path_target)
+                    f"Cannot copy file {source.path} to {rel_path} in the output "
+                    "directory because it is a directory. Please remove that directory "
+                    "or choose a different target."
+                )
+            file_sources[rel_path] = source
+
+        add_tree(self.source_path, "")
+
+        for include_path in self.include_paths:
+            rel_path = include_path.name
+            if rel_path in file_sources or rel_path in dir_paths:
+                warnings.append(
+                    f"Include path {rel_path} already exists in output directory"
+                )
+            scanned = scan_path(include_path)
+            if scanned is None:  # pragma: no cover
+                raise PathTypeError(
+                    f"Cannot copy path {include_path} because it is not a file or "
+                    "directory."
+                )
+            if self.ignore_rules.matches(rel_path, scanned.is_dir):
+                continue
+            if scanned.is_dir:
+                add_dir(rel_path)
+                add_tree(include_path, f"{rel_path}/")
+            else:
+                add_file(rel_path, scanned)
 
-        return AddonBuildResult(path=build_path)
+        return file_sources, dir_paths
 
     @property
     def watch_paths(self) -> Sequence[Path]:
@@ -171,45 +652,373 @@ class Addon:
 class Package:
     addons: Sequence[Addon]
     build_path: Path
+    state_path: Path
+    references_path: Path
 
     @classmethod
-    def create(cls, config: Config, config_path: Path, output_path: Path) -> Package:
+    def create(
+        cls,
+        config: Config,
+        config_path: Path,
+        output_path: Path,
+        include_resolver: IncludeResolver | None = None,
+    ) -> Package:
+        """
+        Pass include_resolver to reuse the include glob results it has cached.
+        """
+        if include_resolver is None:
+            include_resolver = IncludeResolver()
+        build_path = get_build_path(output_path=output_path, config=config)
         package = cls(
             addons=[
                 Addon.create(
                     addon_config=addon_config,
                     config=config,
                     config_path=config_path,
+                    include_resolver=include_resolver,
                 )
                 for addon_config in config.package
             ],
-            build_path=get_build_path(output_path=output_path, config=config),
+            build_path=build_path,
+            state_path=get_manifests_path(build_path),
+            references_path=get_references_path(build_path),
         )
 
         # dupe check
         seen_addon_paths: set[Path] = set()
+        seen_addon_names: set[str] = set()
         for addon in package.addons:
-            if addon.source_path not in seen_addon_paths:
-                seen_addon_paths.add(addon.source_path)
-            else:
+            if addon.source_path in seen_addon_paths:
                 raise ConfigError(
                     "Addon paths should be unique. Found duplicate for "
                     f"{addon.source_path}."
                 )
+            # addons are built into a directory of the same name, so two addons with
+            # the same name would be built on top of each other.
+            if addon.name in seen_addon_names:
+                raise ConfigError(
+                    "Addon directory names should be unique. Found duplicate for "
+                    f"{addon.name}."
+                )
+            seen_addon_paths.add(addon.source_path)
+            seen_addon_names.add(addon.name)
 
         return package
 
-    def build(self, clean: bool) -> Sequence[AddonBuildResult]:
-        return [
-            addon.build(package_path=self.build_path, clean=clean)
-            for addon in self.addons
-        ]
+    def build(
+        self,
+        clean: bool,
+        jobs: int = 1,
+        copy_strategy: CopyStrategy = DEFAULT_COPY_STRATEGY,
+        is_cancelled: CancelCheck = _never_cancelled,
+        previous_results: Sequence[AddonBuildResult] = (),
+    ) -> Sequence[AddonBuildResult]:
+        """
+        Build each addon, up to `jobs` of them at a time. Results are in addon order.
+        Pass the previous_results of this run (in watch mode) so that warnings that
+        haven't changed since are not repeated.
+
+        If an addon fails to build, addons that haven't started building are skipped,
+        those already building are allowed to finish, and then the error of the first
+        failed addon (in addon order) is raised.
+
+        Output directories of addons that are no longer configured are removed first,
+        so that the package directory holds exactly what was built.
+        """
+        self.remove_unconfigured_addons()
+
+        # the same for every TOC file of the build
+        build_time = get_build_time()
+        previous_unreferenced = {
+            result.path.name: result.unreferenced for result in previous_results
+        }
+
+        def build_addon(addon: Addon) -> AddonBuildResult:
+            with timed("build-addon", addon=addon.name):
+                return addon.build(
+                    package_path=self.build_path,
+                    state_path=self.state_path,
+                    references_path=self.references_path,
+                    clean=clean,
+                    build_time=build_time,
+                    copy_strategy=copy_strategy,
+                    is_cancelled=is_cancelled,
+                    previous_unreferenced=previous_unreferenced.get(addon.name, ()),
+                )
+
+        if jobs == 1:
+            return [build_addon(addon) for addon in self.addons]
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            # each build runs in a copy of this context, so that it is timed
+            futures = [
+                executor.submit(copy_context().run, build_addon, addon)
+                for addon in self.addons
+            ]
+            wait(futures, return_when=FIRST_EXCEPTION)
+            for future in futures:
+                future.cancel()
+        # leaving the executor block waits for running builds to finish
+
+        for future in futures:
+            if not future.cancelled() and (exception := future.exception()):
+                raise exception
+
+        return [future.result() for future in futures]
+
+    def remove_unconfigured_addons(self) -> None:
+        """
+        Remove the output directories, manifests and reference caches of addons that
+        were built into this package but aren't in it anymore. Only directories with a
+        manifest are removed, because anything else wasn't built by wap.
+        """
+        if not self.state_path.is_dir():
+            return
+        addon_names = {addon.name for addon in self.addons}
+        for manifest_path in self.state_path.glob("*.json"):
+            addon_name = manifest_path.stem
+            if addon_name in addon_names:
+                continue
+            addon_path = self.build_path / addon_name
+            if addon_path.is_dir() and not addon_path.is_symlink():
+                delete_path(addon_path)
+            manifest_path.unlink()
+            (self.references_path / manifest_path.name).unlink(missing_ok=True)
+
+    def apply_changes(
+        self,
+        previous_results: Sequence[AddonBuildResult],
+        changed_paths_by_addon: Mapping[str, Collection[Path]],
+        copy_strategy: CopyStrategy = DEFAULT_COPY_STRATEGY,
+        is_cancelled: CancelCheck = _never_cancelled,
+    ) -> Sequence[AddonBuildResult]:
+        """
+        Apply changed source paths, keyed by the name of the addon they belong to (see
+        addon_path_index), to the previous build of each addon (see
+        Addon.apply_changes). Addons with changes that can't be applied file by file are
+        built again, and addons without changes are left alone. Returns the results of
+        the addons that changed, in addon order.
+        """
+        build_time = get_build_time()
+        results: list[AddonBuildResult] = []
+        for addon, previous in zip(self.addons, previous_results, strict=True):
+            if addon.name not in changed_paths_by_addon:
+                continue
+            try:
+                with timed("apply-changes", addon=addon.name):
+                    result = addon.apply_changes(
+                        previous=previous,
+                        changed_paths=changed_paths_by_addon[addon.name],
+                        state_path=self.state_path,
+                        build_time=build_time,
+                        copy_strategy=copy_strategy,
+                        is_cancelled=is_cancelled,
+                    )
+            except FullBuildRequired:
+                with timed("build-addon", addon=addon.name):
+                    result = addon.build(
+                        package_path=self.build_path,
+                        state_path=self.state_path,
+                        references_path=self.references_path,
+                        clean=False,
+                        build_time=build_time,
+                        copy_strategy=copy_strategy,
+                        is_cancelled=is_cancelled,
+                        previous_unreferenced=previous.unreferenced,
+                    )
+            if result is not None:
+                results.append(result)
+        return results
+
+    def addon_path_index(self) -> PathIndex[str]:
+        """
+        Returns an index of the paths that each addon is built from to the names of the
+        addons.
+        """
+        index: PathIndex[str] = PathIndex()
+        for addon in self.addons:
+            for watch_path in addon.watch_paths:
+                index.add(watch_path, addon.name)
+        return index
 
     @property
     def watch_paths(self) -> Sequence[Path]:
         return [watch_path for addon in self.addons for watch_path in addon.watch_paths]
 
 
+class PathIndex[T]:
+    """
+    Maps paths to values, and finds the values of all the paths that contain a given
+    path. It is a trie of path parts, so a lookup takes time in proportion to the depth
+    of the path, regardless of how many paths are indexed.
+    """
+
+    def __init__(self) -> None:
+        self._root: _PathIndexNode[T] = _PathIndexNode()
+
+    def add(self, path: Path, value: T) -> None:
+        node = self._root
+        for part in path.parts:
+            node = node.children.setdefault(part, _PathIndexNode())
+        node.values.append(value)
+
+    def lookup(self, path: Path) -> list[T]:
+        """
+        Returns the values of path and the paths that contain it, outermost first.
+        """
+        values: list[T] = []
+        node = self._root
+        for part in path.parts:
+            child = node.children.get(part)
+            if child is None:
+                break
+            node = child
+            values.extend(node.values)
+        return values
+
+    def group(self, paths: Iterable[Path]) -> dict[T, set[Path]]:
+        """
+        Returns the paths that each value's paths contain. Paths that are not contained
+        by any are left out.
+        """
+        groups: dict[T, set[Path]] = {}
+        for path in paths:
+            for value in self.lookup(path):
+                groups.setdefault(value, set()).add(path)
+        return groups
+
+
+class _PathIndexNode[T]:
+    __slots__ = ("children", "values")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _PathIndexNode[T]] = {}
+        self.values: list[T] = []
+
+
+class RebuildScheduler:
+    """
+    Collects batches of changed paths from a watcher on a background thread, so that
+    changes keep being noticed while a rebuild is running.
+
+    Iterating yields the changed paths to rebuild for, one rebuild at a time. Batches
+    are coalesced: once one arrives, more are collected until none have arrived for the
+    debounce window (in seconds). While a rebuild is running, is_stale returns True if
+    newer changes have arrived, so that the rebuild can be cancelled, and retry puts the
+    changes of a cancelled rebuild back to be rebuilt along with the newer ones.
+
+    Changes under ignored_paths, such as the output directory that the rebuild itself
+    writes to, are dropped, so that they neither cause a rebuild nor cancel one.
+    """
+
+    # how often to wake up while waiting for changes, so that Ctrl-C is handled
+    _POLL_INTERVAL: ClassVar[float] = 0.5
+
+    def __init__(
+        self,
+        changes: Iterable[Iterable[Path]],
+        debounce: float,
+        ignored_paths: Iterable[Path] = (),
+    ) -> None:
+        self._debounce = debounce
+        self._ignored_paths = tuple(ignored_paths)
+        self._queue: queue.SimpleQueue[set[Path] | Exception | None] = (
+            queue.SimpleQueue()
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._retry_paths: set[Path] = set()
+        threading.Thread(
+            target=self._watch, args=(changes,), name="wap-watch", daemon=True
+        ).start()
+
+    def _watch(self, changes: Iterable[Iterable[Path]]) -> None:
+        try:
+            for paths in changes:
+                batch = {
+                    path
+                    for path in paths
+                    if not any(
+                        path.is_relative_to(ignored_path)
+                        for ignored_path in self._ignored_paths
+                    )
+                }
+                if not batch:
+                    continue
+                with self._lock:
+                    self._pending += 1
+                    self._queue.put(batch)
+        # whatever the watcher raises is re-raised on the main thread, by _collect
+        except Exception as exception:  # noqa: BLE001
+            self._queue.put(exception)
+        else:
+            # no more changes
+            self._queue.put(None)
+
+    def __iter__(self) -> Iterator[set[Path]]:
+        finished = False
+        while not finished or self._retry_paths:
+            batch, self._retry_paths = self._retry_paths, set()
+            if not finished:
+                finished = self._collect(batch, wait=not batch)
+            if batch:
+                yield batch
+
+    def _collect(self, batch: set[Path], wait: bool) -> bool:
+        """
+        Add changes to batch until the debounce window passes without any. If wait,
+        first wait for at least one change. Returns True if the watcher has finished.
+        """
+        while True:
+            try:
+                item = self._queue.get(
+                    timeout=self._POLL_INTERVAL if wait else self._debounce
+                )
+            except queue.Empty:
+                if wait:
+                    continue
+                return False
+            if item is None:
+                return True
+            if isinstance(item, Exception):
+                raise item
+            with self._lock:
+                self._pending -= 1
+            batch |= item
+            wait = False
+
+    def is_stale(self) -> bool:
+        with self._lock:
+            return self._pending > 0
+
+    def retry(self, paths: Iterable[Path]) -> None:
+        self._retry_paths.update(paths)
+
+
+class BuildCancelled(Exception):
+    """
+    Raised when a build is cancelled before it is complete.
+    """
+
+
+class FullBuildRequired(Exception):
+    """
+    Raised when changes can't be applied to a previous build of an addon, and so it
+    must be built again instead.
+    """
+
+
+def _join_rel_path(prefix: str, sub_path: Path) -> str:
+    sub_path_str = sub_path.as_posix()
+    if sub_path_str == ".":
+        return prefix
+    if prefix == "":
+        return sub_path_str
+    return f"{prefix}/{sub_path_str}"
+
+
+DEFAULT_DEBOUNCE_MS = 100
+
 AutoChoiceName = Literal["auto"]
 AUTO_CHOICE: AutoChoiceName = get_args(AutoChoiceName)[0]
 
@@ -252,10 +1061,15 @@ def get_addon_link_targets(
     }
 
 
-def resolve_globs(root_path: Path, glob_patterns: Sequence[str]) -> list[Path]:
+def resolve_globs(
+    root_path: Path, glob_patterns: Sequence[str], include_resolver: IncludeResolver
+) -> list[Path]:
     paths: list[Path] = []
-    for pattern in glob_patterns:
-        matching_paths = list(root_path.glob(pattern))
+    for pattern, matching_paths in zip(
+        glob_patterns,
+        include_resolver.resolve_all(root_path, glob_patterns),
+        strict=True,
+    ):
         if len(matching_paths) == 0:
             warn(
                 f'Include pattern "{pattern}" should match some paths, but none were '
@@ -265,6 +1079,79 @@ def resolve_globs(root_path: Path, glob_patterns: Sequence[str]) -> list[Path]:
     return paths
 
 
+def get_copy_strategy(
+    config: Config, copy_strategy: CopyStrategy | None = None
+) -> CopyStrategy:
+    """
+    Returns copy_strategy if given (e.g. on the command line), or else the one in
+    config, or else the default.
+    """
+    return (
+        copy_strategy
+        or (config.build and config.build.copy_strategy)
+        or DEFAULT_COPY_STRATEGY
+    )
+
+
+def report_build(
+    package: Package,
+    results: Sequence[AddonBuildResult],
+    first_time: bool = True,
+    link: Callable[[Sequence[AddonBuildResult]], None] | None = None,
+) -> None:
+    """
+    Print the warnings and file counts of each addon in results, and that package was
+    built. If first_time, where things were built is printed too. link is called in
+    between with results, to link the addons and print that they were.
+    """
+    for result in results:
+        for warning in result.warnings:
+            warn(warning)
+
+        build_addon_msg = f"Built addon [addon]{result.path.name}[/addon]"
+        if first_time:
+            build_addon_msg += f" at [path]{result.path}[/path]"
+        build_addon_msg += (
+            f" ({result.copied} copied, {result.skipped} skipped, "
+            f"{result.removed} removed)"
+        )
+        print(build_addon_msg)
+
+    if link is not None:
+        link(results)
+
+    build_package_msg = f"Built package [package]{package.build_path.name}[/package]"
+    if first_time:
+        build_package_msg += f" at [path]{package.build_path}[/path]"
+    print(build_package_msg)
+
+
+def build_and_report(
+    package: Package,
+    config: Config,
+    clean: bool,
+    jobs: int = 1,
+    copy_strategy: CopyStrategy | None = None,
+    is_cancelled: CancelCheck = _never_cancelled,
+    previous_results: Sequence[AddonBuildResult] = (),
+    first_time: bool = True,
+    link: Callable[[Sequence[AddonBuildResult]], None] | None = None,
+) -> Sequence[AddonBuildResult]:
+    """
+    Build package (see Package.build) with copy_strategy (see get_copy_strategy) and
+    report what was built (see report_build). Returns the results of the addons.
+    """
+    results = package.build(
+        clean=clean,
+        jobs=jobs,
+        copy_strategy=get_copy_strategy(config, copy_strategy),
+        is_cancelled=is_cancelled,
+        previous_results=previous_results,
+    )
+    report_build(package, results, first_time=first_time, link=link)
+    return results
+
+
 @click.command()
 @config_path_option()
 @output_path_option()
@@ -296,6 +1183,28 @@ def resolve_globs(root_path: Path, glob_patterns: Sequence[str]) -> list[Path]:
         "can be made."
     ),
 )
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="The number of addons to build concurrently.",
+)
+@click.option(
+    "--copy-strategy",
+    type=click.Choice(COPY_STRATEGIES),
+    default=None,
+    help=(
+        """
+        How files are placed into the output directory: "copy" copies them, "hardlink"
+        hard links them to the source files, and "reflink" makes copy-on-write clones
+        of them. Falls back to copying where the filesystem does not support links.
+        Overrides the build.copyStrategy config setting.
+        """
+    ),
+    show_default=f"build.copyStrategy config setting or {DEFAULT_COPY_STRATEGY}",
+)
 @click.option(
     "-w",
     "--watch",
@@ -303,14 +1212,31 @@ def resolve_globs(root_path: Path, glob_patterns: Sequence[str]) -> list[Path]:
     is_flag=True,
     help=("Repackage when source files change"),
 )
+@click.option(
+    "--debounce",
+    "debounce_ms",
+    type=click.IntRange(min=0),
+    default=DEFAULT_DEBOUNCE_MS,
+    show_default=True,
+    help=(
+        """
+        In watch mode, how many milliseconds to wait for more changes before
+        rebuilding, so that many files changing at once cause just one rebuild.
+        """
+    ),
+)
 @wow_addons_dir_options()
+@timings_options()
 def build(
     config_path: Path,
     output_path: Path | None,
     clean: bool,
     flavors_to_link: Sequence[FlavorName | AutoChoiceName],
     link_force: bool,
+    jobs: int,
+    copy_strategy: CopyStrategy | None,
     enable_watch: bool,
+    debounce_ms: int,
     mainline_addons_path: Path,
     classic_addons_path: Path,
     vanilla_addons_path: Path,
@@ -326,18 +1252,23 @@ def build(
     # used to signal if this is the first time we're building, where we might print more
     # information that subsequent times (in watch mode).
     first_time = True
+    # kept across reloads (in watch mode), so that includes are only resolved again
+    # where something changed
+    include_resolver = IncludeResolver()
 
-    def build_once() -> Package:
+    def load() -> tuple[Config, Package]:
         config = Config.from_path(config_path)
-        package = Package.create(
-            config=config,
-            config_path=config_path,
-            output_path=output_path,  # type: ignore
-            # mypy bug https://github.com/python/mypy/issues/2608
-        )
-
-        built_addons = package.build(clean=clean)
+        with timed("create-package"):
+            package = Package.create(
+                config=config,
+                config_path=config_path,
+                output_path=output_path,  # type: ignore
+                # mypy bug https://github.com/python/mypy/issues/2608
+                include_resolver=include_resolver,
+            )
+        return config, package
 
+    def link_addons(config: Config, built_addons: Sequence[AddonBuildResult]) -> None:
         addon_link_dirs = get_addon_link_targets(
             flavors_to_link,
             config,
@@ -346,47 +1277,141 @@ def build(
             vanilla_addons_path=vanilla_addons_path,
         )
 
+        wanted_links: dict[Path, Path] = {}
+        link_flavors: dict[Path, FlavorName] = {}
         for addon in built_addons:
-            build_addon_msg = f"Built addon [addon]{addon.path.name}[/addon]"
-            if first_time:
-                build_addon_msg += f" at [path]{addon.path}[/path]"
-            print(build_addon_msg)
-
+            target_path = addon.path.resolve()
             for flavor_name, addon_dir in addon_link_dirs.items():
-                link_path = addon.link(wow_addons_path=addon_dir, force=link_force)
-                if first_time:
-                    print(
-                        f"Linked [path]{link_path}[/path] "
-                        f"([flavor]{flavor_name}[/flavor]) to "
-                        f"[addon]{addon.path.name}[/addon]"
-                    )
-
-        build_package_msg = (
-            f"Built package [package]{package.build_path.name}[/package]"
-        )
-        if first_time:
-            build_package_msg += f" at [path]{package.build_path}[/path]"
-        print(build_package_msg)
+                wanted_links[addon_dir / addon.path.name] = target_path
+                link_flavors[addon_dir] = flavor_name
 
-        return package
+        if wanted_links:
+            with timed("link"):
+                link_changes = sync_links(
+                    wanted_links,
+                    state_path=get_links_path(output_path),  # type: ignore
+                    force=link_force,
+                )
+            # only what changed, after the first time
+            reported_links = [
+                *link_changes.created,
+                *(link_changes.unchanged if first_time else []),
+            ]
+            for link_path in reported_links:
+                print(
+                    f"Linked [path]{link_path}[/path] "
+                    f"([flavor]{link_flavors[link_path.parent]}[/flavor]) to "
+                    f"[addon]{link_path.name}[/addon]"
+                )
+            for link_path in link_changes.removed:
+                print(f"Removed stale link [path]{link_path}[/path]")
 
-    package = build_once()
+    config, package = load()
+    results = build_and_report(
+        package,
+        config,
+        clean=clean,
+        jobs=jobs,
+        copy_strategy=copy_strategy,
+        first_time=first_time,
+        link=partial(link_addons, config),
+    )
     first_time = False
 
-    if enable_watch:
-        print("Running in watch mode. Press [key]Ctrl-C[/key] at any time to quit.")
-        project_file_paths = {*package.watch_paths, config_path}
-        for paths_changed in watch_paths(config_path.parent):
-            if any(
-                changed_path.is_relative_to(watch_path)
-                for watch_path in project_file_paths
-                for changed_path in paths_changed
+    if not enable_watch:
+        return
+
+    print("Running in watch mode. Press [key]Ctrl-C[/key] at any time to quit.")
+    # the project is kept in memory between builds, and only the changed files are
+    # applied to the output directories of the addons they belong to. an addon is built
+    # again if a change can't be applied file by file, and everything is loaded and
+    # built again only when the config changes.
+    addon_path_index = package.addon_path_index()
+    # set when the package must be built in full, even if a rebuild is cancelled
+    full_build_needed = False
+    stop_event = threading.Event()
+    scheduler = RebuildScheduler(
+        watch_paths(config_path.parent, stop_event=stop_event),
+        debounce=debounce_ms / 1000,
+        # the builds' own writes, and the state kept alongside them
+        ignored_paths=[output_path.resolve()],
+    )
+    try:
+        for paths_changed in scheduler:
+            changed_paths_by_addon = addon_path_index.group(paths_changed)
+            config_changed = config_path in paths_changed
+            # an addon's ignore rules are read when the package is loaded
+            ignore_file_changed = any(
+                path.name == IGNORE_FILE_NAME for path in paths_changed
+            )
+            # the include globs may match different paths now
+            includes_changed = include_resolver.invalidate(paths_changed)
+            if not (
+                changed_paths_by_addon
+                or config_changed
+                or includes_changed
+                or full_build_needed
             ):
-                print("Project file changed, rebuilding...\n")
-                package = build_once()
-                project_file_paths = {*package.watch_paths, config_path}
+                continue
+
+            print("Project file changed, rebuilding...\n")
+
+            try:
+                # reading an unchanged config returns the same object
+                if ignore_file_changed or (
+                    config_changed and Config.from_path(config_path) is not config
+                ):
+                    config, package = load()
+                    addon_path_index = package.addon_path_index()
+                    full_build_needed = True
+                elif includes_changed:
+                    reloaded_config, reloaded_package = load()
+                    if [addon.include_paths for addon in reloaded_package.addons] != [
+                        addon.include_paths for addon in package.addons
+                    ]:
+                        config, package = reloaded_config, reloaded_package
+                        addon_path_index = package.addon_path_index()
+                        full_build_needed = True
+
+                if full_build_needed:
+                    results = build_and_report(
+                        package,
+                        config,
+                        clean=False,
+                        jobs=jobs,
+                        copy_strategy=copy_strategy,
+                        is_cancelled=scheduler.is_stale,
+                        previous_results=results,
+                        first_time=first_time,
+                        link=partial(link_addons, config),
+                    )
+                    full_build_needed = False
+                    continue
+
+                changed_results = package.apply_changes(
+                    previous_results=results,
+                    changed_paths_by_addon=changed_paths_by_addon,
+                    copy_strategy=get_copy_strategy(config, copy_strategy),
+                    is_cancelled=scheduler.is_stale,
+                )
+                changed_results_by_path = {
+                    result.path: result for result in changed_results
+                }
+                results = [
+                    changed_results_by_path.get(result.path, result)
+                    for result in results
+                ]
+                # the other addons, and all of the links, are untouched
+                report_build(package, changed_results, first_time=first_time)
+            except BuildCancelled:
+                print("More changes were made, rebuilding again...\n")
+                scheduler.retry(paths_changed)
+    finally:
+        stop_event.set()
 
 
-def watch_paths(*paths: Path) -> Iterator[Iterable[Path]]:
-    for changes in watch(*paths):
+def watch_paths(
+    *paths: Path, stop_event: threading.Event | None = None
+) -> Iterator[Iterable[Path]]:
+    for changes in watch(*paths, stop_event=stop_event):
         yield {Path(path) for _, path in changes}
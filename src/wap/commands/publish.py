@@ -1,25 +1,64 @@
-import shutil
+from __future__ import annotations
+
+import asyncio
+import io
+from collections.abc import Callable, Collection, Mapping, Sequence
+from contextlib import ExitStack
 from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO
 
 import click
+from attrs import frozen
 
+from wap.archive import (
+    DEFAULT_COMPRESSION_LEVEL,
+    DEFAULT_STORED_SUFFIXES,
+    ArchiveEntry,
+    ArtifactCache,
+    archive_digest,
+    manifest_archive_entries,
+    scan_archive_entries,
+    to_zip_date_time,
+    write_zip,
+)
 from wap.commands.util import (
     DEFAULT_OUTPUT_PATH,
     config_path_option,
     output_path_option,
+    timings_options,
+)
+from wap.config import Config, CurseforgeConfig
+from wap.console import print, transfer_progress, warn
+from wap.core import (
+    get_build_path,
+    get_cache_path,
+    get_manifests_path,
+    get_source_date_epoch,
+    get_state_path,
 )
-from wap.config import Config
-from wap.console import print, warn
-from wap.core import get_build_path
 from wap.curseforge import RELEASE_TYPES, Changelog, CurseForgeAPI, GameVersionId
-from wap.exception import ConfigError, CurseForgeAPIError, PathMissingError
+from wap.exception import (
+    ConfigError,
+    CurseForgeAPIError,
+    PathMissingError,
+    PublishError,
+    WapError,
+)
+from wap.fileops import copy_file
+from wap.timing import timed
+from wap.wow import FlavorName
+
+if TYPE_CHECKING:
+    from rich.progress import Progress
 
 DEFAULT_RELEASE_TYPE = "alpha"
 WAP_CURSEFORGE_TOKEN_ENVVAR_NAME = "WAP_CURSEFORGE_TOKEN"
+DEFAULT_JOBS = 4
+DEFAULT_TIMEOUT = 15.0
 
 
 @click.command()
-@config_path_option()
+@config_path_option(multiple=True)
 @output_path_option()
 @click.option(
     "-r",
@@ -38,61 +77,447 @@ WAP_CURSEFORGE_TOKEN_ENVVAR_NAME = "WAP_CURSEFORGE_TOKEN"
         f"environment variable {WAP_CURSEFORGE_TOKEN_ENVVAR_NAME}."
     ),
 )
+@click.option(
+    "--compression-level",
+    type=click.IntRange(min=0, max=9),
+    default=DEFAULT_COMPRESSION_LEVEL,
+    show_default=True,
+    help="How much to compress files in the zip, from 0 (none) to 9 (most).",
+)
+@click.option(
+    "--store-suffix",
+    "stored_suffixes",
+    metavar="SUFFIX",
+    multiple=True,
+    default=sorted(DEFAULT_STORED_SUFFIXES),
+    show_default=True,
+    help=(
+        "A file suffix, such as .ogg, of files to store in the zip without "
+        "compression. Useful for formats that are already compressed. This option can "
+        "be provided multiple times, and replaces the defaults when it is."
+    ),
+)
+@click.option(
+    "--zip-file/--no-zip-file",
+    "write_zip_file",
+    default=True,
+    show_default=True,
+    help=(
+        "Write the zip to a file next to the package directory before uploading it. "
+        "Otherwise, the zip is built in memory and uploaded directly."
+    ),
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=DEFAULT_JOBS,
+    show_default=True,
+    help="The number of packages to upload concurrently.",
+)
+@click.option(
+    "--refresh-versions",
+    is_flag=True,
+    help=(
+        "Check for new CurseForge game version ids, even if the ones that were cached "
+        "recently include every version being published to."
+    ),
+)
+@click.option(
+    "--timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    default=DEFAULT_TIMEOUT,
+    show_default=True,
+    help=(
+        "Seconds to wait on CurseForge. Uploads are allowed another second for every "
+        "100 KiB of their zip."
+    ),
+)
+@click.option(
+    "--build",
+    "build_first",
+    is_flag=True,
+    help=(
+        "Build the packages before publishing them, as wap build would (without "
+        "linking). Their zips are made from what the build wrote, without looking "
+        "through the output directory again."
+    ),
+)
+@timings_options()
 def publish(
-    config_path: Path,
+    config_paths: tuple[Path, ...],
     output_path: Path | None,
     release_type: str | None,
     curseforge_token: str,
+    compression_level: int,
+    stored_suffixes: tuple[str, ...],
+    write_zip_file: bool,
+    jobs: int,
+    refresh_versions: bool,
+    timeout: float,
+    build_first: bool,
 ) -> None:
     """
     Upload packages to Curseforge.
     """
-    config = Config.from_path(config_path)
-    if output_path is None:
-        output_path = config_path.parent / DEFAULT_OUTPUT_PATH
+    # every config is checked before anything is built or uploaded
+    configs = {
+        config_path: Config.from_path(config_path)
+        for config_path in dict.fromkeys(
+            config_path.resolve() for config_path in config_paths
+        )
+    }
+    for config in configs.values():
+        get_curseforge_config(config)
+
+    projects: list[Project] = []
+    for config_path, config in configs.items():
+        project_output_path = output_path or config_path.parent / DEFAULT_OUTPUT_PATH
+        projects.append(
+            Project.from_config(
+                config=config,
+                config_path=config_path,
+                output_path=project_output_path,
+                archive_entries=(
+                    build_package(config, config_path, project_output_path)
+                    if build_first
+                    else None
+                ),
+            )
+        )
+
+    asyncio.run(
+        publish_all(
+            projects=projects,
+            release_type=release_type,
+            curseforge_token=curseforge_token,
+            compression_level=compression_level,
+            stored_suffixes=stored_suffixes,
+            write_zip_file=write_zip_file,
+            jobs=jobs,
+            refresh_versions=refresh_versions,
+            timeout=timeout,
+        )
+    )
+
+
+@frozen(kw_only=True)
+class Project:
+    """
+    The built package of a config, and what to upload it to CurseForge with.
+    """
+
+    config_path: Path
+    build_path: Path
+    output_path: Path
+    cf_config: CurseforgeConfig
+    wow_versions: Mapping[FlavorName, str]
+    changelog_path: Path | None = None
+    # what was just built into build_path, if it was, so that it needn't be scanned
+    archive_entries: Sequence[ArchiveEntry] | None = None
+
+    @property
+    def display_name(self) -> str:
+        return self.build_path.name  # Addon-1.2.3
+
+    @property
+    def zip_name(self) -> str:
+        return f"{self.build_path.name}.zip"  # Addon-1.2.3.zip
+
+    @classmethod
+    def from_config(
+        cls,
+        *,
+        config: Config,
+        config_path: Path,
+        output_path: Path,
+        archive_entries: Sequence[ArchiveEntry] | None = None,
+    ) -> Project:
+        build_path = get_build_path(output_path, config)
+        if not build_path.is_dir():
+            raise PathMissingError(
+                f'Build path {build_path} should be a directory. Have you run "wap '
+                'build" yet?'
+            )
+
+        cf_config = get_curseforge_config(config)
+        # checked now, so that a batch fails before any of it is uploaded. the file is
+        # read later, along with the zipping.
+        changelog_path = None
+        if cf_config.changelog_file is not None:
+            changelog_path = config_path.parent / cf_config.changelog_file
+            if not changelog_path.is_file():
+                raise PathMissingError(
+                    f"Changelog path {changelog_path} should exist. Please update the "
+                    "path and try again."
+                )
+
+        return cls(
+            config_path=config_path,
+            build_path=build_path,
+            output_path=output_path,
+            cf_config=cf_config,
+            wow_versions=config.wow_versions,
+            changelog_path=changelog_path,
+            archive_entries=archive_entries,
+        )
 
+    def read_changelog(self) -> Changelog:
+        cf_config = self.cf_config
+        if self.changelog_path is not None:
+            return Changelog.from_path(
+                path=self.changelog_path, type_=cf_config.changelog_type
+            )
+        if cf_config.changelog_text is not None:
+            return Changelog.from_text(
+                text=cf_config.changelog_text, type_=cf_config.changelog_type
+            )
+        warn("No changelog text or file provided, so using empty string")
+        return Changelog.from_text(text="")
+
+
+def get_curseforge_config(config: Config) -> CurseforgeConfig:
     if config.publish is None or config.publish.curseforge is None:
         raise ConfigError(
             'A "publish.curseforge" config section should be present to publish. '
             "Please add one and try again."
         )
+    return config.publish.curseforge
+
 
-    cf_config = config.publish.curseforge
+def build_package(
+    config: Config, config_path: Path, output_path: Path
+) -> Sequence[ArchiveEntry]:
+    """
+    Build the package of config into output_path, as the build command does (without
+    linking), and return the entries of an archive of what was built.
+    """
+    # imported here because building is only needed with --build
+    from wap.commands.build import Package, build_and_report
 
-    if cf_config.changelog_file is not None:
-        changelog_path = config_path.parent / cf_config.changelog_file
-        changelog = Changelog.from_path(
-            path=changelog_path, type_=cf_config.changelog_type
+    with timed("create-package"):
+        package = Package.create(
+            config=config, config_path=config_path, output_path=output_path
         )
-    elif cf_config.changelog_text is not None:
-        changelog = Changelog.from_text(
-            text=cf_config.changelog_text, type_=cf_config.changelog_type
+    results = build_and_report(package, config, clean=False)
+
+    return manifest_archive_entries(
+        package.build_path, {result.path.name: result.manifest for result in results}
+    )
+
+
+def open_zip(
+    *,
+    build_path: Path,
+    zip_path: Path | None,
+    artifact_cache: ArtifactCache,
+    compression_level: int,
+    stored_suffixes: Collection[str],
+    entries: Sequence[ArchiveEntry] | None = None,
+) -> BinaryIO:
+    """
+    Returns an open zip of build_path, ready to be read from the start. The zip is also
+    written to zip_path, unless it is None.
+
+    The zip has entries, if given. Otherwise, build_path is scanned for them.
+
+    If an identical zip is in artifact_cache, it is reused instead of zipping again.
+    Otherwise, newly written zip files are added to the cache.
+    """
+    if entries is None:
+        entries = scan_archive_entries(build_path, get_manifests_path(build_path))
+    date_time = to_zip_date_time(get_source_date_epoch())
+    digest = archive_digest(
+        entries=entries,
+        compression_level=compression_level,
+        stored_suffixes=stored_suffixes,
+        date_time=date_time,
+    )
+
+    cached_zip_path = artifact_cache.get(digest)
+    if cached_zip_path is not None:
+        print(f"Reusing unchanged zip of [path]{build_path}[/path]")
+        if zip_path is not None:
+            copy_file(cached_zip_path, zip_path, "hardlink")
+        return cached_zip_path.open("rb")
+
+    def write(file: BinaryIO) -> None:
+        write_zip(
+            entries=entries,
+            file=file,
+            compression_level=compression_level,
+            stored_suffixes=stored_suffixes,
+            date_time=date_time,
         )
-    else:
-        changelog = Changelog.from_text(text="")
-        warn("No changelog text or file provided, so using empty string")
 
-    build_path = get_build_path(output_path, config)
-    if not build_path.is_dir():
-        raise PathMissingError(
-            f'Build path {build_path} should be a directory. Have you run "wap build" '
-            "yet?"
+    if zip_path is None:
+        print(f"Zipping [path]{build_path}[/path]")
+        # kept in memory on purpose: a spooled temporary file would be rolled over to
+        # disk anyway, as soon as httpx asks for its file descriptor to get its size
+        zip_buffer = io.BytesIO()
+        write(zip_buffer)
+        zip_buffer.seek(0)
+        return zip_buffer
+
+    print(f"Zipping [path]{build_path}[/path] to [path]{zip_path}[/path]")
+    # unlink first, because the old zip may be a hard link to a cached one
+    zip_path.unlink(missing_ok=True)
+    with zip_path.open("wb") as zip_file:
+        write(zip_file)
+    artifact_cache.put(digest, zip_path)
+    return zip_path.open("rb")
+
+
+async def publish_all(
+    *,
+    projects: Sequence[Project],
+    release_type: str | None,
+    curseforge_token: str,
+    compression_level: int,
+    stored_suffixes: Collection[str],
+    write_zip_file: bool,
+    jobs: int,
+    refresh_versions: bool = False,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> None:
+    """
+    Publish each project, up to jobs at a time, over one pool of connections.
+
+    The version map is fetched once for all of them (or reused from the cache, unless
+    refresh_versions) while the changelog of each project is read and its package is
+    zipped on worker threads, so that an upload only waits on the slowest of those.
+
+    With one project, its error is raised. With more, each project's result is reported
+    and a PublishError is raised afterwards if any of them failed.
+    """
+    batch = len(projects) > 1
+    async with CurseForgeAPI.open(
+        api_token=curseforge_token,
+        max_connections=jobs,
+        cache_path=get_cache_path(),
+        timeout=timeout,
+    ) as cf_api:
+        version_map_task = asyncio.create_task(
+            get_version_map(
+                cf_api=cf_api,
+                required_versions={
+                    version
+                    for project in projects
+                    for version in project.wow_versions.values()
+                },
+                refresh=refresh_versions,
+            )
         )
+        semaphore = asyncio.Semaphore(jobs)
+
+        async def publish_project(project: Project, progress: Progress) -> None:
+            timing_label = project.display_name if batch else None
+
+            def zip_package() -> BinaryIO:
+                with timed("zip", timing_label):
+                    return open_zip(
+                        build_path=project.build_path,
+                        zip_path=(
+                            project.build_path.parent / project.zip_name
+                            if write_zip_file
+                            else None
+                        ),
+                        artifact_cache=ArtifactCache(
+                            path=get_state_path(project.output_path) / "artifacts"
+                        ),
+                        compression_level=compression_level,
+                        stored_suffixes=stored_suffixes,
+                        entries=project.archive_entries,
+                    )
+
+            async with semaphore:
+                changelog, zip_file = await asyncio.gather(
+                    asyncio.to_thread(project.read_changelog),
+                    asyncio.to_thread(zip_package),
+                    return_exceptions=True,
+                )
+                with ExitStack() as stack:
+                    if not isinstance(zip_file, BaseException):
+                        stack.enter_context(zip_file)
+                    if isinstance(changelog, BaseException):
+                        raise changelog
+                    if isinstance(zip_file, BaseException):
+                        raise zip_file
+
+                    await upload(
+                        cf_api=cf_api,
+                        version_map=await version_map_task,
+                        zip_file=zip_file,
+                        project=project,
+                        changelog=changelog,
+                        release_type=release_type,
+                        progress=progress,
+                        timing_label=timing_label,
+                    )
+
+        try:
+            with transfer_progress() as progress:
+                results = await asyncio.gather(
+                    *(publish_project(project, progress) for project in projects),
+                    return_exceptions=batch,
+                )
+        finally:
+            # it's not needed anymore if every project failed before needing it
+            version_map_task.cancel()
+            # which also retrieves its error, if it had one
+            await asyncio.gather(version_map_task, return_exceptions=True)
+
+    if not batch:
+        return
+
+    # without a version map, no project could be published
+    if not version_map_task.cancelled() and (
+        version_map_error := version_map_task.exception()
+    ):
+        raise version_map_error
 
-    print(f"Zipping [path]{build_path}[path]")
-    zip_path = Path(
-        shutil.make_archive(
-            base_name=str(build_path), format="zip", root_dir=build_path
+    failed_count = 0
+    for project, result in zip(projects, results, strict=True):
+        if result is None:
+            print(f"Published [package]{project.display_name}[/package]")
+            continue
+        if not isinstance(result, Exception):
+            raise result
+        failed_count += 1
+        message = result.message if isinstance(result, WapError) else str(result)
+        warn(f"Failed to publish {project.display_name}: {message}")
+
+    if failed_count:
+        raise PublishError(
+            f"{failed_count} of {len(projects)} packages could not be published."
         )
-    )
 
-    cf_api = CurseForgeAPI(api_token=curseforge_token)
 
+async def get_version_map(
+    *, cf_api: CurseForgeAPI, required_versions: Collection[str], refresh: bool
+) -> Mapping[str, GameVersionId]:
     print("Getting CurseForge WoW version ids...")
-    version_map = cf_api.get_version_map()
+    with timed("get-version-map"):
+        return await cf_api.get_version_map(
+            refresh=refresh, required_versions=required_versions
+        )
+
+
+async def upload(
+    *,
+    cf_api: CurseForgeAPI,
+    version_map: Mapping[str, GameVersionId],
+    zip_file: BinaryIO,
+    project: Project,
+    changelog: Changelog,
+    release_type: str | None,
+    progress: Progress | None = None,
+    timing_label: str | None = None,
+) -> None:
+    cf_config = project.cf_config
 
     version_ids: list[GameVersionId] = []
-    for flavor_name, version in config.wow_versions.items():
+    for flavor_name, version in project.wow_versions.items():
         try:
             version_ids.append(version_map[version])
         except KeyError as key_error:
@@ -111,18 +536,37 @@ def publish(
                 f"{DEFAULT_RELEASE_TYPE}"
             )
 
-    print("Uploading to CurseForge...")
-    with zip_path.open("rb") as zip_file:
-        file_id = cf_api.upload(
-            project_id=cf_config.project_id,
-            file=zip_file,
-            display_name=build_path.name,  # Addon-1.2.3
-            file_name=zip_path.name,  # Addon-1.2.3.zip
-            changelog=changelog,
-            game_version_ids=version_ids,
-            release_type=release_type,
+    print(f"Uploading [package]{project.display_name}[/package] to CurseForge...")
+    on_progress: Callable[[int, int], None] | None = None
+    if progress is not None:
+        task_id = progress.add_task(project.display_name, total=None)
+
+        def update_progress(sent: int, total: int) -> None:
+            progress.update(task_id, completed=sent, total=total)
+
+        on_progress = update_progress
+
+    try:
+        with timed("upload", timing_label):
+            file_id = await cf_api.upload(
+                project_id=cf_config.project_id,
+                file=zip_file,
+                display_name=project.display_name,
+                file_name=project.zip_name,
+                changelog=changelog,
+                game_version_ids=version_ids,
+                release_type=release_type,
+                on_progress=on_progress,
+            )
+    finally:
+        if progress is not None:
+            progress.remove_task(task_id)
+    if file_id is None:
+        print(
+            f"Uploaded [package]{project.display_name}[/package] (by an attempt whose "
+            "response was lost, so its file id is unknown)"
         )
-    if cf_config.slug is not None:
+    elif cf_config.slug is not None:
         url = cf_api.uploaded_file_url(file_id=file_id, slug=cf_config.slug)
         print(f"Upload available at [url]{url}[url]")
     else:
@@ -1,10 +1,11 @@
 from collections.abc import Callable
-from functools import update_wrapper
+from functools import update_wrapper, wraps
 from pathlib import Path
-from typing import Literal, ParamSpec, TypeVar
+from typing import Any, Literal, ParamSpec, TypeVar, cast
 
 import click
 
+from wap.timing import report_timings
 from wap.wow import FLAVORS, get_default_addons_path
 
 DEFAULT_OUTPUT_PATH = Path("dist")
@@ -50,15 +51,30 @@ class DiscoveredConfigPath(click.ParamType):
         )
 
 
-def config_path_option() -> Callable[[Callable[P, T]], Callable[P, T]]:
+def config_path_option(
+    multiple: bool = False,
+) -> Callable[[Callable[P, T]], Callable[P, T]]:
+    """
+    Adds the config path option. If multiple, it may be provided more than once, and
+    the command gets a tuple of paths (named config_paths).
+    """
+
     def wrapper(func: Callable[P, T]) -> Callable[P, T]:
         decorated = click.option(
             "-c",
             "--config-path",
+            "config_paths" if multiple else "config_path",
             type=DiscoveredConfigPath(),
-            default=False,
+            multiple=multiple,
+            # discovery happens when converting this default
+            default=[False] if multiple else False,
             show_default=f"{DEFAULT_CONFIG_PATH} in this or a parent directory",
-            help=("The path to the configuration file."),
+            help=(
+                "The path to the configuration file. This option can be provided "
+                "multiple times."
+                if multiple
+                else "The path to the configuration file."
+            ),
         )(func)
 
         return update_wrapper(decorated, func)
@@ -115,3 +131,38 @@ def wow_addons_dir_options() -> Callable[[Callable[P, T]], Callable[P, T]]:
         return update_wrapper(decorated, func)
 
     return wrapper
+
+
+def timings_options() -> Callable[[Callable[P, T]], Callable[P, T]]:
+    """
+    Adds options to time the command, which are handled here rather than passed on to
+    it.
+    """
+
+    def wrapper(func: Callable[P, T]) -> Callable[P, T]:
+        @wraps(func)
+        def timed_func(
+            *args: Any, timings: bool, trace_path: Path | None, **kwargs: Any
+        ) -> T:
+            with report_timings(timings=timings, trace_path=trace_path):
+                return func(*args, **kwargs)
+
+        decorated = click.option(
+            "--timings",
+            is_flag=True,
+            help="After running, print how long each phase took, for each addon.",
+        )(timed_func)
+        decorated = click.option(
+            "--profile",
+            "trace_path",
+            type=click.Path(dir_okay=False, path_type=Path),
+            default=None,
+            help=(
+                "Write the timings to this path as a Chrome trace event file, which "
+                "can be viewed at https://ui.perfetto.dev."
+            ),
+        )(decorated)
+
+        return cast(Callable[P, T], decorated)
+
+    return wrapper
@@ -1,18 +1,25 @@
 from __future__ import annotations
 
+import functools
+import hashlib
 import importlib.resources
 import json
 from collections.abc import Mapping, Sequence
 from pathlib import Path
-from typing import Any, Callable
+from typing import TYPE_CHECKING, Any, Callable, Literal, get_args
 
 import jsonschema
 from attrs import field, frozen
 
 import wap
-from wap.curseforge import ChangelogType, ReleaseType
+from wap.fileops import CopyStrategy
+from wap.timing import timed
 from wap.wow import FlavorName
 
+if TYPE_CHECKING:
+    # only needed for annotations, and importing it at runtime would import httpx
+    from wap.curseforge import ChangelogType, ReleaseType
+
 from .exception import ConfigSchemaError, EncodingError
 
 SCHEMA_URL = (
@@ -26,6 +33,36 @@ def get_schema() -> Any:
     return json.loads(data)
 
 
+@functools.cache
+def get_validator() -> jsonschema.protocols.Validator:
+    """
+    Returns a validator for the schema. It is created (and the schema itself checked)
+    only once, instead of for every validation.
+    """
+    schema = get_schema()
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
+
+def _validate(obj: Any) -> None:
+    # picks the same error that jsonschema.validate would
+    validation_error = jsonschema.exceptions.best_match(
+        get_validator().iter_errors(obj)
+    )
+    if validation_error is not None:
+        raise ConfigSchemaError(
+            f"Invalid configuation: {validation_error.message} at path "
+            f"{validation_error.json_path}. Please correct your configuration and "
+            "try again."
+        ) from validation_error
+
+
+# config path to the digest of its contents and the config parsed from them, as of the
+# last time it was successfully read
+_last_read_configs: dict[Path, tuple[bytes, Config]] = {}
+
+
 @frozen(kw_only=True)
 class Config:
     name: str
@@ -33,19 +70,19 @@ class Config:
     author: str | None = field(default=None)
     description: str | None = field(default=None)
     wow_versions: Mapping[FlavorName, str]
+    build: BuildConfig | None = field(default=None)
     publish: PublishConfig | None = field(default=None)
     package: Sequence[AddonConfig]
 
     @classmethod
     def from_python_object(cls, obj: Mapping[str, Any]) -> Config:
-        try:
-            jsonschema.validate(obj, get_schema())
-        except jsonschema.ValidationError as validation_error:
-            raise ConfigSchemaError(
-                f"Invalid configuation: {validation_error.message} at path "
-                f"{validation_error.json_path}. Please correct your configuration and "
-                "try again."
-            ) from validation_error
+        _validate(obj)
+
+        build_obj = obj.get("build", None)
+        if build_obj is not None:
+            build = BuildConfig.from_python_object(build_obj)
+        else:
+            build = None
 
         publish_obj = obj.get("publish", None)
         if publish_obj is not None:
@@ -58,22 +95,43 @@ class Config:
             version=obj["version"],
             author=obj.get("author", None),
             wow_versions=obj["wowVersions"],
+            build=build,
             publish=publish,
             package=[AddonConfig.from_python_object(obj) for obj in obj["package"]],
         )
 
     @classmethod
-    def from_path(cls, path: Path) -> Config:
-        try:
-            return cls.from_python_object(json.loads(path.read_text(encoding="utf-8")))
-        except UnicodeDecodeError as unicode_decode_error:
-            raise EncodingError(
-                f'Config file "{path}" should be utf-8: {unicode_decode_error}'
-            ) from unicode_decode_error
-        except json.JSONDecodeError as json_decode_error:
-            raise EncodingError(
-                f'Config file "{path}" should be well-formed JSON: {json_decode_error}.'
-            ) from json_decode_error
+    def from_path(cls, path: Path, use_cache: bool = True) -> Config:
+        """
+        Read a config from path.
+
+        If use_cache is True and the file has the same contents as the last time it was
+        successfully read, the config from then is returned without parsing or
+        validating it again. This makes repeated reads cheap, such as in watch mode.
+        """
+        with timed("load-config"):
+            data = path.read_bytes()
+            digest = hashlib.sha256(data).digest()
+
+            if use_cache and path in _last_read_configs:
+                last_digest, last_config = _last_read_configs[path]
+                if last_digest == digest:
+                    return last_config
+
+            try:
+                config = cls.from_python_object(json.loads(data.decode("utf-8")))
+            except UnicodeDecodeError as unicode_decode_error:
+                raise EncodingError(
+                    f'Config file "{path}" should be utf-8: {unicode_decode_error}'
+                ) from unicode_decode_error
+            except json.JSONDecodeError as json_decode_error:
+                raise EncodingError(
+                    f'Config file "{path}" should be well-formed JSON: '
+                    f"{json_decode_error}."
+                ) from json_decode_error
+
+            _last_read_configs[path] = (digest, config)
+            return config
 
     def to_python_object(self, with_schema: bool = True) -> Any:
         # i like a certain key order
@@ -87,19 +145,14 @@ class Config:
         if self.description is not None:
             obj["description"] = self.description
         obj["wowVersions"] = self.wow_versions
+        if self.build is not None:
+            obj["build"] = self.build.to_python_object()
         if self.publish is not None:
             obj["publish"] = self.publish.to_python_object()
         obj["package"] = [addon.to_python_object() for addon in self.package]
         obj["name"] = self.name
 
-        try:
-            jsonschema.validate(obj, get_schema())
-        except jsonschema.ValidationError as validation_error:
-            raise ConfigSchemaError(
-                f"Invalid configuation: {validation_error.message} at path "
-                f"{validation_error.json_path}  Please correct your configuration and "
-                "try again."
-            ) from validation_error
+        _validate(obj)
 
         return obj
 
@@ -115,6 +168,21 @@ class Config:
         path.write_text(self.to_json(with_schema=with_schema, indent=indent))
 
 
+@frozen(kw_only=True)
+class BuildConfig:
+    copy_strategy: CopyStrategy | None = field(default=None)
+
+    @classmethod
+    def from_python_object(cls, obj: Mapping[str, Any]) -> BuildConfig:
+        return cls(copy_strategy=obj.get("copyStrategy", None))
+
+    def to_python_object(self) -> dict[str, Any]:
+        obj: dict[str, Any] = {}
+        if self.copy_strategy:
+            obj["copyStrategy"] = self.copy_strategy
+        return obj
+
+
 @frozen(kw_only=True)
 class PublishConfig:
     curseforge: CurseforgeConfig | None = field(default=None)
@@ -176,6 +244,7 @@ class AddonConfig:
     path: str
     toc: TocConfig | None = field(default=None)
     include: Sequence[str] | None = field(default=None)
+    exclude: Sequence[str] | None = field(default=None)
 
     @classmethod
     def from_python_object(cls, obj: Mapping[str, Any]) -> AddonConfig:
@@ -189,6 +258,7 @@ class AddonConfig:
             path=obj["path"],
             toc=toc,
             include=obj.get("include", None),
+            exclude=obj.get("exclude", None),
         )
 
     def to_python_object(self) -> dict[str, Any]:
@@ -198,19 +268,30 @@ class AddonConfig:
             obj["toc"] = self.toc.to_python_object()
         if self.include:
             obj["include"] = self.include
+        if self.exclude:
+            obj["exclude"] = self.exclude
         return obj
 
 
+TocMode = Literal["perFlavor", "multiInterface"]
+TOC_MODES: tuple[TocMode, ...] = get_args(TocMode)
+DEFAULT_TOC_MODE: TocMode = "perFlavor"
+
+
 @frozen(kw_only=True)
 class TocConfig:
     tags: Mapping[str, bool | str | Sequence[str]]
     files: Sequence[str]
+    mode: TocMode = field(default=DEFAULT_TOC_MODE)
+    auto_files: bool = field(default=False)
 
     @classmethod
     def from_python_object(cls, obj: Mapping[str, Any]) -> TocConfig:
         return cls(
             tags=obj.get("tags", {}),
             files=obj.get("files", []),
+            mode=obj.get("mode", DEFAULT_TOC_MODE),
+            auto_files=obj.get("autoFiles", False),
         )
 
     @property
@@ -244,4 +325,8 @@ class TocConfig:
         obj: dict[str, Any] = {}
         obj["tags"] = self.tags
         obj["files"] = self.files
+        if self.mode != DEFAULT_TOC_MODE:
+            obj["mode"] = self.mode
+        if self.auto_files:
+            obj["autoFiles"] = self.auto_files
         return obj
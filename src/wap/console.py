@@ -1,9 +1,12 @@
-from typing import Any, overload
+from typing import TYPE_CHECKING, Any, overload
 
 from rich.console import Console
 from rich.prompt import Confirm, Prompt
 from rich.theme import Theme
 
+if TYPE_CHECKING:
+    from rich.progress import Progress
+
 _THEME = Theme(
     {
         # custom rgb hex colors most likely from D3 category 10
@@ -104,6 +107,32 @@ def print_json(json_text: str) -> None:
     _STDERR_CONSOLE.print_json(json_text)
 
 
+def transfer_progress() -> "Progress":
+    """
+    Returns a display of the progress of transfers on stderr, which is cleared when it
+    stops. Text printed while it is displayed is printed above it.
+    """
+    # imported here because it's only needed when transferring
+    from rich.progress import (
+        BarColumn,
+        DownloadColumn,
+        Progress,
+        TextColumn,
+        TimeRemainingColumn,
+        TransferSpeedColumn,
+    )
+
+    return Progress(
+        TextColumn("{task.description}"),
+        BarColumn(),
+        DownloadColumn(),
+        TransferSpeedColumn(),
+        TimeRemainingColumn(),
+        console=_STDERR_CONSOLE,
+        transient=True,
+    )
+
+
 if __name__ == "__main__":
     from pathlib import PureWindowsPath
 
@@ -1,7 +1,92 @@
+import os
+import sys
 from pathlib import Path
 
+import arrow
+
 from wap.config import Config
+from wap.exception import EnvVarError
+
+STATE_DIR_NAME = ".wap"
+SOURCE_DATE_EPOCH_ENVVAR_NAME = "SOURCE_DATE_EPOCH"
+CACHE_DIR_ENVVAR_NAME = "WAP_CACHE_DIR"
 
 
 def get_build_path(output_path: Path, config: Config) -> Path:
     return output_path / f"{config.name}-{config.version}"
+
+
+def get_state_path(output_path: Path) -> Path:
+    """
+    Returns the directory where wap keeps bookkeeping about previous builds, such as
+    manifests. It lives in the output directory, but outside of any package.
+    """
+    return output_path / STATE_DIR_NAME
+
+
+def get_links_path(output_path: Path) -> Path:
+    """
+    Returns the file recording the links made to the addons built into output_path.
+    """
+    return get_state_path(output_path) / "links.json"
+
+
+def get_manifests_path(build_path: Path) -> Path:
+    """
+    Returns the directory holding the manifests of the addons built into build_path.
+    """
+    return get_state_path(build_path.parent) / "manifests" / build_path.name
+
+
+def get_references_path(build_path: Path) -> Path:
+    """
+    Returns the directory holding the XML reference caches of the addons built into
+    build_path.
+    """
+    return get_state_path(build_path.parent) / "references" / build_path.name
+
+
+def get_cache_path() -> Path:
+    """
+    Returns the directory where wap caches things that aren't specific to a project,
+    such as responses of the CurseForge API. This is the WAP_CACHE_DIR environment
+    variable if set, or otherwise the user cache directory of the platform.
+    """
+    if value := os.environ.get(CACHE_DIR_ENVVAR_NAME):
+        return Path(value)
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+        return Path(base) / "wap" / "Cache"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / "wap"
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "wap"
+
+
+def get_source_date_epoch() -> arrow.Arrow | None:
+    """
+    Returns the time in the SOURCE_DATE_EPOCH environment variable, if set. See
+    https://reproducible-builds.org/specs/source-date-epoch/.
+    """
+    value = os.environ.get(SOURCE_DATE_EPOCH_ENVVAR_NAME)
+    if not value:
+        return None
+    error = EnvVarError(
+        f"{SOURCE_DATE_EPOCH_ENVVAR_NAME} should be a non-negative integer number "
+        f"of seconds since the Unix epoch, but was {value!r}."
+    )
+    try:
+        seconds = int(value)
+    except ValueError as value_error:
+        raise error from value_error
+    if seconds < 0:
+        raise error
+    return arrow.get(seconds)
+
+
+def get_build_time() -> arrow.Arrow:
+    """
+    Returns the time to stamp onto built files: SOURCE_DATE_EPOCH if set (so that builds
+    are reproducible), otherwise now.
+    """
+    return get_source_date_epoch() or arrow.utcnow()
@@ -1,15 +1,30 @@
 from __future__ import annotations
 
+import asyncio
+import email.utils
+import hashlib
+import importlib.util
 import json
-from collections.abc import Mapping, Sequence
+import os
+import random
+import time
+from collections.abc import AsyncIterator, Callable, Collection, Mapping, Sequence
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import BinaryIO, ClassVar, Literal, NewType, get_args
+from typing import Any, BinaryIO, ClassVar, Literal, NewType, get_args
 
+import arrow
 import httpx
-from attrs import frozen
+from attrs import evolve, field, frozen
 
 from wap.console import warn
-from wap.exception import CurseForgeAPIError, EncodingError, PathMissingError
+from wap.exception import (
+    CurseForgeAPIError,
+    CurseForgeUnavailableError,
+    EncodingError,
+    PathMissingError,
+)
+from wap.state import read_state_file, write_state_file
 
 GameVersionId = NewType("GameVersionId", int)
 ChangelogType = Literal["text", "html", "markdown"]
@@ -17,21 +32,185 @@ CHANGELOG_TYPES: tuple[ChangelogType, ...] = get_args(ChangelogType)
 ReleaseType = Literal["alpha", "beta", "release"]
 RELEASE_TYPES: tuple[ReleaseType, ...] = get_args(ReleaseType)
 
+# HTTP/2 needs the optional h2 package (which the httpx[http2] extra installs)
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
 
 def _raise_for_status(response: httpx.Response, activity_text: str) -> None:
     if response.status_code != httpx.codes.OK:
-        raise CurseForgeAPIError(
+        error_class = (
+            CurseForgeUnavailableError
+            if httpx.codes.is_server_error(response.status_code)
+            else CurseForgeAPIError
+        )
+        raise error_class(
             f"HTTP Error from {response.url} during {activity_text}: "
             f"'{response.status_code} {response.reason_phrase}'. Response body: "
             f"{response.text}."
         )
 
 
+# errors after which a request can't have been processed, so it is safe to send again
+_UNSENT_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.PoolTimeout,
+    httpx.WriteError,
+    httpx.WriteTimeout,
+)
+# statuses of requests that were turned away without being processed
+_RETRYABLE_STATUSES = frozenset(
+    {
+        httpx.codes.TOO_MANY_REQUESTS,
+        httpx.codes.BAD_GATEWAY,
+        httpx.codes.SERVICE_UNAVAILABLE,
+    }
+)
+
+
+def _is_duplicate_rejection(response: httpx.Response) -> bool:
+    # CurseForge rejects a file that it already has
+    return httpx.codes.is_client_error(response.status_code) and (
+        "duplicate" in response.text.lower()
+    )
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    """
+    Returns the seconds to wait that the Retry-After header of response asks for, if it
+    has one that can be understood.
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def _progress_callback(
+    on_progress: Callable[[int, int], None], total: int
+) -> Callable[[int], None]:
+    """
+    Returns a function to call with the size of each chunk sent of a request of total
+    bytes, which calls on_progress with the bytes sent so far and total.
+    """
+    sent = 0
+    on_progress(sent, total)
+
+    def on_sent(size: int) -> None:
+        nonlocal sent
+        sent += size
+        on_progress(sent, total)
+
+    return on_sent
+
+
+class _ProgressStream(httpx.AsyncByteStream):
+    """
+    A request body that calls on_sent with the size of each chunk after it is sent.
+    """
+
+    def __init__(
+        self, stream: httpx.AsyncByteStream, on_sent: Callable[[int], None]
+    ) -> None:
+        self._stream = stream
+        self._on_sent = on_sent
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+            self._on_sent(len(chunk))
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+
+
+@frozen(kw_only=True)
+class VersionMap:
+    """
+    The id of each game version name, as fetched from the CurseForge API at fetched_at
+    (in seconds since the epoch), with the validators of that response.
+    """
+
+    ids: Mapping[str, GameVersionId]
+    fetched_at: float
+    etag: str | None = None
+    last_modified: str | None = None
+
+    VERSION: ClassVar[int] = 1
+
+    @classmethod
+    def from_path(cls, path: Path) -> VersionMap | None:
+        """
+        Read a version map from path, if there is a readable one.
+        """
+        return read_state_file(path, cls.VERSION, cls.from_python_object)
+
+    @classmethod
+    def from_python_object(cls, obj: Mapping[str, Any]) -> VersionMap:
+        ids = obj["ids"]
+        if not isinstance(ids, dict):
+            raise TypeError("ids should map version names to ids")
+        return cls(
+            ids=ids,
+            fetched_at=float(obj["fetchedAt"]),
+            etag=obj.get("etag"),
+            last_modified=obj.get("lastModified"),
+        )
+
+    def to_python_object(self) -> dict[str, Any]:
+        obj: dict[str, Any] = {
+            "fetchedAt": self.fetched_at,
+            "ids": dict(self.ids),
+        }
+        if self.etag is not None:
+            obj["etag"] = self.etag
+        if self.last_modified is not None:
+            obj["lastModified"] = self.last_modified
+        return obj
+
+    def write_to_path(self, path: Path) -> None:
+        write_state_file(path, self.VERSION, self.to_python_object())
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
 @frozen(kw_only=True)
 class CurseForgeAPI:
+    """
+    A client of the CurseForge upload API. Requests share the connection pool of client,
+    so use one of these (see `open`) for all of the requests of a run.
+    """
+
     api_token: str
+    client: httpx.AsyncClient = field(repr=False)
+    # where responses are cached, or None to not cache them
+    cache_path: Path | None = None
+    # seconds to wait on the API, which uploads add to (see upload_timeout)
+    timeout: float = 15.0
 
-    _CLIENT: ClassVar[httpx.Client] = httpx.Client(timeout=15.0)
+    # uploads are allowed another second for this many bytes of their file
+    UPLOAD_TIMEOUT_BYTES_PER_SECOND: ClassVar[int] = 100 * 1024
+    UPLOAD_ATTEMPTS: ClassVar[int] = 5
+    # the delay before retrying an upload, which doubles with each attempt (up to
+    # RETRY_DELAY_MAX) and is then randomly shortened by up to half
+    RETRY_DELAY: ClassVar[float] = 1.0
+    RETRY_DELAY_MAX: ClassVar[float] = 30.0
+    # a Retry-After header may ask for a longer delay, up to this
+    RETRY_AFTER_MAX: ClassVar[float] = 120.0
+    # game versions only change with patches, so a fetched map is reused for this long
+    VERSION_MAP_TTL: ClassVar[float] = 24 * 60 * 60
+    # when a cached map could be used instead, don't wait on the API as long
+    VERSION_MAP_REVALIDATE_TIMEOUT: ClassVar[float] = 5.0
     TOKEN_HEADER_NAME: ClassVar[str] = "X-Api-Token"
     UPLOADED_FILE_URL_TEMPLATE: ClassVar[str] = (
         "https://www.curseforge.com/wow/addons/{slug}/files/{file_id}"
@@ -42,7 +221,53 @@ class CurseForgeAPI:
         "https://wow.curseforge.com/api/projects/{project_id}/upload-file"
     )
 
-    def upload(
+    @classmethod
+    @asynccontextmanager
+    async def open(
+        cls,
+        *,
+        api_token: str,
+        max_connections: int = 1,
+        cache_path: Path | None = None,
+        timeout: float = 15.0,
+    ) -> AsyncIterator[CurseForgeAPI]:
+        """
+        Returns an API with a new client that keeps up to max_connections connections
+        open, using HTTP/2 if it is available. The client is closed on exit.
+        """
+        async with httpx.AsyncClient(
+            timeout=timeout,
+            http2=_HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        ) as client:
+            yield cls(
+                api_token=api_token,
+                client=client,
+                cache_path=cache_path,
+                timeout=timeout,
+            )
+
+    def upload_timeout(self, size: int) -> httpx.Timeout:
+        """
+        Returns the timeout for uploading a file of size bytes. Sending it and waiting
+        for the response (while CurseForge processes it) take longer for larger files.
+        """
+        scaled = self.timeout + size / self.UPLOAD_TIMEOUT_BYTES_PER_SECOND
+        return httpx.Timeout(self.timeout, read=scaled, write=scaled)
+
+    def _retry_delay(self, attempt: int, response: httpx.Response | None) -> float:
+        """
+        Returns the seconds to wait after the attempt'th (from 1) failed attempt.
+        """
+        if response is not None and (retry_after := _retry_after(response)) is not None:
+            return min(retry_after, self.RETRY_AFTER_MAX)
+        delay = min(self.RETRY_DELAY * 2 ** (attempt - 1), self.RETRY_DELAY_MAX)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def upload(
         self,
         *,
         project_id: str,
@@ -52,12 +277,21 @@ class CurseForgeAPI:
         changelog: Changelog,
         game_version_ids: Sequence[GameVersionId],
         release_type: str,
-    ) -> int:
+        on_progress: Callable[[int, int], None] | None = None,
+    ) -> int | None:
         """
         Uploads an addon file to Curseforge's WoW addon index and returns its file id.
 
         `display_name` is the name given to the upload and `file_name` is the name of
         file you download.
+
+        The file is streamed from its start in chunks, and on_progress is called with
+        the bytes of the request sent so far and its total size. Failures after which
+        CurseForge can't have processed the upload (connection errors, errors while
+        sending, rate limiting and unavailability) are retried from the start of the
+        file, up to UPLOAD_ATTEMPTS times in all. Other failures are not, because the
+        upload may have gone through. If a retry is rejected as a duplicate, an earlier
+        attempt did go through, and None is returned since its file id is unknown.
         """
         # CF wants a multipart/form-data request with two keys-value pairs:
         # - "metadata": to be equal to the JSON-encoded metadata object they. IMO, this
@@ -70,40 +304,156 @@ class CurseForgeAPI:
         # metadata all day long -- CF just uses file ids to differentiate and presumably
         # will prefer most-recently-uploaded file. (can't upload dupe zips though, they
         # check for that.)
-        response = self._CLIENT.post(
-            url=self.UPLOAD_ENDPOINT_URL_TEMPLATE.format(project_id=project_id),
-            headers={self.TOKEN_HEADER_NAME: self.api_token},
-            data={
-                "metadata": json.dumps(
-                    {
-                        "changelog": changelog.text,
-                        "changelogType": changelog.type_,
-                        "displayName": display_name,
-                        "gameVersions": game_version_ids,
-                        "releaseType": release_type,
-                    }
-                )
-            },
-            files={"file": (file_name, file, "application/zip")},
+        metadata = json.dumps(
+            {
+                "changelog": changelog.text,
+                "changelogType": changelog.type_,
+                "displayName": display_name,
+                "gameVersions": game_version_ids,
+                "releaseType": release_type,
+            }
         )
+        timeout = self.upload_timeout(file.seek(0, os.SEEK_END))
+
+        attempt = 1
+        while True:
+            # the multipart body reads the file from its start each time it is built
+            request = self.client.build_request(
+                "POST",
+                url=self.UPLOAD_ENDPOINT_URL_TEMPLATE.format(project_id=project_id),
+                headers={self.TOKEN_HEADER_NAME: self.api_token},
+                data={"metadata": metadata},
+                files={"file": (file_name, file, "application/zip")},
+                timeout=timeout,
+            )
+            if on_progress is not None:
+                request.stream = _ProgressStream(
+                    request.stream,  # type: ignore[arg-type]
+                    _progress_callback(
+                        on_progress, int(request.headers["Content-Length"])
+                    ),
+                )
+
+            response: httpx.Response | None = None
+            try:
+                response = await self.client.send(request)
+            except _UNSENT_ERRORS as transport_error:
+                if attempt == self.UPLOAD_ATTEMPTS:
+                    raise CurseForgeUnavailableError(
+                        f"Could not reach {request.url} during upload: "
+                        f"{transport_error!r}."
+                    ) from transport_error
+                reason = repr(transport_error)
+            except httpx.TransportError as transport_error:
+                raise CurseForgeUnavailableError(
+                    f"Lost the connection to {request.url} during upload, after the "
+                    f"file was sent: {transport_error!r}. It may have been uploaded, "
+                    "so check the project's files before publishing again."
+                ) from transport_error
+            else:
+                if attempt > 1 and _is_duplicate_rejection(response):
+                    return None
+                if (
+                    response.status_code not in _RETRYABLE_STATUSES
+                    or attempt == self.UPLOAD_ATTEMPTS
+                ):
+                    break
+                reason = f"{response.status_code} {response.reason_phrase}"
+
+            delay = self._retry_delay(attempt, response)
+            warn(
+                f"Upload of {file_name} failed ({reason}), so retrying in {delay:.1f} "
+                f"seconds (attempt {attempt + 1} of {self.UPLOAD_ATTEMPTS})"
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
 
         _raise_for_status(response, "upload")
 
         return response.json()["id"]  # type: ignore
 
-    def get_version_map(self) -> Mapping[str, GameVersionId]:
-        response = self._CLIENT.get(
-            self.VERSION_ENDPOINT_URL, headers={self.TOKEN_HEADER_NAME: self.api_token}
-        )
+    @property
+    def version_map_cache_path(self) -> Path | None:
+        if self.cache_path is None:
+            return None
+        endpoint_hash = hashlib.sha256(self.VERSION_ENDPOINT_URL.encode()).hexdigest()
+        return self.cache_path / "curseforge" / f"versions-{endpoint_hash[:16]}.json"
+
+    async def get_version_map(
+        self, *, refresh: bool = False, required_versions: Collection[str] = ()
+    ) -> Mapping[str, GameVersionId]:
+        """
+        Returns the id of each game version name.
+
+        If there is a cache path, a map cached less than VERSION_MAP_TTL ago is returned
+        without asking the API, unless refresh or it lacks one of required_versions
+        (which may be newer than it). Otherwise, the API is asked if the cached map
+        has changed, and if the API can't be reached or has a server error, the cached
+        map is used anyway.
+        """
+        cache_path = self.version_map_cache_path
+        cached = VersionMap.from_path(cache_path) if cache_path is not None else None
+        if (
+            cached is not None
+            and not refresh
+            and cached.age < self.VERSION_MAP_TTL
+            and set(required_versions) <= cached.ids.keys()
+        ):
+            return cached.ids
+
+        try:
+            version_map = await self._fetch_version_map(cached)
+        except CurseForgeUnavailableError as error:
+            if cached is None:
+                raise
+            fetched_at = arrow.get(cached.fetched_at).humanize()
+            warn(f"{error.message} Using game versions fetched {fetched_at} instead.")
+            return cached.ids
+
+        if cache_path is not None and version_map != cached:
+            version_map.write_to_path(cache_path)
+        return version_map.ids
+
+    async def _fetch_version_map(self, cached: VersionMap | None) -> VersionMap:
+        headers = {self.TOKEN_HEADER_NAME: self.api_token}
+        if cached is not None:
+            if cached.etag is not None:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified is not None:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        try:
+            response = await self.client.get(
+                self.VERSION_ENDPOINT_URL,
+                headers=headers,
+                timeout=(
+                    self.VERSION_MAP_REVALIDATE_TIMEOUT
+                    if cached is not None
+                    else httpx.USE_CLIENT_DEFAULT
+                ),
+            )
+        except httpx.TransportError as transport_error:
+            raise CurseForgeUnavailableError(
+                f"Could not reach {self.VERSION_ENDPOINT_URL} during game version "
+                f"lookup: {transport_error!r}."
+            ) from transport_error
+
+        if cached is not None and response.status_code == httpx.codes.NOT_MODIFIED:
+            return evolve(cached, fetched_at=time.time())
         _raise_for_status(response, "game version lookup")
 
-        version_map: dict[str, GameVersionId] = {}
+        ids: dict[str, GameVersionId] = {}
         for version_obj in response.json():
             version, id_ = version_obj["name"], version_obj["id"]
-            if version not in version_map or version_map[version] < id_:
-                version_map[version] = id_
+            if version not in ids or ids[version] < id_:
+                ids[version] = id_
 
-        return version_map
+        return VersionMap(
+            ids=ids,
+            fetched_at=time.time(),
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
 
     @classmethod
     def uploaded_file_url(cls, slug: str, file_id: int) -> str:
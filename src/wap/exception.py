@@ -30,6 +30,10 @@ class CurseForgeAPIError(WapError):
     """Indicates a problem communicating with CurseForge"""
 
 
+class CurseForgeUnavailableError(CurseForgeAPIError):
+    """Indicates that CurseForge could not be reached or had a server error."""
+
+
 class EncodingError(WapError):
     """Indicates an issue encoding or decoding data"""
 
@@ -56,3 +60,11 @@ class TagError(WapError):
 
 class VersionError(WapError):
     """Indicates that a version is invalid when parsed."""
+
+
+class EnvVarError(WapError):
+    """Indicates that an environment variable has an invalid value."""
+
+
+class PublishError(WapError):
+    """Indicates that some of the projects being published could not be."""
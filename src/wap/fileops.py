@@ -1,5 +1,9 @@
+import os
 import shutil
+import stat
+import sys
 from pathlib import Path
+from typing import Literal, get_args
 
 from wap.exception import (
     PathExistsError,
@@ -7,6 +11,14 @@ from wap.exception import (
     PathTypeError,
     PlatformError,
 )
+from wap.manifest import ManifestEntry, hash_bytes, hash_file
+
+CopyStrategy = Literal["copy", "hardlink", "reflink"]
+COPY_STRATEGIES: tuple[CopyStrategy, ...] = get_args(CopyStrategy)
+DEFAULT_COPY_STRATEGY: CopyStrategy = "copy"
+
+# from linux/fs.h: _IOW(0x94, 9, int)
+_FICLONE = 0x40049409
 
 
 def delete_path(path: Path) -> None:
@@ -33,7 +45,7 @@ def clean_dir(path: Path) -> None:
         delete_path(subpath)
 
 
-def copy_path(src: Path, dst: Path) -> None:
+def copy_path(src: Path, dst: Path, strategy: CopyStrategy = "copy") -> None:
     """
     If src is a file: If dst does not exist, copy src to dst. If dst is a file,
     overwrite its contents with those of src. If dst is a directory, raise a
@@ -53,6 +65,8 @@ def copy_path(src: Path, dst: Path) -> None:
     |     D    | not exist |    new dir    |
 
     And finally, if src and dst are not directories or files, raise a PathTypeException.
+
+    Files are copied with the given strategy (see `copy_file`).
     """
     if src.is_file():
         if dst.is_dir():
@@ -60,20 +74,185 @@ def copy_path(src: Path, dst: Path) -> None:
                 f"Cannot copy file {src} to {dst} because it is a directory. Please "
                 "remove that directory or choose a different target."
             )
-        shutil.copy(src, dst)
+        copy_file(src, dst, strategy)
     elif src.is_dir():
         if dst.is_file():
             raise PathExistsError(
                 f"Cannot copy directory {src} to {dst} because it is a file. Please "
                 "remove that file or choose a different target."
             )
-        shutil.copytree(src, dst, dirs_exist_ok=True)
+        shutil.copytree(
+            src,
+            dst,
+            dirs_exist_ok=True,
+            copy_function=lambda s, d: copy_file(Path(s), Path(d), strategy),
+        )
     else:  # pragma: no cover
         raise PathTypeError(
             f"Cannot copy path {src} because it is not a file or directory."
         )
 
 
+def copy_file(src: Path, dst: Path, strategy: CopyStrategy = "copy") -> None:
+    """
+    Make the file dst have the same contents and modification time as the file src.
+    Any existing dst is replaced (not written through, which matters if it is a link to
+    some other file).
+
+    - "copy" copies the bytes of src.
+    - "hardlink" makes dst a hard link to src, so they share the same data on disk.
+    - "reflink" makes dst a copy-on-write clone of src, which shares data on disk until
+      either is modified.
+
+    Hard links and reflinks are not possible on every filesystem (or across
+    filesystems), so if one cannot be made, this falls back to copying.
+    """
+    dst.unlink(missing_ok=True)
+
+    if strategy == "hardlink":
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    elif strategy == "reflink" and _reflink(src, dst):
+        shutil.copystat(src, dst)
+        return
+
+    shutil.copy2(src, dst)
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    """
+    Try to make dst a copy-on-write clone of src. Returns whether it succeeded.
+    """
+    if sys.platform == "linux":
+        import fcntl
+
+        try:
+            with src.open("rb") as src_file, dst.open("wb") as dst_file:
+                fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+        except OSError:
+            # the empty dst we created will be overwritten by the fallback copy
+            return False
+        return True
+
+    if sys.platform == "darwin":
+        import ctypes
+        import ctypes.util
+
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            return False
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        return libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0  # type: ignore
+
+    return False
+
+
+def _stat_or_none(path: Path) -> os.stat_result | None:
+    try:
+        return path.stat()
+    except FileNotFoundError:
+        return None
+
+
+def sync_file(
+    *,
+    src: Path,
+    dst: Path,
+    previous_entry: ManifestEntry | None,
+    strategy: CopyStrategy = "copy",
+    src_stat: os.stat_result | None = None,
+) -> tuple[ManifestEntry, bool]:
+    """
+    Make dst a copy of the file src (with the given strategy), unless previous_entry
+    (what was recorded when dst was last written) shows that it already is one. Returns
+    the new entry for dst and whether a copy was made. If src has already been stat'ed,
+    pass the result as src_stat so that it isn't stat'ed again.
+
+    Copies preserve modification times, so an unchanged file can usually be recognized
+    by its size and modification time alone. If those differ but the contents hash the
+    same (e.g. the file was only touched), dst's modification time is updated instead
+    of recopying it. A file that was copied with another strategy is always copied
+    again, so that switching from "hardlink" to "copy" stops dst sharing src's data.
+    """
+    if src_stat is None:
+        src_stat = src.stat()
+    dst_stat = _stat_or_none(dst)
+
+    if dst_stat is not None and stat.S_ISDIR(dst_stat.st_mode):
+        raise PathExistsError(
+            f"Cannot copy file {src} to {dst} because it is a directory. Please "
+            "remove that directory or choose a different target."
+        )
+
+    content_hash: str | None = None
+    if (
+        previous_entry is not None
+        and dst_stat is not None
+        and previous_entry.copy_strategy == strategy
+        and previous_entry.matches_stat(dst_stat)
+    ):
+        if previous_entry.matches_stat(src_stat):
+            return previous_entry, False
+
+        content_hash = hash_file(src)
+        if previous_entry.content_hash == content_hash:
+            os.utime(dst, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+            return _entry_for(src_stat, content_hash, strategy), False
+
+    if content_hash is None:
+        content_hash = hash_file(src)
+    copy_file(src, dst, strategy)
+
+    return _entry_for(src_stat, content_hash, strategy), True
+
+
+def _entry_for(
+    stat_result: os.stat_result,
+    content_hash: str,
+    copy_strategy: CopyStrategy | None = None,
+) -> ManifestEntry:
+    return ManifestEntry(
+        size=stat_result.st_size,
+        mtime_ns=stat_result.st_mtime_ns,
+        content_hash=content_hash,
+        copy_strategy=copy_strategy,
+    )
+
+
+def write_generated_file(
+    *, text: str, dst: Path, previous_entry: ManifestEntry | None
+) -> tuple[ManifestEntry, bool]:
+    """
+    Write text to dst, unless previous_entry shows that dst already contains it. Returns
+    the new entry for dst and whether it was written.
+    """
+    content_hash = hash_bytes(text.encode("utf-8"))
+    dst_stat = _stat_or_none(dst)
+
+    if (
+        previous_entry is not None
+        and dst_stat is not None
+        and previous_entry.content_hash == content_hash
+        and previous_entry.matches_stat(dst_stat)
+    ):
+        return previous_entry, False
+
+    try:
+        # unlink first so that we never write through a hard link into a source file
+        dst.unlink(missing_ok=True)
+        dst.write_text(text)
+    except (PermissionError, IsADirectoryError) as error:
+        # on windows, raises PermissionError, linux raises IsADirectoryError
+        raise PathExistsError(
+            f"Generated file {dst} should not exist in your source files."
+        ) from error
+
+    return _entry_for(dst.stat(), content_hash), True
+
+
 def symlink(
     *, new_path: Path, target_path: Path, target_is_directory: bool | None = None
 ) -> None:
@@ -0,0 +1,221 @@
+"""
+Resolution of include globs. All of the patterns being resolved are matched during one
+walk of the directory tree, which only descends into directories that a pattern could
+still match inside of. Results are cached until a change to the tree could alter them.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import os
+import re
+import threading
+from collections.abc import Collection, Iterable, Sequence
+from pathlib import Path, PurePath
+
+from attrs import field, frozen
+
+from wap.scan import scan_path
+
+# Path.glob matches case-insensitively where paths are case-insensitive
+_CASE_FLAGS = re.IGNORECASE if os.name == "nt" else 0
+_MAGIC_CHARS = frozenset("*?[")
+_RECURSIVE = "**"
+
+
+@frozen(kw_only=True)
+class _GlobResult:
+    paths: Sequence[Path]
+    # paths that were looked up directly, whose creation or deletion could change paths
+    looked_up: frozenset[Path]
+    # directories that were listed, in which any change could change paths
+    listed: frozenset[Path]
+    # for results of Path.glob, which any change under this directory could change
+    globbed_root: Path | None = field(default=None)
+
+    def is_affected_by(self, changed_path: Path) -> bool:
+        if self.globbed_root is not None:
+            return changed_path.is_relative_to(self.globbed_root)
+        return (
+            changed_path in self.looked_up
+            or changed_path in self.listed
+            or changed_path.parent in self.listed
+        )
+
+
+@frozen(kw_only=True)
+class _Segment:
+    text: str
+    regex: re.Pattern[str] | None
+
+    @classmethod
+    def parse(cls, text: str) -> _Segment:
+        if text == _RECURSIVE or not _MAGIC_CHARS & set(text):
+            return cls(text=text, regex=None)
+        return cls(text=text, regex=re.compile(fnmatch.translate(text), _CASE_FLAGS))
+
+    @property
+    def is_recursive(self) -> bool:
+        return self.text == _RECURSIVE
+
+    @property
+    def is_literal(self) -> bool:
+        return self.regex is None and not self.is_recursive
+
+
+def _parse_pattern(pattern: str) -> list[_Segment] | None:
+    """
+    Returns the segments of pattern, or None if it uses something that the shared walk
+    doesn't handle the same as Path.glob, in which case Path.glob is used instead.
+    """
+    parts = PurePath(pattern).parts
+    if (
+        not parts
+        or PurePath(pattern).anchor
+        or pattern.endswith(("/", os.sep))
+        or ".." in parts
+        or parts[-1] == _RECURSIVE
+    ):
+        return None
+    return [_Segment.parse(part) for part in parts]
+
+
+# (pattern index, segment index): a pattern that has matched its segments up to (but not
+# including) the segment index
+_State = tuple[int, int]
+
+
+def _walk(root: Path, patterns: Sequence[Sequence[_Segment]]) -> list[_GlobResult]:
+    matches: list[dict[Path, None]] = [{} for _ in patterns]
+    looked_up: list[set[Path]] = [set() for _ in patterns]
+    listed: list[set[Path]] = [set() for _ in patterns]
+
+    def closure(states: Iterable[_State]) -> set[_State]:
+        # "**" also matches no directories at all
+        closed: set[_State] = set()
+        for pattern_index, segment_index in states:
+            closed.add((pattern_index, segment_index))
+            while patterns[pattern_index][segment_index].is_recursive:
+                segment_index += 1
+                closed.add((pattern_index, segment_index))
+        return closed
+
+    def advance(
+        next_states: dict[Path, set[_State]], path: Path, is_dir: bool, state: _State
+    ) -> None:
+        pattern_index, segment_index = state
+        if segment_index == len(patterns[pattern_index]) - 1:
+            matches[pattern_index][path] = None
+        elif is_dir:
+            next_states.setdefault(path, set()).add((pattern_index, segment_index + 1))
+
+    stack: list[tuple[Path, set[_State]]] = [
+        (root, closure((pattern_index, 0) for pattern_index in range(len(patterns))))
+    ]
+    while stack:
+        dir_path, states = stack.pop()
+        next_states: dict[Path, set[_State]] = {}
+
+        listing_states: list[_State] = []
+        for state in states:
+            segment = patterns[state[0]][state[1]]
+            if not segment.is_literal:
+                listing_states.append(state)
+                continue
+            # no need to list the directory for a literal name
+            path = dir_path / segment.text
+            looked_up[state[0]].add(path)
+            if (scanned := scan_path(path)) is not None:
+                advance(next_states, path, scanned.is_dir, state)
+
+        if listing_states:
+            for pattern_index, _ in listing_states:
+                listed[pattern_index].add(dir_path)
+            try:
+                with os.scandir(dir_path) as scanner:
+                    entries = list(scanner)
+            except OSError:
+                entries = []
+            for entry in entries:
+                path = Path(entry.path)
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                for state in listing_states:
+                    segment = patterns[state[0]][state[1]]
+                    if segment.is_recursive:
+                        # like Path.glob, "**" doesn't follow symlinks, which could loop
+                        if is_dir and not entry.is_symlink():
+                            next_states.setdefault(path, set()).add(state)
+                    elif segment.regex is not None and segment.regex.match(entry.name):
+                        advance(next_states, path, is_dir, state)
+
+        for path, path_states in next_states.items():
+            stack.append((path, closure(path_states)))
+
+    return [
+        _GlobResult(
+            paths=sorted(matches[index]),
+            looked_up=frozenset(looked_up[index]),
+            listed=frozenset(listed[index]),
+        )
+        for index in range(len(patterns))
+    ]
+
+
+@frozen(kw_only=True)
+class IncludeResolver:
+    """
+    Resolves include globs, caching the results of each pattern. Call invalidate with
+    changed paths (e.g. in watch mode) to forget the results that they could change.
+    """
+
+    _results: dict[tuple[Path, str], _GlobResult] = field(factory=dict)
+    _lock: threading.Lock = field(factory=threading.Lock)
+
+    def resolve_all(
+        self, root_path: Path, glob_patterns: Sequence[str]
+    ) -> list[Sequence[Path]]:
+        """
+        Returns the paths that each of glob_patterns match under root_path, as
+        Path.glob would (but in sorted order).
+        """
+        with self._lock:
+            uncached: dict[str, list[_Segment]] = {}
+            for pattern in glob_patterns:
+                if (root_path, pattern) in self._results:
+                    continue
+                segments = _parse_pattern(pattern)
+                if segments is None:
+                    self._results[root_path, pattern] = _GlobResult(
+                        paths=sorted(root_path.glob(pattern)),
+                        looked_up=frozenset(),
+                        listed=frozenset(),
+                        globbed_root=root_path,
+                    )
+                else:
+                    uncached[pattern] = segments
+
+            if uncached:
+                walked = _walk(root_path, list(uncached.values()))
+                for pattern, result in zip(uncached, walked, strict=True):
+                    self._results[root_path, pattern] = result
+
+            return [
+                self._results[root_path, pattern].paths for pattern in glob_patterns
+            ]
+
+    def invalidate(self, changed_paths: Collection[Path]) -> bool:
+        """
+        Forget the results that changed_paths could change. Returns True if any were.
+        """
+        with self._lock:
+            stale_keys = [
+                key
+                for key, result in self._results.items()
+                if any(result.is_affected_by(path) for path in changed_paths)
+            ]
+            for key in stale_keys:
+                del self._results[key]
+            return bool(stale_keys)
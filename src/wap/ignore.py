@@ -0,0 +1,155 @@
+"""
+Rules for excluding files from addon output directories, from the `exclude` setting of
+an addon and its `.wapignore` file. The patterns of both are compiled together into a
+single regular expression.
+"""
+
+from __future__ import annotations
+
+import re
+from collections.abc import Iterable, Sequence
+from pathlib import Path, PurePosixPath
+
+from attrs import frozen
+
+from wap.exception import ConfigError
+
+IGNORE_FILE_NAME = ".wapignore"
+
+# matches nothing
+_NEVER = "(?!)"
+
+
+def _translate_class(pattern: str, start: int) -> tuple[str, int] | None:
+    """
+    Translate the character class of pattern that starts (with "[") at start. Returns
+    the regex and the index after the class, or None if the class is not closed.
+    """
+    index = start + 1
+    if index < len(pattern) and pattern[index] in "!^":
+        index += 1
+    if index < len(pattern) and pattern[index] == "]":
+        index += 1
+    end = pattern.find("]", index)
+    if end == -1:
+        return None
+    body = pattern[start + 1 : end].replace("\\", "\\\\")
+    if body[0] in "!^":
+        body = "^" + body[1:]
+    return f"(?!/)[{body}]", end + 1
+
+
+def _translate(pattern: str) -> str:
+    """
+    Translate a glob (without any leading "/" or trailing "/") to a regex. "*" and "?"
+    don't match "/", and "**" as a whole path segment matches any number of segments.
+    """
+    parts: list[str] = []
+    segments = pattern.split("/")
+    for index, segment in enumerate(segments):
+        last = index == len(segments) - 1
+        if segment == "**":
+            # any number of segments, including none
+            parts.append(".*" if last else "(?:.*/)?")
+            continue
+        position = 0
+        while position < len(segment):
+            char = segment[position]
+            if char == "*":
+                parts.append("[^/]*")
+                position += 1
+            elif char == "?":
+                parts.append("[^/]")
+                position += 1
+            elif char == "[" and (translated := _translate_class(segment, position)):
+                parts.append(translated[0])
+                position = translated[1]
+            else:
+                parts.append(re.escape(char))
+                position += 1
+        if not last:
+            parts.append("/")
+    return "".join(parts)
+
+
+@frozen(kw_only=True)
+class IgnoreRules:
+    """
+    Glob patterns of paths (relative to an addon output directory) to leave out of it,
+    in the style of .gitignore:
+
+    - a pattern with no "/" (other than a trailing one) matches a name at any depth, and
+      one with a "/" matches from the addon output directory.
+    - a pattern with a trailing "/" only matches directories.
+    - "*" and "?" match within a name, and "**" matches any number of directories.
+    - blank lines and lines starting with "#" are ignored.
+
+    When a directory is excluded, so is everything in it.
+    """
+
+    regex: re.Pattern[str]
+    # of the patterns that only match directories
+    dir_regex: re.Pattern[str]
+
+    @classmethod
+    def from_patterns(cls, patterns: Iterable[str]) -> IgnoreRules:
+        regexes: list[str] = []
+        dir_regexes: list[str] = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            if pattern.startswith("!"):
+                raise ConfigError(
+                    f'Exclude pattern "{pattern}" is negated, which is not supported.'
+                )
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            anchored = "/" in pattern
+            regex = _translate(pattern.lstrip("/"))
+            if not anchored:
+                regex = f"(?:.*/)?{regex}"
+            (dir_regexes if dir_only else regexes).append(regex)
+
+        def compile_all(regexes: list[str]) -> re.Pattern[str]:
+            return re.compile("|".join(f"(?:{regex})" for regex in regexes) or _NEVER)
+
+        return cls(regex=compile_all(regexes), dir_regex=compile_all(dir_regexes))
+
+    @classmethod
+    def for_addon(cls, source_path: Path, exclude: Sequence[str]) -> IgnoreRules:
+        """
+        Returns the rules of an addon: its exclude patterns, plus those in the ignore
+        file in source_path (which is itself always excluded).
+        """
+        lines = [f"/{IGNORE_FILE_NAME}", *exclude]
+        try:
+            lines.extend(
+                (source_path / IGNORE_FILE_NAME)
+                .read_text(encoding="utf-8")
+                .splitlines()
+            )
+        except (FileNotFoundError, NotADirectoryError):
+            # the addon path is checked when building
+            pass
+        return cls.from_patterns(lines)
+
+    def matches(self, rel_path: str, is_dir: bool) -> bool:
+        """
+        Returns True if the posix-style rel_path is excluded by a pattern. Its parent
+        directories are not considered.
+        """
+        return bool(
+            self.regex.fullmatch(rel_path)
+            or (is_dir and self.dir_regex.fullmatch(rel_path))
+        )
+
+    def excludes(self, rel_path: str, is_dir: bool) -> bool:
+        """
+        Returns True if the posix-style rel_path or any of its parent directories is
+        excluded by a pattern.
+        """
+        return self.matches(rel_path, is_dir) or any(
+            self.matches(parent.as_posix(), is_dir=True)
+            for parent in PurePosixPath(rel_path).parents[:-1]
+        )
@@ -0,0 +1,123 @@
+"""
+Links from WoW addons directories to built addons. The links that wap makes are
+recorded in a state file, so that linking again only touches the links that changed,
+and links to addons that are no longer built can be removed.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+from typing import Any, ClassVar
+
+from attrs import field, frozen
+
+from wap.fileops import delete_path, symlink
+from wap.state import read_state_file, write_state_file
+
+
+@frozen(kw_only=True)
+class LinkState:
+    """
+    The links that wap made, as link paths to their (resolved) target paths.
+    """
+
+    links: Mapping[Path, Path] = field(factory=dict)
+
+    VERSION: ClassVar[int] = 1
+
+    @classmethod
+    def from_path(cls, path: Path) -> LinkState:
+        """
+        Read a link state from path. Without a readable one, no links are known to be
+        wap's, so every link is checked again.
+        """
+        state = read_state_file(path, cls.VERSION, cls.from_python_object)
+        return state if state is not None else cls()
+
+    @classmethod
+    def from_python_object(cls, obj: Mapping[str, Any]) -> LinkState:
+        return cls(
+            links={
+                Path(link_path): Path(target_path)
+                for link_path, target_path in obj["links"].items()
+            }
+        )
+
+    def to_python_object(self) -> dict[str, Any]:
+        return {
+            "links": {
+                str(link_path): str(self.links[link_path])
+                for link_path in sorted(self.links)
+            },
+        }
+
+    def write_to_path(self, path: Path) -> None:
+        write_state_file(path, self.VERSION, self.to_python_object())
+
+
+@frozen(kw_only=True)
+class LinkChanges:
+    created: Sequence[Path] = field(factory=tuple)
+    unchanged: Sequence[Path] = field(factory=tuple)
+    removed: Sequence[Path] = field(factory=tuple)
+
+
+def _points_to(link_path: Path, target_path: Path) -> bool:
+    # where the link leads is compared, rather than what it contains, which may be
+    # relative or (on Windows) prefixed with \\?\
+    if not link_path.is_symlink():
+        return False
+    try:
+        return link_path.resolve() == target_path.resolve()
+    except OSError:
+        # a loop of links
+        return False
+
+
+def sync_links(
+    wanted: Mapping[Path, Path], state_path: Path, force: bool
+) -> LinkChanges:
+    """
+    Make each link path in wanted a symlink to its (resolved) target path, recording
+    them in the state file at state_path. Links that already point to their target are
+    left alone, and links that wap made to another target (e.g., of an older version of
+    the package) are replaced. If force, whatever else is at a link path is deleted
+    first.
+
+    Links that the state file records in the directories of wanted, but that aren't
+    wanted anymore (e.g., of addons that were removed or renamed), are removed if they
+    still point where they did.
+    """
+    state = LinkState.from_path(state_path)
+    created: list[Path] = []
+    unchanged: list[Path] = []
+    removed: list[Path] = []
+
+    for link_path, target_path in wanted.items():
+        if _points_to(link_path, target_path):
+            unchanged.append(link_path)
+            continue
+        recorded_target = state.links.get(link_path)
+        if recorded_target is not None and _points_to(link_path, recorded_target):
+            link_path.unlink()
+        elif force and (link_path.exists() or link_path.is_symlink()):
+            delete_path(link_path)
+        symlink(new_path=link_path, target_path=target_path)
+        created.append(link_path)
+
+    link_dirs = {link_path.parent for link_path in wanted}
+    links = dict(state.links)
+    for link_path, target_path in state.links.items():
+        if link_path in wanted or link_path.parent not in link_dirs:
+            continue
+        if _points_to(link_path, target_path):
+            link_path.unlink()
+            removed.append(link_path)
+        # if it doesn't point there anymore, it's not ours to remove
+        del links[link_path]
+    links.update(wanted)
+
+    if links != state.links:
+        LinkState(links=links).write_to_path(state_path)
+    return LinkChanges(created=created, unchanged=unchanged, removed=removed)
@@ -0,0 +1,106 @@
+"""
+Build manifests record what wap wrote into an addon's output directory during the last
+build, so that the next build only has to touch what actually changed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, ClassVar
+
+from attrs import field, frozen
+
+from wap.state import read_state_file, write_state_file
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: Path) -> str:
+    with path.open("rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+@frozen(kw_only=True)
+class ManifestEntry:
+    """
+    A file in the output directory. `size` and `mtime_ns` describe the output file as it
+    was left by the build, and `content_hash` is the SHA-256 of its contents. Files
+    copied from a source file record the `copy_strategy` they were copied with, which
+    generated files don't have.
+    """
+
+    size: int
+    mtime_ns: int
+    content_hash: str
+    copy_strategy: str | None = None
+
+    def matches_stat(self, stat: os.stat_result) -> bool:
+        return self.size == stat.st_size and self.mtime_ns == stat.st_mtime_ns
+
+    @classmethod
+    def from_python_object(cls, obj: Mapping[str, Any]) -> ManifestEntry:
+        return cls(
+            size=obj["size"],
+            mtime_ns=obj["mtimeNs"],
+            content_hash=obj["contentHash"],
+            copy_strategy=obj.get("copyStrategy"),
+        )
+
+    def to_python_object(self) -> dict[str, Any]:
+        obj: dict[str, Any] = {
+            "size": self.size,
+            "mtimeNs": self.mtime_ns,
+            "contentHash": self.content_hash,
+        }
+        if self.copy_strategy is not None:
+            obj["copyStrategy"] = self.copy_strategy
+        return obj
+
+
+@frozen(kw_only=True)
+class Manifest:
+    """
+    The files and directories (as posix paths relative to the addon output directory)
+    that a build produced.
+    """
+
+    files: Mapping[str, ManifestEntry] = field(factory=dict)
+    dirs: frozenset[str] = field(factory=frozenset)
+
+    VERSION: ClassVar[int] = 1
+
+    @classmethod
+    def from_path(cls, path: Path) -> Manifest:
+        """
+        Read a manifest from path. Without a readable one, the manifest is empty, which
+        just means that everything will be rebuilt.
+        """
+        manifest = read_state_file(path, cls.VERSION, cls.from_python_object)
+        return manifest if manifest is not None else cls()
+
+    @classmethod
+    def from_python_object(cls, obj: Mapping[str, Any]) -> Manifest:
+        return cls(
+            files={
+                rel_path: ManifestEntry.from_python_object(entry_obj)
+                for rel_path, entry_obj in obj["files"].items()
+            },
+            dirs=frozenset(obj["dirs"]),
+        )
+
+    def to_python_object(self) -> dict[str, Any]:
+        return {
+            "files": {
+                rel_path: self.files[rel_path].to_python_object()
+                for rel_path in sorted(self.files)
+            },
+            "dirs": sorted(self.dirs),
+        }
+
+    def write_to_path(self, path: Path) -> None:
+        write_state_file(path, self.VERSION, self.to_python_object())
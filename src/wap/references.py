@@ -0,0 +1,190 @@
+"""
+Finding which files of an addon the game loads: those listed in its TOC files, and
+those that the XML files among them load in turn with `<Script file="..."/>` and
+`<Include file="..."/>`.
+"""
+
+from __future__ import annotations
+
+import posixpath
+import re
+from collections.abc import Callable, Collection, Mapping, Sequence
+from pathlib import Path, PureWindowsPath
+from typing import Any, ClassVar
+
+from attrs import field, frozen
+
+from wap.state import read_state_file, write_state_file
+
+_XML_COMMENT_RE = re.compile(rb"<!--.*?-->", re.DOTALL)
+_XML_REFERENCE_RE = re.compile(
+    rb"<\s*(?:Script|Include)\b[^>]*?\bfile\s*=\s*([\"'])(.*?)\1", re.IGNORECASE
+)
+# files that the game can load from a TOC file
+LOADABLE_SUFFIXES = (".lua", ".xml")
+
+
+def parse_xml_references(data: bytes) -> list[str]:
+    """
+    Returns the file attributes of the Script and Include elements in the XML document
+    data, in document order. This is a scan for just those elements rather than a full
+    parse, so that malformed documents (which the game mostly tolerates) still work.
+    """
+    data = _XML_COMMENT_RE.sub(b"", data)
+    return [
+        match.group(2).decode("utf-8", errors="replace")
+        for match in _XML_REFERENCE_RE.finditer(data)
+    ]
+
+
+def _key(rel_path: str) -> str:
+    # the game resolves paths case-insensitively and with either separator
+    return posixpath.normpath(PureWindowsPath(rel_path).as_posix()).lower()
+
+
+def _reference_key(xml_path: str, reference: str, addon_name: str) -> str:
+    """
+    Returns the key of the file that reference, in the XML file at xml_path, loads.
+    References are relative to the XML file, or to the game directory when they start
+    with Interface/AddOns/<addon> (with either separator).
+    """
+    reference = PureWindowsPath(reference).as_posix()
+    addon_prefix = f"interface/addons/{addon_name}/".lower()
+    if reference.lower().startswith(addon_prefix):
+        return _key(reference[len(addon_prefix) :])
+    return _key(posixpath.join(posixpath.dirname(xml_path), reference))
+
+
+def _is_loadable(rel_path: str) -> bool:
+    return rel_path.lower().endswith(LOADABLE_SUFFIXES)
+
+
+@frozen(kw_only=True)
+class ReferenceCache:
+    """
+    The references of XML files, keyed by the SHA-256 of their contents, so that an XML
+    file is only parsed again when it changes.
+    """
+
+    references: Mapping[str, Sequence[str]] = field(factory=dict)
+
+    VERSION: ClassVar[int] = 1
+
+    @classmethod
+    def from_path(cls, path: Path) -> ReferenceCache:
+        """
+        Read a cache from path, or start an empty one if it can't be read.
+        """
+        cache = read_state_file(path, cls.VERSION, cls.from_python_object)
+        return cache if cache is not None else cls()
+
+    @classmethod
+    def from_python_object(cls, obj: Mapping[str, Any]) -> ReferenceCache:
+        references = obj["references"]
+        if not isinstance(references, dict) or not all(
+            isinstance(file_references, list)
+            and all(isinstance(reference, str) for reference in file_references)
+            for file_references in references.values()
+        ):
+            raise TypeError("references should map hashes to lists of paths")
+        return cls(references=references)
+
+    def to_python_object(self) -> dict[str, Any]:
+        return {
+            "references": {
+                content_hash: list(self.references[content_hash])
+                for content_hash in sorted(self.references)
+            },
+        }
+
+    def write_to_path(self, path: Path) -> None:
+        write_state_file(path, self.VERSION, self.to_python_object())
+
+
+@frozen(kw_only=True)
+class LoadedFiles:
+    """
+    The result of following an addon's references, with posix-style paths relative to
+    the addon directory.
+    """
+
+    # in load order
+    loaded: Sequence[str]
+    # Lua files that nothing loads
+    unreferenced: Sequence[str]
+    # (XML file, reference) pairs whose files don't exist
+    missing: Sequence[tuple[str, str]]
+
+
+def find_loaded_files(
+    toc_files: Sequence[str],
+    file_paths: Collection[str],
+    read_references: Callable[[str], Sequence[str]],
+    addon_name: str,
+) -> LoadedFiles:
+    """
+    Follow the references of the XML files among toc_files (recursively) to find every
+    file that is loaded. file_paths are the files in the directory of the addon named
+    addon_name, and read_references returns the references of one of its XML files.
+    """
+    paths_by_key = {_key(rel_path): rel_path for rel_path in file_paths}
+    loaded: dict[str, None] = {}
+    missing: list[tuple[str, str]] = []
+
+    def visit(rel_path: str) -> None:
+        if rel_path in loaded:
+            return
+        loaded[rel_path] = None
+        if not rel_path.lower().endswith(".xml"):
+            return
+        for reference in read_references(rel_path):
+            target = paths_by_key.get(_reference_key(rel_path, reference, addon_name))
+            if target is None:
+                missing.append((rel_path, reference))
+            else:
+                visit(target)
+
+    for toc_file in toc_files:
+        # missing TOC files are reported by Toc.validate_all
+        if (target := paths_by_key.get(_key(toc_file))) is not None:
+            visit(target)
+
+    unreferenced = sorted(
+        rel_path
+        for rel_path in file_paths
+        if rel_path.lower().endswith(".lua") and rel_path not in loaded
+    )
+    return LoadedFiles(loaded=list(loaded), unreferenced=unreferenced, missing=missing)
+
+
+def order_files(
+    toc_files: Sequence[str],
+    file_paths: Collection[str],
+    read_references: Callable[[str], Sequence[str]],
+    addon_name: str,
+) -> list[str]:
+    """
+    Returns a files list for a TOC that loads every Lua and XML file of the addon named
+    addon_name: first toc_files, in their order, and then each file that no XML file
+    loads, in path order.
+    """
+    referenced: set[str] = set()
+    for rel_path in file_paths:
+        if rel_path.lower().endswith(".xml"):
+            referenced.update(
+                _reference_key(rel_path, reference, addon_name)
+                for reference in read_references(rel_path)
+            )
+
+    listed = {_key(toc_file) for toc_file in toc_files}
+    roots = sorted(
+        (
+            rel_path
+            for rel_path in file_paths
+            if _is_loadable(rel_path)
+            and _key(rel_path) not in referenced
+            and _key(rel_path) not in listed
+        ),
+        key=lambda rel_path: (rel_path.lower(), rel_path),
+    )
+    return [*toc_files, *roots]
@@ -0,0 +1,66 @@
+"""
+Scanning of source directories. Every path is stat'ed once when it is scanned, and that
+stat result is carried along with it, so that later steps of a build don't need to stat
+it again.
+"""
+
+from __future__ import annotations
+
+import os
+import stat
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+from attrs import frozen
+
+
+@frozen(kw_only=True)
+class ScannedPath:
+    path: Path
+    # of the path itself, or of its target if it is a symlink
+    stat: os.stat_result
+
+    @property
+    def is_dir(self) -> bool:
+        return stat.S_ISDIR(self.stat.st_mode)
+
+
+def scan_path(path: Path) -> ScannedPath | None:
+    """
+    Returns the scanned path, or None if it does not exist (or is a broken symlink).
+    """
+    try:
+        return ScannedPath(path=path, stat=path.stat())
+    except FileNotFoundError:
+        return None
+
+
+def scan_tree(
+    root: Path, exclude: Callable[[str, bool], bool] | None = None
+) -> Iterator[tuple[str, ScannedPath]]:
+    """
+    Yield everything under the directory root (but not root itself), each with its
+    posix-style path relative to root. Directories are yielded before their contents.
+
+    Directory symlinks are followed, as copying a tree always has. Broken symlinks are
+    skipped, because there is nothing to copy. So is everything for which exclude
+    (given the relative path and whether it is a directory) returns True, and excluded
+    directories are not descended into.
+    """
+    stack: list[tuple[str, str]] = [(os.fspath(root), "")]
+    while stack:
+        dir_path, rel_prefix = stack.pop()
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                try:
+                    # cached on the entry, and free on some platforms
+                    entry_stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                rel_path = f"{rel_prefix}{entry.name}"
+                scanned = ScannedPath(path=Path(entry.path), stat=entry_stat)
+                if exclude is not None and exclude(rel_path, scanned.is_dir):
+                    continue
+                yield rel_path, scanned
+                if scanned.is_dir:
+                    stack.append((entry.path, f"{rel_path}/"))
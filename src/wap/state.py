@@ -0,0 +1,42 @@
+"""
+The JSON files that wap keeps between runs, such as build manifests and caches. Each
+holds an object with a "version" of its format, so that a file of another format is
+ignored rather than misread. These files are only ever an optimization, so one that
+can't be read is treated as if it weren't there.
+"""
+
+from __future__ import annotations
+
+import json
+from collections.abc import Callable, Mapping
+from pathlib import Path
+from typing import Any
+
+# what reading a state file raises if it doesn't exist, isn't JSON, or doesn't have the
+# shape that its parser expects
+_READ_ERRORS = (OSError, ValueError, KeyError, TypeError, AttributeError)
+
+
+def read_state_file[T](
+    path: Path, version: int, parse: Callable[[Mapping[str, Any]], T]
+) -> T | None:
+    """
+    Returns what parse makes of the object in the state file at path, or None if there
+    is no such file, it is of another version, or it can't be understood (including
+    parse raising ValueError, KeyError, TypeError or AttributeError).
+    """
+    try:
+        obj = json.loads(path.read_text(encoding="utf-8"))
+        if obj["version"] != version:
+            return None
+        return parse(obj)
+    except _READ_ERRORS:
+        return None
+
+
+def write_state_file(path: Path, version: int, obj: Mapping[str, Any]) -> None:
+    """
+    Write obj, with its version, to the state file at path.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"version": version, **obj}), encoding="utf-8")
@@ -0,0 +1,199 @@
+"""
+Timing of the phases of wap's work, so that you can see where it spends its time.
+
+Code is timed by wrapping it with `timed`, which costs next to nothing unless a profiler
+is active (see `profiling`).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any
+
+from attrs import frozen
+
+from wap.console import print
+
+
+@frozen(kw_only=True)
+class Span:
+    """
+    A timed phase, optionally of a specific addon. Times are in nanoseconds from an
+    arbitrary point.
+    """
+
+    phase: str
+    addon: str | None
+    start_ns: int
+    end_ns: int
+    thread_id: int
+
+    @property
+    def duration_ns(self) -> int:
+        return self.end_ns - self.start_ns
+
+
+@frozen(kw_only=True)
+class PhaseTiming:
+    """
+    The total of the spans of a phase (and addon).
+    """
+
+    phase: str
+    addon: str | None
+    count: int
+    total_ns: int
+
+
+class Profiler:
+    """
+    Records spans. Spans can be recorded from multiple threads.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._spans: list[Span] = []
+
+    @contextmanager
+    def span(self, phase: str, addon: str | None = None) -> Iterator[None]:
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            span = Span(
+                phase=phase,
+                addon=addon,
+                start_ns=start_ns,
+                end_ns=time.perf_counter_ns(),
+                thread_id=threading.get_ident(),
+            )
+            with self._lock:
+                self._spans.append(span)
+
+    @property
+    def spans(self) -> list[Span]:
+        """
+        The recorded spans, in the order they started.
+        """
+        with self._lock:
+            return sorted(self._spans, key=lambda span: span.start_ns)
+
+    def phase_timings(self) -> list[PhaseTiming]:
+        """
+        Returns the total time of each phase of each addon, in the order they first
+        started.
+        """
+        totals: dict[tuple[str, str | None], tuple[int, int]] = {}
+        for span in self.spans:
+            key = (span.phase, span.addon)
+            count, total_ns = totals.get(key, (0, 0))
+            totals[key] = (count + 1, total_ns + span.duration_ns)
+        return [
+            PhaseTiming(phase=phase, addon=addon, count=count, total_ns=total_ns)
+            for (phase, addon), (count, total_ns) in totals.items()
+        ]
+
+    def print_report(self) -> None:
+        # imported here because it's only needed when reporting
+        from rich.table import Table
+
+        table = Table(title="Timings")
+        table.add_column("Phase")
+        table.add_column("Addon")
+        table.add_column("Count", justify="right")
+        table.add_column("Time (ms)", justify="right")
+        for timing in self.phase_timings():
+            table.add_row(
+                timing.phase,
+                f"[addon]{timing.addon}[/addon]" if timing.addon else "",
+                str(timing.count),
+                f"{timing.total_ns / 1_000_000:.1f}",
+            )
+        print(table)
+
+    def to_trace_events(self) -> list[dict[str, Any]]:
+        """
+        Returns the spans as Chrome trace events, which can be viewed with
+        chrome://tracing or https://ui.perfetto.dev.
+        """
+        spans = self.spans
+        origin_ns = spans[0].start_ns if spans else 0
+        return [
+            {
+                "name": span.phase,
+                "cat": "wap",
+                "ph": "X",
+                # trace event times are in microseconds
+                "ts": (span.start_ns - origin_ns) / 1000,
+                "dur": span.duration_ns / 1000,
+                "pid": os.getpid(),
+                "tid": span.thread_id,
+                "args": {"addon": span.addon} if span.addon else {},
+            }
+            for span in spans
+        ]
+
+    def write_trace(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps({"traceEvents": self.to_trace_events()}), encoding="utf-8"
+        )
+
+
+_profiler: ContextVar[Profiler | None] = ContextVar("wap_profiler", default=None)
+
+
+@contextmanager
+def profiling() -> Iterator[Profiler]:
+    """
+    Make a new profiler active for the duration of the context. Work done in threads
+    is only timed if the thread runs in a copy of this context (see
+    `contextvars.copy_context`).
+    """
+    profiler = Profiler()
+    token = _profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _profiler.reset(token)
+
+
+@contextmanager
+def timed(phase: str, addon: str | None = None) -> Iterator[None]:
+    """
+    Time the context as a phase (of an addon), if a profiler is active.
+    """
+    profiler = _profiler.get()
+    if profiler is None:
+        yield
+        return
+    with profiler.span(phase, addon):
+        yield
+
+
+@contextmanager
+def report_timings(timings: bool, trace_path: Path | None) -> Iterator[None]:
+    """
+    Profile the context if timings or trace_path. Afterwards (even if it raised), print
+    a report of the timings if timings, and write a trace file to trace_path if given.
+    """
+    if not timings and trace_path is None:
+        yield
+        return
+
+    with profiling() as profiler:
+        try:
+            yield
+        finally:
+            if timings:
+                profiler.print_report()
+            if trace_path is not None:
+                profiler.write_trace(trace_path)
+                print(f"Wrote trace to [path]{trace_path}[/path]")
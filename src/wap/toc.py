@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from collections.abc import Mapping, Sequence
+from collections.abc import Collection, Iterable, Mapping, Sequence
 from pathlib import Path, PureWindowsPath
 from typing import ClassVar
 
@@ -10,6 +10,7 @@ from attrs import frozen
 from wap import __version__
 from wap.config import Config, TocConfig
 from wap.exception import PathMissingError, TagError
+from wap.timing import timed
 from wap.wow import Version
 
 # Just some notes about TOC files I found
@@ -52,6 +53,8 @@ _LOCALIZED_TAGS = {
     f"{tag}-{lr}" for tag in _BARE_LOCALIZABLE_TAGS for lr in _LANGUAGE_REGIONS
 }
 _METADATA_TAG_PREFIX = "X-"
+_INTERFACE_TAG = "Interface"
+_BUILD_TIME_TAG = f"{_METADATA_TAG_PREFIX}BuildDateTime"
 
 
 @frozen
@@ -81,69 +84,63 @@ class Toc:
 
         return cls(tags=tags, files=files, flavor_suffix=flavor_suffix)
 
-    @classmethod
-    def from_toc_config(
-        cls,
-        toc_config: TocConfig,
-        source_path: Path,
-        config: Config,
-        wow_version: Version,
-        flavor_suffix: str | None = None,
-    ) -> Toc:
-        default_tags = {}
-        if config.author is not None:
-            default_tags["Author"] = config.author
-        if config.description is not None:
-            default_tags["Description"] = config.description
-        default_tags["Title"] = source_path.name
-        default_tags["Version"] = config.version
-        default_tags["Interface"] = wow_version.interface_version
-        default_tags[f"{_METADATA_TAG_PREFIX}BuildDateTime"] = (
-            arrow.utcnow().isoformat()
-        )
-        default_tags[f"{_METADATA_TAG_PREFIX}BuildTool"] = f"wap {__version__}"
-
-        # all default tags are overrideable
-        merged_tags: dict[str, str] = default_tags | toc_config.serialized_tags
-
-        # sort the tags, for Title and Notes
-        # TOC parsing logic is that, for a given user locale "xxXX" and tag name "Tag"
-        # in {"Title", "Notes"}, the realized value will the LAST declaration of "Tag"
-        # or "Tag-xxXX" in the TOC file. If neither are present, the realized value will
-        # be the game client's default value. For "Title", the default is the name of
-        # the directory, and for "Notes", the default is an empty string.
-        # Since locale tags are probably more applicable, we want them last.
-        tag_pairs = list(merged_tags.items())
-        # this sort should only reorder localized tags. everything else should be in
-        # config order (insertion order) because this python sort is stable.
-        tag_pairs.sort(key=lambda kv: 1 if kv[0] in _LOCALIZED_TAGS else 0)
-
-        return cls(tags=tag_pairs, files=toc_config.files, flavor_suffix=flavor_suffix)
-
     @property
     def tag_map(self) -> Mapping[str, str]:
         return dict(self.tags)
 
-    def validate(self, source_dir: Path) -> None:
+    @classmethod
+    def validate_all(
+        cls,
+        tocs: Iterable[Toc],
+        source_dir: Path,
+        file_paths: Collection[str] | None = None,
+    ) -> None:
         """
-        Check various things about a toc, including testing that the paths in the files
-        list actually exist in source_dir
+        Check the tags of each toc, and that the paths in their files lists exist in
+        source_dir. Files lists shared by several tocs (e.g. of each flavor of an addon)
+        are only checked once, and every missing path is reported in one error.
+
+        If the files in source_dir are already known, pass their posix-style paths
+        (relative to source_dir) as file_paths, and the files lists are checked against
+        them instead of the filesystem. Paths that aren't found there are still checked
+        on the filesystem, which may be case-insensitive.
         """
+        with timed("validate-toc", addon=source_dir.name):
+            unique_files: dict[str, None] = {}
+            for toc in tocs:
+                toc._validate_tags()
+                unique_files.update(dict.fromkeys(toc.files))
+
+            missing_paths = [
+                source_dir / file_path
+                for file_path in unique_files
+                if not (
+                    file_paths is not None
+                    and PureWindowsPath(file_path).as_posix() in file_paths
+                )
+                and not (source_dir / file_path).is_file()
+            ]
+            if len(missing_paths) == 1:
+                raise PathMissingError(
+                    f"TOC file path {missing_paths[0]} does not exist. Please fix the "
+                    "path in your configuration file or remove it."
+                )
+            if missing_paths:
+                listing = "".join(f"\n  {path}" for path in missing_paths)
+                raise PathMissingError(
+                    f"{len(missing_paths)} TOC file paths do not exist:{listing}\n"
+                    "Please fix these paths in your configuration file or remove them."
+                )
+
+    def _validate_tags(self) -> None:
         illegal_tag_chars = ["\n", " ", ":"]
         for tag in self.tag_map:
             for ill_char in illegal_tag_chars:
                 if ill_char in tag:
                     raise TagError(
-                        f'Tag {tag} contains illegal character "{ill_char!r}". Please '
-                        "remove it and try again"
+                        f'Tag {tag} contains illegal character "{ill_char!r}". '
+                        "Please remove it and try again"
                     )
-        for file_path in self.files:
-            joined_path = source_dir / file_path
-            if not joined_path.is_file():
-                raise PathMissingError(
-                    f"TOC file path {joined_path} does not exist. Please fix the path "
-                    "in your configuration file or remove it."
-                )
 
     @classmethod
     def _create_tag_line(cls, key: str, value: str) -> str:
@@ -166,3 +163,89 @@ class Toc:
                 *(self._create_file_line(files) for files in self.files),
             )
         )
+
+
+@frozen(kw_only=True)
+class TocTemplate:
+    """
+    What the TOC files of an addon have in common. The TOC of each flavor is rendered
+    from it by filling in its Interface tag, build time and suffix.
+    """
+
+    tags: Sequence[tuple[str, str]]
+    files: Sequence[str]
+    # index of the Interface tag in tags, unless it is set in the config
+    interface_tag_index: int | None
+    # index of the build time tag in tags, unless it is set in the config
+    build_time_tag_index: int | None
+
+    @classmethod
+    def from_toc_config(
+        cls,
+        toc_config: TocConfig,
+        source_path: Path,
+        config: Config,
+    ) -> TocTemplate:
+        default_tags = {}
+        if config.author is not None:
+            default_tags["Author"] = config.author
+        if config.description is not None:
+            default_tags["Description"] = config.description
+        default_tags["Title"] = source_path.name
+        default_tags["Version"] = config.version
+        # filled in for each flavor
+        default_tags[_INTERFACE_TAG] = ""
+        # filled in for each build
+        default_tags[_BUILD_TIME_TAG] = ""
+        default_tags[f"{_METADATA_TAG_PREFIX}BuildTool"] = f"wap {__version__}"
+
+        # all default tags are overrideable
+        merged_tags: dict[str, str] = default_tags | toc_config.serialized_tags
+
+        # sort the tags, for Title and Notes
+        # TOC parsing logic is that, for a given user locale "xxXX" and tag name "Tag"
+        # in {"Title", "Notes"}, the realized value will the LAST declaration of "Tag"
+        # or "Tag-xxXX" in the TOC file. If neither are present, the realized value will
+        # be the game client's default value. For "Title", the default is the name of
+        # the directory, and for "Notes", the default is an empty string.
+        # Since locale tags are probably more applicable, we want them last.
+        tag_pairs = list(merged_tags.items())
+        # this sort should only reorder localized tags. everything else should be in
+        # config order (insertion order) because this python sort is stable.
+        tag_pairs.sort(key=lambda kv: 1 if kv[0] in _LOCALIZED_TAGS else 0)
+
+        tag_keys = [key for key, _ in tag_pairs]
+        interface_tag_index = None
+        if _INTERFACE_TAG not in toc_config.serialized_tags:
+            interface_tag_index = tag_keys.index(_INTERFACE_TAG)
+        build_time_tag_index = None
+        if _BUILD_TIME_TAG not in toc_config.serialized_tags:
+            build_time_tag_index = tag_keys.index(_BUILD_TIME_TAG)
+
+        return cls(
+            tags=tag_pairs,
+            files=toc_config.files,
+            interface_tag_index=interface_tag_index,
+            build_time_tag_index=build_time_tag_index,
+        )
+
+    def render(
+        self,
+        wow_versions: Sequence[Version],
+        build_time: arrow.Arrow,
+        flavor_suffix: str | None = None,
+    ) -> Toc:
+        """
+        Returns the TOC for wow_versions, built at build_time. A TOC for more than one
+        version (with no flavor_suffix) lists each of them in its Interface tag, which
+        modern clients accept in place of a TOC for each flavor.
+        """
+        tags = list(self.tags)
+        if self.interface_tag_index is not None:
+            tags[self.interface_tag_index] = (
+                _INTERFACE_TAG,
+                ", ".join(version.interface_version for version in wow_versions),
+            )
+        if self.build_time_tag_index is not None:
+            tags[self.build_time_tag_index] = (_BUILD_TIME_TAG, build_time.isoformat())
+        return Toc(tags=tags, files=self.files, flavor_suffix=flavor_suffix)
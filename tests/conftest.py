@@ -10,6 +10,7 @@ from respx.router import MockRouter
 from tests.fixture.curseforge import setup_mock_cf_api
 from tests.fixture.fsenv import FSEnv
 from tests.fixture.time import TEST_TIME
+from wap.core import CACHE_DIR_ENVVAR_NAME
 
 
 @pytest.fixture(autouse=True)
@@ -31,6 +32,16 @@ def fs_env(tmp_path: Path) -> Iterator[FSEnv]:
     yield FSEnv(root=tmp_path)
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(
+    tmp_path_factory: pytest.TempPathFactory, monkeypatch: pytest.MonkeyPatch
+) -> Path:
+    # keep tests from sharing a cache with each other or with the user
+    path = tmp_path_factory.mktemp("cache")
+    monkeypatch.setenv(CACHE_DIR_ENVVAR_NAME, str(path))
+    return path
+
+
 @pytest.fixture(autouse=True)
 def cf_api_respx() -> Iterator[MockRouter]:
     with respx.mock(assert_all_called=False) as respx_mock:
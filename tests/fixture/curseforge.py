@@ -56,12 +56,19 @@ def _check_auth(fn: Callable[[Request], Response]) -> Callable[[Request], Respon
     return check
 
 
+# the versions response never changes, so neither does its validator
+VERSIONS_ETAG = '"versions-1"'
+
+
 @_check_auth
-def _version_response(_: Request, **kwargs: str) -> Response:
+def _version_response(request: Request, **kwargs: str) -> Response:
     # kwargs allows respx to pass in named regex groups as key-value pairs if they are
     # specified in the route
+    if request.headers.get("If-None-Match") == VERSIONS_ETAG:
+        return Response(304, headers={"ETag": VERSIONS_ETAG})
     return Response(
         200,
+        headers={"ETag": VERSIONS_ETAG},
         json=[
             {"name": "9.2.7", "id": 1000},
             {"name": "9.2.7", "id": 1001},  # this one has higher id though
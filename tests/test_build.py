@@ -1,6 +1,10 @@
 from __future__ import annotations
 
+import itertools
+import json
 import os
+import threading
+import time
 from collections.abc import Iterable, Iterator, Mapping, Sequence
 from copy import deepcopy
 from pathlib import Path
@@ -16,14 +20,17 @@ from tests.fixture.config import get_basic_config
 from tests.fixture.fsenv import FSEnv
 from tests.fixture.time import TEST_TIME
 from wap import __version__ as wap_version
+from wap.commands.build import PathIndex, RebuildScheduler
 from wap.exception import (
     ConfigError,
     EncodingError,
+    EnvVarError,
     PathExistsError,
     PathMissingError,
     PathTypeError,
     TagError,
 )
+from wap.globs import IncludeResolver
 
 INSTALLATION_ADDON_DIRS = {
     "mainline": "wow/_retail_/Interface/AddOns",
@@ -363,6 +370,94 @@ def test_build_link_path_exists_force(fs_env: FSEnv, link_arg: str) -> None:
     )
 
 
+def test_build_link_again_unchanged(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    addons_dir = fs_env.place_dir(INSTALLATION_ADDON_DIRS["mainline"], parents=True)
+    args = ["--mainline-addons-path", str(addons_dir), "--link", "mainline"]
+    assert invoke_build(args).success
+
+    with patch("wap.links.symlink") as symlink:
+        result = invoke_build(args)
+
+    assert result.success
+    symlink.assert_not_called()
+    assert (addons_dir / "Addon").resolve() == Path(
+        f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon"
+    ).resolve()
+    assert json.loads(Path("dist/.wap/links.json").read_text())["links"] == {
+        str(addons_dir / "Addon"): str(
+            Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon").resolve()
+        )
+    }
+
+
+def test_build_link_new_version(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    addons_dir = fs_env.place_dir(INSTALLATION_ADDON_DIRS["mainline"], parents=True)
+    args = ["--mainline-addons-path", str(addons_dir), "--link", "mainline"]
+    assert invoke_build(args).success
+
+    # the link to the old version's output is wap's, so it is replaced without --force
+    fs_env.write_config(assign(get_basic_config(), "version", "2.0.0"))
+    result = invoke_build(args)
+
+    assert result.success
+    assert "Linked" in result.stderr
+    assert (addons_dir / "Addon").resolve() == Path(
+        f"dist/{PACKAGE_NAME}-2.0.0/Addon"
+    ).resolve()
+
+
+def test_build_link_already_linked_differently(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    addons_dir = fs_env.place_dir(INSTALLATION_ADDON_DIRS["mainline"], parents=True)
+    build_dir = fs_env.place_dir(
+        f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon", parents=True
+    )
+    # the same target, spelled relative to the link
+    (addons_dir / "Addon").symlink_to(
+        os.path.relpath(build_dir, addons_dir), target_is_directory=True
+    )
+    args = ["--mainline-addons-path", str(addons_dir), "--link", "mainline"]
+
+    with patch("wap.links.symlink") as symlink:
+        result = invoke_build(args)
+
+    assert result.success
+    symlink.assert_not_called()
+    assert (addons_dir / "Addon").resolve() == build_dir.resolve()
+
+
+def test_build_link_removes_stale_links(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    config["package"].append(deepcopy(config["package"][0]) | {"path": "./Addon2"})
+    fs_env.write_config(config)
+    fs_env.place_addon("basic")
+    fs_env.place_addon("basic", target_name="Addon2")
+    fs_env.place_file("LICENSE")
+    addons_dir = fs_env.place_dir(INSTALLATION_ADDON_DIRS["mainline"], parents=True)
+    # not made by wap, so left alone
+    (addons_dir / "Other").symlink_to(fs_env.root / "Addon2")
+    args = ["--mainline-addons-path", str(addons_dir), "--link", "mainline"]
+    assert invoke_build(args).success
+    assert (addons_dir / "Addon2").is_symlink()
+
+    fs_env.write_config(get_basic_config())
+    result = invoke_build(args)
+
+    assert result.success
+    assert "Removed stale link" in result.stderr
+    assert not (addons_dir / "Addon2").exists()
+    assert (addons_dir / "Addon").is_symlink()
+    assert (addons_dir / "Other").is_symlink()
+
+
 @pytest.mark.parametrize("add_auto", [True, False])
 @pytest.mark.parametrize(
     "exist_flavor",
@@ -510,6 +605,65 @@ def test_build_include_dir(fs_env: FSEnv) -> None:
     assert Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon/a-directory").is_dir()
 
 
+def test_build_skips_broken_symlink(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    Path("Addon/Broken.lua").symlink_to("DoesNotExist.lua")
+
+    result = invoke_build()
+
+    assert result.success
+    addon_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon")
+    assert (addon_path / "Main.lua").is_file()
+    assert not (addon_path / "Broken.lua").exists()
+
+
+def test_build_exclude(fs_env: FSEnv) -> None:
+    fs_env.write_config(
+        assign(get_basic_config(), "package.0.exclude", [".git/", "/tests/"])
+    )
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    fs_env.place_file("Addon/.wapignore", text="# editor files\n*.swp\nArt/**/*.psd\n")
+    fs_env.place_file("Addon/.git/config", parents=True)
+    fs_env.place_file("Addon/tests/Test.lua", parents=True)
+    fs_env.place_file("Addon/Sub/tests/Kept.lua", parents=True)
+    fs_env.place_file("Addon/Main.lua.swp")
+    fs_env.place_file("Addon/Art/Icons/Icon.psd", parents=True)
+    fs_env.place_file("Addon/Art/Icons/Icon.blp")
+
+    with patch("wap.scan.os.scandir", side_effect=os.scandir) as scandir:
+        result = invoke_build()
+
+    assert result.success
+    addon_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon")
+    assert {
+        path.relative_to(addon_path).as_posix() for path in addon_path.rglob("*")
+    } >= {"Main.lua", "Sub/tests/Kept.lua", "Art/Icons/Icon.blp"}
+    for excluded in [
+        ".wapignore",
+        ".git",
+        "tests",
+        "Main.lua.swp",
+        "Art/Icons/Icon.psd",
+    ]:
+        assert not (addon_path / excluded).exists()
+    # excluded directories aren't scanned at all
+    scanned_names = {Path(call.args[0]).name for call in scandir.call_args_list}
+    assert ".git" not in scanned_names
+
+
+def test_build_exclude_negated(fs_env: FSEnv) -> None:
+    fs_env.write_config(assign(get_basic_config(), "package.0.exclude", ["!a.lua"]))
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    result = invoke_build()
+
+    assert isinstance(result.exception, ConfigError)
+
+
 def test_build_toc_file_missing(fs_env: FSEnv) -> None:
     config = get_basic_config()
     glom(config, ("package.0.toc.files", T.append("NotExist.lua")))
@@ -522,6 +676,37 @@ def test_build_toc_file_missing(fs_env: FSEnv) -> None:
     assert isinstance(result.exception, PathMissingError)
 
 
+def test_build_toc_files_missing_reports_all(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    glom(config, ("package.0.toc.files", T.extend(["NotExist.lua", "Nope/Gone.lua"])))
+    fs_env.write_config(config)
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    result = invoke_build()
+
+    assert isinstance(result.exception, PathMissingError)
+    message = str(result.exception)
+    assert "2 TOC file paths do not exist" in message
+    assert "NotExist.lua" in message
+    assert str(Path("Nope/Gone.lua")) in message
+
+
+def test_build_toc_files_checked_against_scan(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    with patch.object(
+        Path, "is_file", autospec=True, side_effect=Path.is_file
+    ) as is_file:
+        result = invoke_build()
+
+    assert result.success
+    # every TOC file path is found in the scanned source files
+    assert not any(call.args[0].suffix == ".lua" for call in is_file.call_args_list)
+
+
 @pytest.mark.parametrize(
     "toc_suffix",
     [
@@ -690,6 +875,252 @@ def test_build_toc_list_type_tags(
         assert {(tag_name, expected)} <= toc.tags.items()
 
 
+def test_build_toc_one_build_time(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    config["package"].append(deepcopy(config["package"][0]) | {"path": "./Addon2"})
+    fs_env.write_config(config)
+    fs_env.place_addon("basic")
+    fs_env.place_addon("basic", target_name="Addon2")
+    fs_env.place_file("LICENSE")
+    times = (TEST_TIME.shift(seconds=n) for n in itertools.count())
+
+    with patch("wap.commands.build.get_build_time", side_effect=times.__next__):
+        result = invoke_build()
+
+    assert result.success
+    build_times = {
+        Toc.parse(toc_path).tags["X-BuildDateTime"]
+        for toc_path in Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}").glob("*/*.toc")
+    }
+    assert build_times == {str(TEST_TIME)}
+
+
+def test_build_watch_toc_build_time(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    times = (TEST_TIME.shift(seconds=n) for n in itertools.count())
+    toc_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon/Addon.toc")
+
+    def edit_file(*args: Any, **kwargs: Any) -> Iterator[Iterable[Path]]:
+        assert Toc.parse(toc_path).tags["X-BuildDateTime"] == str(TEST_TIME)
+        # listed in the TOC files, so they are written again
+        (addon_path / "Main.lua").write_text("edited")
+        yield {(addon_path / "Main.lua").resolve()}
+
+    with (
+        patch("wap.commands.build.get_build_time", side_effect=times.__next__),
+        patch("tests.cmd_util.build.watch_paths", side_effect=edit_file),
+    ):
+        result = invoke_build(["--watch"])
+
+    assert result.success
+    assert Toc.parse(toc_path).tags["X-BuildDateTime"] == str(
+        TEST_TIME.shift(seconds=1)
+    )
+
+
+def test_build_toc_interface_override(fs_env: FSEnv) -> None:
+    fs_env.write_config(
+        assign(get_basic_config(), "package.0.toc.tags.Interface", "12345")
+    )
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    result = invoke_build()
+
+    assert result.success
+    for suffix, _ in SUFFIX_INTERFACE_PAIRS:
+        toc_path = Path(
+            f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon/Addon{suffix}.toc"
+        )
+        assert Toc.parse(toc_path).tags["Interface"] == "12345"
+
+
+def test_build_toc_multi_interface(fs_env: FSEnv) -> None:
+    fs_env.write_config(
+        assign(get_basic_config(), "package.0.toc.mode", "multiInterface")
+    )
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    result = invoke_build()
+
+    assert result.success
+    addon_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon")
+    assert sorted(path.name for path in addon_path.glob("*.toc")) == ["Addon.toc"]
+    toc = Toc.parse(addon_path / "Addon.toc")
+    assert toc.tags["Interface"] == "90207, 40400, 11403"
+    assert toc.files == ["Main.lua", "Extra.lua"]
+
+
+def test_build_toc_multi_interface_removes_flavor_tocs(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    assert invoke_build().success
+    fs_env.write_config(
+        assign(get_basic_config(), "package.0.toc.mode", "multiInterface")
+    )
+
+    result = invoke_build()
+
+    assert result.success
+    addon_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon")
+    assert sorted(path.name for path in addon_path.glob("*.toc")) == ["Addon.toc"]
+
+
+EMBEDS_XML = """\
+<Ui xmlns="http://www.blizzard.com/wow/ui/">
+  <!-- <Script file="Commented.lua"/> -->
+  <Include file="Lib\\Lib.xml"/>
+  <Script file="Missing.lua"/>
+</Ui>
+"""
+LIB_XML = '<Ui><Script file="lib.lua" /></Ui>'
+
+
+def place_libs(fs_env: FSEnv) -> None:
+    fs_env.place_file("Addon/Libs/embeds.xml", parents=True, text=EMBEDS_XML)
+    fs_env.place_file("Addon/Libs/Lib/Lib.xml", parents=True, text=LIB_XML)
+    fs_env.place_file("Addon/Libs/Lib/Lib.lua")
+
+
+def test_build_warns_unreferenced_lua_files(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    glom(config, ("package.0.toc.files", T.append("Libs\\embeds.xml")))
+    fs_env.write_config(config)
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    place_libs(fs_env)
+    fs_env.place_file("Addon/Unlisted.lua")
+    fs_env.place_file("Addon/Libs/Lib/Unused.lua")
+
+    result = invoke_build()
+
+    assert result.success
+    assert (
+        "2 Lua file(s) are not loaded by the TOC files or any XML file they load: "
+        "Libs/Lib/Unused.lua, Unlisted.lua"
+    ) in result.stderr
+    assert "Libs/embeds.xml loads Missing.lua, which does not exist" in result.stderr
+    assert "Commented.lua" not in result.stderr
+
+
+def test_build_watch_warns_unreferenced_lua_files_when_changed(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    fs_env.place_file("Addon/Unlisted.lua")
+
+    def change_addon(*args: Any, **kwargs: Any) -> Iterator[Iterable[Path]]:
+        # built again, with the same unreferenced files
+        (addon_path / "Dir").mkdir()
+        yield {(addon_path / "Dir").resolve()}
+        # wait for that build to finish, so that it isn't cancelled
+        manifest_path = Path(f"dist/.wap/manifests/{PACKAGE_NAME}-{PACKAGE_VERSION}")
+        deadline = time.monotonic() + 5
+        while '"Dir"' not in (manifest_path / "Addon.json").read_text():
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        (addon_path / "Dir/New.lua").write_text("")
+        yield {(addon_path / "Dir/New.lua").resolve()}
+
+    with patch("tests.cmd_util.build.watch_paths", side_effect=change_addon):
+        result = invoke_build(["--watch"])
+
+    assert result.success
+    assert result.stderr.count("Built addon") == 3
+    assert result.stderr.count("are not loaded") == 2
+    assert "2 Lua file(s) are not loaded" in result.stderr
+
+
+def test_build_xml_references_from_game_dir(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    glom(config, ("package.0.toc.files", T.append("Libs\\embeds.xml")))
+    fs_env.write_config(config)
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    fs_env.place_file(
+        "Addon/Libs/embeds.xml",
+        parents=True,
+        text=(
+            '<Ui><Script file="Interface\\AddOns\\Addon\\Libs\\Lib.lua"/>'
+            '<Script file="interface/addons/addon/Libs/Other.lua"/></Ui>'
+        ),
+    )
+    fs_env.place_file("Addon/Libs/Lib.lua")
+    fs_env.place_file("Addon/Libs/Other.lua")
+
+    result = invoke_build()
+
+    assert result.success
+    assert "does not exist" not in result.stderr
+    assert "are not loaded" not in result.stderr
+
+
+def test_build_toc_auto_files(fs_env: FSEnv) -> None:
+    fs_env.write_config(assign(get_basic_config(), "package.0.toc.autoFiles", True))
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    place_libs(fs_env)
+    fs_env.place_file("Addon/Core/Zed.lua", parents=True)
+
+    result = invoke_build()
+
+    assert result.success
+    assert "are not loaded" not in result.stderr
+    toc = Toc.parse(Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon/Addon.toc"))
+    assert toc.files == [
+        "Main.lua",
+        "Extra.lua",
+        "Core\\Zed.lua",
+        "Libs\\embeds.xml",
+    ]
+
+
+def test_build_caches_xml_references(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    glom(config, ("package.0.toc.files", T.append("Libs/embeds.xml")))
+    fs_env.write_config(config)
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    place_libs(fs_env)
+    assert invoke_build().success
+
+    with patch("wap.commands.build.parse_xml_references") as parse:
+        result = invoke_build()
+
+    assert result.success
+    parse.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "cache_text",
+    [
+        "not json",
+        '{"version": 1, "references": []}',
+        '{"version": 1, "references": {"0123": "Lib.lua"}}',
+    ],
+)
+def test_build_bad_xml_references_cache(fs_env: FSEnv, cache_text: str) -> None:
+    config = get_basic_config()
+    glom(config, ("package.0.toc.files", T.append("Libs/embeds.xml")))
+    fs_env.write_config(config)
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    place_libs(fs_env)
+    assert invoke_build().success
+    (cache_path,) = Path("dist/.wap/references").glob("*/Addon.json")
+    cache_path.write_text(cache_text)
+
+    result = invoke_build()
+
+    # as if there were no cache
+    assert result.success
+    assert "Libs/embeds.xml loads Missing.lua" in result.stderr
+
+
 @pytest.mark.parametrize("bad_tag", ["foo bar", "foo\nbar", "foo:bar"])
 def test_build_toc_bad_tags(fs_env: FSEnv, bad_tag: str) -> None:
     config = get_basic_config()
@@ -780,3 +1211,626 @@ def test_build_watch_config_file(fs_env: FSEnv) -> None:
     assert (
         Path(f"dist/{PACKAGE_NAME}-{new_version}/Addon/New.txt").read_text() == new_text
     )
+
+
+def test_build_watch_applies_only_changed_file(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    fs_env.place_file("Addon/Unlisted.lua")
+
+    def edit_file(*args: Any, **kwargs: Any) -> Iterator[Iterable[Path]]:
+        (addon_path / "Unlisted.lua").write_text("edited")
+        yield {(addon_path / "Unlisted.lua").resolve()}
+
+    with patch("tests.cmd_util.build.watch_paths", side_effect=edit_file):
+        result = invoke_build(["--watch"])
+
+    assert result.success
+    output_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon")
+    assert (output_path / "Unlisted.lua").read_text() == "edited"
+    # an unlisted file doesn't touch the tocs
+    assert "(1 copied, 0 skipped, 0 removed)" in result.stderr
+
+
+def test_build_watch_toc_listed_file_writes_tocs(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    def edit_file(*args: Any, **kwargs: Any) -> Iterator[Iterable[Path]]:
+        (addon_path / "Main.lua").write_text("edited")
+        yield {(addon_path / "Main.lua").resolve()}
+
+    with patch("tests.cmd_util.build.watch_paths", side_effect=edit_file):
+        result = invoke_build(["--watch"])
+
+    assert result.success
+    output_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon")
+    assert (output_path / "Main.lua").read_text() == "edited"
+    # the tocs are checked and written again (unchanged, as time is frozen)
+    assert "(1 copied, 4 skipped, 0 removed)" in result.stderr
+
+
+def test_build_watch_coalesces_changes(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    def edit_files(*args: Any, **kwargs: Any) -> Iterator[Iterable[Path]]:
+        for name in ["Main.lua", "Extra.lua"]:
+            (addon_path / name).write_text("edited")
+            yield {(addon_path / name).resolve()}
+
+    with patch("tests.cmd_util.build.watch_paths", side_effect=edit_files):
+        result = invoke_build(["--watch", "--debounce", "1000"])
+
+    assert result.success
+    assert result.stderr.count("Project file changed") == 1
+    assert "(2 copied, 4 skipped, 0 removed)" in result.stderr
+
+
+def test_build_watch_rebuilds_only_owning_addon(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    config["package"] = [
+        assign(deepcopy(config["package"][0]), "path", f"./{name}")
+        for name in ["Addon", "Addon2"]
+    ]
+    fs_env.write_config(config)
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_addon("basic", "Addon2")
+    fs_env.place_file("LICENSE")
+    fs_env.place_file("Addon/Dir/Gone.lua", parents=True)
+
+    def change_addon(*args: Any, **kwargs: Any) -> Iterator[Iterable[Path]]:
+        (addon_path / "Dir" / "Gone.lua").unlink()
+        (addon_path / "Dir").rmdir()
+        yield {(addon_path / "Dir").resolve()}
+
+    with patch("tests.cmd_util.build.watch_paths", side_effect=change_addon):
+        result = invoke_build(["--watch"])
+
+    assert result.success
+    rebuild_output = result.stderr.split("Project file changed")[1]
+    # the addon is built again, because a directory was removed...
+    assert "Built addon Addon (0 copied, 7 skipped, 1 removed)" in rebuild_output
+    # ...but the other addon is left alone
+    assert "Addon2" not in rebuild_output
+
+
+def test_build_watch_shared_include_rebuilds_each_addon(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    config["package"] = [
+        assign(deepcopy(config["package"][0]), "path", f"./{name}")
+        for name in ["Addon", "Addon2"]
+    ]
+    fs_env.write_config(config)
+    fs_env.place_addon("basic")
+    fs_env.place_addon("basic", "Addon2")
+    license_path = fs_env.place_file("LICENSE")
+
+    def edit_license(*args: Any, **kwargs: Any) -> Iterator[Iterable[Path]]:
+        license_path.write_text("edited")
+        yield {license_path.resolve()}
+
+    with patch("tests.cmd_util.build.watch_paths", side_effect=edit_license):
+        result = invoke_build(["--watch"])
+
+    assert result.success
+    rebuild_output = result.stderr.split("Project file changed")[1]
+    assert "Built addon Addon (1 copied, 0 skipped, 0 removed)" in rebuild_output
+    assert "Built addon Addon2 (1 copied, 0 skipped, 0 removed)" in rebuild_output
+    for name in ["Addon", "Addon2"]:
+        assert (
+            Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/{name}/LICENSE").read_text()
+            == "edited"
+        )
+
+
+def test_rebuild_scheduler_retries_stale_changes() -> None:
+    first, second, third = Path("/a"), Path("/b"), Path("/c")
+    release = threading.Event()
+
+    def changes() -> Iterator[Iterable[Path]]:
+        yield {first}
+        yield {second}
+        release.wait()
+        yield {third}
+
+    scheduler = RebuildScheduler(changes(), debounce=0.5)
+    batches = iter(scheduler)
+
+    assert next(batches) == {first, second}
+    assert not scheduler.is_stale()
+
+    # more changes arrive while "rebuilding"
+    release.set()
+    deadline = time.monotonic() + 5
+    while not scheduler.is_stale():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    scheduler.retry({first, second})
+
+    assert next(batches) == {first, second, third}
+    assert next(batches, None) is None
+
+
+def test_rebuild_scheduler_ignores_output_writes() -> None:
+    source, output = Path("/project/Addon/Main.lua"), Path("/project/dist")
+    release, written, edited = threading.Event(), threading.Event(), threading.Event()
+
+    def changes() -> Iterator[Iterable[Path]]:
+        yield {source}
+        release.wait()
+        # the rebuild writing its output, for longer than the debounce window
+        yield {output / "Addon/Main.lua"}
+        yield {output / ".wap/links.json"}
+        written.set()
+        edited.wait()
+        yield {output / "Addon/Main.lua", source}
+
+    scheduler = RebuildScheduler(changes(), debounce=0.1, ignored_paths=[output])
+    batches = iter(scheduler)
+
+    assert next(batches) == {source}
+    release.set()
+    assert written.wait(5)
+    time.sleep(0.05)
+    assert not scheduler.is_stale()
+
+    edited.set()
+    deadline = time.monotonic() + 5
+    while not scheduler.is_stale():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert next(batches) == {source}
+    assert not scheduler.is_stale()
+    assert next(batches, None) is None
+
+
+def test_path_index() -> None:
+    index: PathIndex[str] = PathIndex()
+    index.add(Path("/project/Addon"), "Addon")
+    index.add(Path("/project/Addon/Libs"), "Libs")
+    index.add(Path("/project/LICENSE"), "Addon")
+
+    assert index.lookup(Path("/project/Addon/Libs/Lib.lua")) == ["Addon", "Libs"]
+    assert index.lookup(Path("/project/LICENSE")) == ["Addon"]
+    assert index.lookup(Path("/project/LICENSE.txt")) == []
+    assert index.lookup(Path("/project")) == []
+    assert index.group(
+        [Path("/project/Addon/Main.lua"), Path("/project/Other.lua")]
+    ) == {"Addon": {Path("/project/Addon/Main.lua")}}
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        "./LICENSE",
+        "*",
+        "**/LICENSE",
+        "Docs/*.md",
+        "Docs/**/*.md",
+        "[DL]*",
+        "Nope/*",
+        "../*",
+    ],
+)
+def test_include_resolver_matches_glob(fs_env: FSEnv, pattern: str) -> None:
+    fs_env.place_file("LICENSE")
+    fs_env.place_file("Docs/Deep/LICENSE", parents=True, exist_ok=True)
+    fs_env.place_file("Docs/Readme.md")
+    fs_env.place_file("Docs/Deep/Notes.md")
+    root = fs_env.root / "Project"
+    root.mkdir()
+    for path in fs_env.root.iterdir():
+        if path != root:
+            path.rename(root / path.name)
+
+    assert IncludeResolver().resolve_all(root, [pattern]) == [
+        sorted(root.glob(pattern))
+    ]
+
+
+def test_include_resolver_invalidate(fs_env: FSEnv) -> None:
+    fs_env.place_file("LICENSE")
+    fs_env.place_file("Docs/Readme.md", parents=True)
+    root = fs_env.root
+    resolver = IncludeResolver()
+    resolver.resolve_all(root, ["LICENSE", "Docs", "*.txt"])
+
+    # inside of an included directory, or not where a pattern looks
+    assert not resolver.invalidate({root / "Docs/Readme.md", root / "Docs/New.md"})
+    # where a pattern looks
+    assert resolver.invalidate({root / "New.txt"})
+    assert resolver.invalidate({root / "LICENSE"})
+
+
+def test_build_watch_new_include_match(fs_env: FSEnv) -> None:
+    fs_env.write_config(assign(get_basic_config(), "package.0.include", ["./*.txt"]))
+    fs_env.place_addon("basic")
+    fs_env.place_file("A.txt")
+    output_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon")
+
+    def add_file(*args: Any, **kwargs: Any) -> Iterator[Iterable[Path]]:
+        assert (output_path / "A.txt").is_file()
+        fs_env.place_file("B.txt")
+        yield {(fs_env.root / "B.txt").resolve()}
+
+    with patch("tests.cmd_util.build.watch_paths", side_effect=add_file):
+        result = invoke_build(["--watch"])
+
+    assert result.success
+    assert (output_path / "B.txt").is_file()
+
+
+def test_build_watch_ignores_output_changes(fs_env: FSEnv) -> None:
+    # resolved with Path.glob, so any change in the project could change its matches
+    fs_env.write_config(assign(get_basic_config(), "package.0.include", ["./Docs/"]))
+    fs_env.place_addon("basic")
+    fs_env.place_file("Docs/Readme.md", parents=True)
+    output_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon")
+
+    def write_output(*args: Any, **kwargs: Any) -> Iterator[Iterable[Path]]:
+        assert (output_path / "Docs/Readme.md").is_file()
+        # as the build itself does
+        yield {(output_path / "Addon.toc").resolve()}
+        yield {Path("dist/.wap/links.json").resolve()}
+
+    with patch("tests.cmd_util.build.watch_paths", side_effect=write_output):
+        result = invoke_build(["--watch"])
+
+    assert result.success
+    assert "rebuilding" not in result.stderr
+
+
+def test_build_watch_deleted_source_file(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    fs_env.place_file("Addon/Unlisted.txt")
+
+    def delete_file(*args: Any, **kwargs: Any) -> Iterator[Iterable[Path]]:
+        (addon_path / "Unlisted.txt").unlink()
+        yield {(addon_path / "Unlisted.txt").resolve()}
+
+    with patch("tests.cmd_util.build.watch_paths", side_effect=delete_file):
+        result = invoke_build(["--watch"])
+
+    assert result.success
+    assert "(0 copied, 0 skipped, 1 removed)" in result.stderr
+    assert not Path(
+        f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon/Unlisted.txt"
+    ).exists()
+
+
+def test_build_watch_ignore_file(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    fs_env.place_file("Addon/Notes.txt")
+    output_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon")
+
+    def ignore_file(*args: Any, **kwargs: Any) -> Iterator[Iterable[Path]]:
+        assert (output_path / "Notes.txt").is_file()
+        (addon_path / ".wapignore").write_text("*.txt\n")
+        yield {(addon_path / ".wapignore").resolve()}
+        (addon_path / "Other.txt").write_text("")
+        yield {(addon_path / "Other.txt").resolve()}
+
+    with patch("tests.cmd_util.build.watch_paths", side_effect=ignore_file):
+        result = invoke_build(["--watch"])
+
+    assert result.success
+    assert not (output_path / "Notes.txt").exists()
+    assert not (output_path / "Other.txt").exists()
+
+
+def test_build_watch_deleted_toc_file(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    def delete_file(*args: Any, **kwargs: Any) -> Iterator[Iterable[Path]]:
+        (addon_path / "Main.lua").unlink()
+        yield {(addon_path / "Main.lua").resolve()}
+
+    with patch("tests.cmd_util.build.watch_paths", side_effect=delete_file):
+        result = invoke_build(["--watch"])
+
+    assert isinstance(result.exception, PathMissingError)
+
+
+def test_build_watch_deleted_dir_builds_again(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    fs_env.place_file("Addon/Dir/Gone.lua", parents=True)
+
+    def delete_dir(*args: Any, **kwargs: Any) -> Iterator[Iterable[Path]]:
+        (addon_path / "Dir" / "Gone.lua").unlink()
+        (addon_path / "Dir").rmdir()
+        yield {(addon_path / "Dir").resolve()}
+
+    with patch("tests.cmd_util.build.watch_paths", side_effect=delete_dir):
+        result = invoke_build(["--watch"])
+
+    assert result.success
+    # built again from scratch (but still incrementally)
+    assert "(0 copied, 7 skipped, 1 removed)" in result.stderr
+    assert not Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon/Dir").exists()
+
+
+def test_build_incremental_skips_unchanged(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    first_result = invoke_build()
+    assert first_result.success
+    assert "7 copied, 0 skipped, 0 removed" in first_result.stderr
+
+    second_result = invoke_build()
+    assert second_result.success
+    # time is frozen in tests, so the generated tocs are unchanged too
+    assert "0 copied, 7 skipped, 0 removed" in second_result.stderr
+
+    check_basic_addon(Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon"))
+
+
+@pytest.mark.parametrize(
+    "manifest_text",
+    [
+        "not json",
+        '{"version": 1, "files": [], "dirs": []}',
+        '{"version": 1, "files": {"Main.lua": 1}, "dirs": []}',
+    ],
+)
+def test_build_incremental_bad_manifest(fs_env: FSEnv, manifest_text: str) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    assert invoke_build().success
+    Path(f"dist/.wap/manifests/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon.json").write_text(
+        manifest_text
+    )
+
+    result = invoke_build()
+
+    # as if there were no previous build
+    assert result.success
+    assert "7 copied, 0 skipped" in result.stderr
+    check_basic_addon(Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon"))
+
+
+def test_build_incremental_copies_changed(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    assert invoke_build().success
+
+    new_text = "changed, and with a different size"
+    (addon_path / "Main.lua").write_text(new_text)
+
+    result = invoke_build()
+
+    assert result.success
+    assert "1 copied, 6 skipped" in result.stderr
+    assert (
+        Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon/Main.lua").read_text()
+        == new_text
+    )
+
+
+def test_build_incremental_removes_deleted(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    fs_env.place_file("Addon/Dir/Gone.lua", parents=True)
+    unmanaged = fs_env.place_file(
+        f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon/unmanaged", parents=True
+    )
+
+    assert invoke_build().success
+
+    output_dir = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon/Dir")
+    assert (output_dir / "Gone.lua").is_file()
+
+    (addon_path / "Dir" / "Gone.lua").unlink()
+    (addon_path / "Dir").rmdir()
+
+    result = invoke_build()
+
+    assert result.success
+    assert "1 removed" in result.stderr
+    assert not output_dir.exists()
+    # files that wap did not write are left alone
+    assert unmanaged.exists()
+
+
+def test_build_jobs(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    addon_names = ["Addon", "Addon2", "Addon3"]
+    config["package"] = [
+        assign(deepcopy(config["package"][0]), "path", f"./{name}")
+        for name in addon_names
+    ]
+    fs_env.write_config(config)
+    for name in addon_names:
+        fs_env.place_addon("basic", name)
+    fs_env.place_file("LICENSE")
+
+    result = invoke_build(["--jobs", "3"])
+
+    assert result.success
+    for name in addon_names:
+        check_basic_addon(Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/{name}"))
+    # output is in config order regardless of which addon finished first
+    assert [
+        result.stderr.index(f"Built addon {name} ") for name in addon_names
+    ] == sorted(result.stderr.index(f"Built addon {name} ") for name in addon_names)
+
+
+def test_build_jobs_error(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    config["package"].append(assign(deepcopy(config["package"][0]), "path", "./Bad"))
+    fs_env.write_config(config)
+    fs_env.place_addon("basic")
+    fs_env.place_file("Bad")  # not a directory
+    fs_env.place_file("LICENSE")
+
+    result = invoke_build(["--jobs", "2"])
+
+    assert isinstance(result.exception, PathTypeError)
+
+
+def test_build_dupe_addon_name(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    config["package"].append(
+        assign(deepcopy(config["package"][0]), "path", "./Other/Addon")
+    )
+    fs_env.write_config(config)
+    fs_env.place_addon("basic")
+    fs_env.place_addon("basic", "Other/Addon")
+    fs_env.place_file("LICENSE")
+
+    result = invoke_build()
+
+    assert isinstance(result.exception, ConfigError)
+
+
+@pytest.mark.parametrize("copy_strategy", ["copy", "hardlink", "reflink"])
+def test_build_copy_strategy(fs_env: FSEnv, copy_strategy: str) -> None:
+    fs_env.write_config(get_basic_config())
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    result = invoke_build(["--copy-strategy", copy_strategy])
+
+    assert result.success
+    output_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon")
+    check_basic_addon(output_path)
+    is_same_file = (output_path / "Main.lua").samefile(addon_path / "Main.lua")
+    assert is_same_file == (copy_strategy == "hardlink")
+
+
+def test_build_copy_strategy_changed(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    output_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon")
+    assert invoke_build(["--copy-strategy", "hardlink"]).success
+    assert (output_path / "Main.lua").samefile(addon_path / "Main.lua")
+
+    result = invoke_build(["--copy-strategy", "copy"])
+
+    assert result.success
+    # every source file, but not the generated TOCs
+    assert "3 copied, 4 skipped" in result.stderr
+    output_stat = (output_path / "Main.lua").stat()
+    assert output_stat.st_ino != (addon_path / "Main.lua").stat().st_ino
+    assert output_stat.st_nlink == 1
+    assert (addon_path / "Main.lua").stat().st_nlink == 1
+    check_basic_addon(output_path)
+
+
+def test_build_copy_strategy_config(fs_env: FSEnv) -> None:
+    fs_env.write_config(
+        assign(get_basic_config(), "build", {"copyStrategy": "hardlink"})
+    )
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    result = invoke_build()
+
+    assert result.success
+    output_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon")
+    assert (output_path / "Main.lua").samefile(addon_path / "Main.lua")
+
+
+def test_build_hardlink_toc_does_not_write_source(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    toc_config = config["package"][0].pop("toc")
+    fs_env.write_config(config)
+    addon_path = fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+    source_toc_text = "## Title: from source"
+    source_toc_path = fs_env.place_file("Addon/Addon.toc", text=source_toc_text)
+
+    # first, the source toc gets hard linked into the output...
+    assert invoke_build(["--copy-strategy", "hardlink"]).success
+
+    # ...then, a generated toc replaces it, which should not touch the source
+    fs_env.write_config(assign(config, "package.0.toc", toc_config))
+    assert invoke_build(["--copy-strategy", "hardlink"]).success
+
+    assert source_toc_path.read_text() == source_toc_text
+    assert (addon_path / "Main.lua").samefile(
+        Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon/Main.lua")
+    )
+
+
+def test_build_source_date_epoch(
+    fs_env: FSEnv, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1700000000")
+    fs_env.write_config(get_basic_config())
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    result = invoke_build()
+
+    assert result.success
+    toc = Toc.parse(Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon/Addon.toc"))
+    assert toc.tags["X-BuildDateTime"] == "2023-11-14T22:13:20+00:00"
+
+
+@pytest.mark.parametrize("value", ["yesterday", "-1"])
+def test_build_bad_source_date_epoch(
+    fs_env: FSEnv, monkeypatch: pytest.MonkeyPatch, value: str
+) -> None:
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", value)
+    fs_env.write_config(get_basic_config())
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    result = invoke_build()
+
+    assert isinstance(result.exception, EnvVarError)
+
+
+def test_build_timings(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_addon("basic")
+    fs_env.place_file("LICENSE")
+
+    result = invoke_build(["--timings"])
+
+    assert result.success
+    for phase in ["load-config", "create-package", "build-addon", "validate-toc"]:
+        assert phase in result.stderr
+
+
+def test_build_profile_trace(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    addon_names = ["Addon", "Addon2"]
+    config["package"] = [
+        assign(deepcopy(config["package"][0]), "path", f"./{name}")
+        for name in addon_names
+    ]
+    fs_env.write_config(config)
+    for name in addon_names:
+        fs_env.place_addon("basic", name)
+    fs_env.place_file("LICENSE")
+
+    result = invoke_build(["--jobs", "2", "--profile", "trace.json"])
+
+    assert result.success
+    events = json.loads(Path("trace.json").read_text())["traceEvents"]
+    assert all(event["ph"] == "X" for event in events)
+    # addons built on other threads are timed too
+    assert {
+        event["args"]["addon"] for event in events if event["name"] == "build-addon"
+    } == set(addon_names)
+    assert {event["name"] for event in events} >= {"load-config", "copy", "write-tocs"}
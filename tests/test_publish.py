@@ -1,25 +1,46 @@
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import random
+import shutil
 import string
+import threading
 import uuid
 from io import BytesIO
 from pathlib import Path
-from typing import BinaryIO
-from zipfile import ZipFile
+from typing import Any, BinaryIO
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
 
+import httpx
 import pytest
 from attrs import frozen
+from freezegun import freeze_time
 from glom import assign, delete  # type: ignore
 from respx.router import MockRouter
 
-from tests.cmd_util import invoke_publish
+from tests.cmd_util import invoke_build, invoke_publish, publish
 from tests.curseforge_request import CFUploadRequestContent
 from tests.fixture.config import get_basic_config
 from tests.fixture.curseforge import CURSEFORGE_TOKEN
 from tests.fixture.fsenv import FSEnv
-from wap.exception import ConfigError, CurseForgeAPIError, PathMissingError
+from tests.fixture.time import TEST_TIME
+from wap.archive import (
+    ArtifactCache,
+    manifest_archive_entries,
+    scan_archive_entries,
+)
+from wap.core import get_manifests_path
+from wap.curseforge import Changelog, CurseForgeAPI, GameVersionId, VersionMap
+from wap.exception import (
+    ConfigError,
+    CurseForgeAPIError,
+    CurseForgeUnavailableError,
+    PathMissingError,
+    PathTypeError,
+    PublishError,
+)
+from wap.manifest import Manifest
 
 PACKAGE_NAME = get_basic_config()["name"]
 PACKAGE_VERSION = get_basic_config()["version"]
@@ -312,3 +333,640 @@ def test_publish_slug(fs_env: FSEnv, with_slug: bool) -> None:
         assert "Upload available at https:" in result.stderr
     else:
         assert "Uploaded file" in result.stderr
+
+
+def test_publish_zip_is_deterministic(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    dist_path = fs_env.place_output_dir("basic")
+    zip_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}.zip")
+
+    assert invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN]).success
+    first_zip_bytes = zip_path.read_bytes()
+
+    # touching files should not change the archive
+    for path in dist_path.rglob("*"):
+        path.touch()
+
+    assert invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN]).success
+    assert zip_path.read_bytes() == first_zip_bytes
+
+    names = [zip_info.filename for zip_info in ZipFile(zip_path).infolist()]
+    assert names == sorted(names)
+
+
+@pytest.mark.parametrize(
+    "args,expected_compress_type",
+    [
+        ([], ZIP_DEFLATED),
+        (["--compression-level", "0"], ZIP_STORED),
+        (["--store-suffix", ".lua"], ZIP_STORED),
+    ],
+)
+def test_publish_zip_compression(
+    fs_env: FSEnv, args: list[str], expected_compress_type: int
+) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+
+    result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN, *args])
+
+    assert result.success
+    zip_file = ZipFile(Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}.zip"))
+    assert zip_file.getinfo("Addon/Main.lua").compress_type == expected_compress_type
+
+
+def test_publish_no_zip_file(fs_env: FSEnv, cf_api_respx: MockRouter) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+
+    result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN, "--no-zip-file"])
+
+    assert result.success
+    assert not Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}.zip").exists()
+
+    dir_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}")
+    req_content = CFUploadRequestContent.from_request(
+        cf_api_respx.routes["upload-file"].calls[0].request  # type: ignore
+    )
+    assert req_content.file_name == f"{PACKAGE_NAME}-{PACKAGE_VERSION}.zip"
+    assert Archive.from_zip(BytesIO(req_content.file_stream)) == Archive.from_dir(
+        dir_path, root_at=dir_path
+    )
+
+
+def test_open_zip_in_memory(fs_env: FSEnv, tmp_path: Path) -> None:
+    build_path = fs_env.place_output_dir("basic") / f"{PACKAGE_NAME}-{PACKAGE_VERSION}"
+
+    zip_file = publish.open_zip(
+        build_path=build_path,
+        zip_path=None,
+        artifact_cache=ArtifactCache(path=tmp_path / "artifacts"),
+        compression_level=6,
+        stored_suffixes=[],
+    )
+
+    # not a file that httpx could roll over to disk when it asks for its size
+    assert isinstance(zip_file, BytesIO)
+    assert Archive.from_zip(zip_file) == Archive.from_dir(
+        build_path, root_at=build_path
+    )
+
+
+def test_publish_reuses_unchanged_zip(fs_env: FSEnv, cf_api_respx: MockRouter) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+    dir_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}")
+    zip_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}.zip")
+
+    first_result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN])
+    assert first_result.success
+    assert "Zipping" in first_result.stderr
+    first_zip_bytes = zip_path.read_bytes()
+
+    second_result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN])
+    assert second_result.success
+    assert "Reusing unchanged zip" in second_result.stderr
+    assert zip_path.read_bytes() == first_zip_bytes
+
+    (dir_path / "Addon" / "Main.lua").write_text("changed")
+
+    third_result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN])
+    assert third_result.success
+    assert "Zipping" in third_result.stderr
+    assert zip_path.read_bytes() != first_zip_bytes
+
+    uploads = cf_api_respx.routes["upload-file"].calls
+    assert len(uploads) == 3
+    last_request_archive = Archive.from_zip(
+        BytesIO(CFUploadRequestContent.from_request(uploads[2].request).file_stream)  # type: ignore
+    )
+    assert last_request_archive == Archive.from_dir(dir_path, root_at=dir_path)
+
+
+def test_publish_source_date_epoch(
+    fs_env: FSEnv, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1700000000")  # 2023-11-14T22:13:20Z
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+
+    result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN])
+
+    assert result.success
+    zip_file = ZipFile(Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}.zip"))
+    assert {zip_info.date_time for zip_info in zip_file.infolist()} == {
+        (2023, 11, 14, 22, 13, 20)
+    }
+
+
+def test_publish_timings(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+
+    result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN, "--timings"])
+
+    assert result.success
+    for phase in ["zip", "get-version-map", "upload"]:
+        assert phase in result.stderr
+
+
+def _place_batch_project(fs_env: FSEnv, dir_name: str, project_id: str) -> str:
+    config = get_basic_config()
+    assign(config, "publish.curseforge.projectId", project_id)
+    fs_env.place_dir(dir_name)
+    fs_env.write_config(config, f"{dir_name}/wap.json")
+    fs_env.place_output_dir("basic", f"{dir_name}/dist/")
+    return f"{dir_name}/wap.json"
+
+
+def test_publish_batch(fs_env: FSEnv, cf_api_respx: MockRouter) -> None:
+    config_paths = [
+        _place_batch_project(fs_env, f"project{index}", str(1000 + index))
+        for index in range(3)
+    ]
+
+    result = invoke_publish(
+        [
+            "--curseforge-token",
+            CURSEFORGE_TOKEN,
+            "--jobs",
+            "2",
+            *(arg for path in config_paths for arg in ["--config-path", path]),
+        ]
+    )
+
+    assert result.success
+    assert cf_api_respx.routes["versions"].call_count == 1
+    upload_file_route = cf_api_respx.routes["upload-file"]
+    assert {
+        str(call.request.url).split("/")[-2] for call in upload_file_route.calls
+    } == {"1000", "1001", "1002"}
+    assert f"Published {PACKAGE_NAME}-{PACKAGE_VERSION}" in result.stderr
+
+
+def test_publish_batch_reports_failures(
+    fs_env: FSEnv, cf_api_respx: MockRouter
+) -> None:
+    good_config_path = _place_batch_project(fs_env, "good", "1000")
+    bad_config_path = _place_batch_project(fs_env, "bad", "1001")
+    config = get_basic_config()
+    assign(config, "wowVersions.mainline", "1.0.0")
+    fs_env.write_config(config, bad_config_path)
+
+    result = invoke_publish(
+        [
+            "--curseforge-token",
+            CURSEFORGE_TOKEN,
+            "--config-path",
+            bad_config_path,
+            "--config-path",
+            good_config_path,
+        ]
+    )
+
+    assert isinstance(result.exception, PublishError)
+    # the other project is still published
+    assert cf_api_respx.routes["upload-file"].call_count == 1
+    assert "Failed to publish" in result.stderr
+    assert "1.0.0" in result.stderr
+
+
+def _versions_call_statuses(cf_api_respx: MockRouter) -> list[int]:
+    return [call.response.status_code for call in cf_api_respx.routes["versions"].calls]
+
+
+def test_publish_caches_versions(fs_env: FSEnv, cf_api_respx: MockRouter) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+
+    for _ in range(2):
+        result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN])
+        assert result.success
+
+    assert _versions_call_statuses(cf_api_respx) == [200]
+    assert cf_api_respx.routes["upload-file"].call_count == 2
+
+
+@pytest.mark.parametrize("how", ["refresh", "expired"])
+def test_publish_revalidates_cached_versions(
+    fs_env: FSEnv, cf_api_respx: MockRouter, how: str
+) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+    args = ["--curseforge-token", CURSEFORGE_TOKEN]
+
+    assert invoke_publish(args).success
+    if how == "refresh":
+        result = invoke_publish([*args, "--refresh-versions"])
+    else:
+        with freeze_time(TEST_TIME.shift(days=2).datetime):
+            result = invoke_publish(args)
+
+    assert result.success
+    assert _versions_call_statuses(cf_api_respx) == [200, 304]
+
+
+def test_publish_fetches_versions_missing_from_cache(
+    fs_env: FSEnv, cf_api_respx: MockRouter, cache_dir: Path
+) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+    assert invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN]).success
+    (version_map_path,) = cache_dir.rglob("versions-*.json")
+    version_map = VersionMap.from_path(version_map_path)
+    assert version_map is not None
+    # as if cached before 1.14.3 came out
+    VersionMap(
+        ids={"9.2.7": 1001, "4.4.0": 1002}, fetched_at=version_map.fetched_at
+    ).write_to_path(version_map_path)
+
+    result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN])
+
+    assert result.success
+    assert _versions_call_statuses(cf_api_respx) == [200, 200]
+    version_map = VersionMap.from_path(version_map_path)
+    assert version_map is not None
+    assert "1.14.3" in version_map.ids
+
+
+def test_publish_uses_stale_versions_when_unavailable(
+    fs_env: FSEnv, cf_api_respx: MockRouter
+) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+    assert invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN]).success
+    cf_api_respx.routes["versions"].mock(side_effect=httpx.ConnectTimeout("timed out"))
+
+    result = invoke_publish(
+        ["--curseforge-token", CURSEFORGE_TOKEN, "--refresh-versions"]
+    )
+
+    assert result.success
+    assert "Using game versions fetched" in result.stderr
+    assert cf_api_respx.routes["upload-file"].call_count == 2
+
+
+def test_publish_versions_unavailable_without_cache(
+    fs_env: FSEnv, cf_api_respx: MockRouter
+) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+    cf_api_respx.routes["versions"].mock(return_value=httpx.Response(503))
+
+    result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN])
+
+    assert isinstance(result.exception, CurseForgeAPIError)
+
+
+@pytest.fixture
+def sleeps(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    # record the delays between retries instead of waiting them out
+    delays: list[float] = []
+
+    async def sleep(delay: float) -> None:
+        delays.append(delay)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return delays
+
+
+def test_publish_upload_retries(
+    fs_env: FSEnv, cf_api_respx: MockRouter, sleeps: list[float]
+) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+    upload_file_route = cf_api_respx.routes["upload-file"]
+    upload_file_route.mock(
+        side_effect=[
+            httpx.Response(503),
+            httpx.ConnectError("connection reset"),
+            httpx.Response(429, headers={"Retry-After": "7"}),
+            httpx.Response(200, json={"id": 1234}),
+        ]
+    )
+
+    result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN])
+
+    assert result.success
+    assert "files/1234" in result.stderr
+    assert upload_file_route.call_count == 4
+    # jittered exponential backoff, except where the server says how long to wait
+    assert 0.5 <= sleeps[0] <= 1
+    assert 1 <= sleeps[1] <= 2
+    assert sleeps[2] == 7
+    # every attempt sends the whole file
+    zip_archive = Archive.from_zip(Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}.zip"))
+    for call in upload_file_route.calls:
+        if call.optional_response is not None:
+            req_content = CFUploadRequestContent.from_request(call.request)
+            assert Archive.from_zip(BytesIO(req_content.file_stream)) == zip_archive
+
+
+@pytest.mark.parametrize(
+    ("response", "expected_call_count", "expected_error"),
+    [
+        (
+            httpx.Response(503),
+            CurseForgeAPI.UPLOAD_ATTEMPTS,
+            CurseForgeUnavailableError,
+        ),
+        (httpx.Response(429), CurseForgeAPI.UPLOAD_ATTEMPTS, CurseForgeAPIError),
+        # the upload may have been processed, so it isn't sent again
+        (httpx.Response(500), 1, CurseForgeUnavailableError),
+        (httpx.ReadTimeout("no response"), 1, CurseForgeUnavailableError),
+        (httpx.Response(400), 1, CurseForgeAPIError),
+    ],
+)
+def test_publish_upload_gives_up(
+    fs_env: FSEnv,
+    cf_api_respx: MockRouter,
+    sleeps: list[float],
+    response: httpx.Response | Exception,
+    expected_call_count: int,
+    expected_error: type[Exception],
+) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+    upload_file_route = cf_api_respx.routes["upload-file"]
+    if isinstance(response, Exception):
+        upload_file_route.mock(side_effect=response)
+    else:
+        upload_file_route.mock(return_value=response)
+
+    result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN])
+
+    assert isinstance(result.exception, expected_error)
+    assert upload_file_route.call_count == expected_call_count
+    assert len(sleeps) == expected_call_count - 1
+
+
+def test_publish_upload_duplicate_on_retry(
+    fs_env: FSEnv, cf_api_respx: MockRouter, sleeps: list[float]
+) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+    upload_file_route = cf_api_respx.routes["upload-file"]
+    upload_file_route.mock(
+        side_effect=[
+            # processed by CurseForge, but the gateway gave up on it
+            httpx.Response(502),
+            httpx.Response(
+                400,
+                json={"errorCode": 1018, "errorMessage": "Duplicate file detected."},
+            ),
+        ]
+    )
+
+    result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN])
+
+    assert result.success
+    assert upload_file_route.call_count == 2
+    assert "file id is unknown" in result.stderr
+
+
+def test_publish_upload_timeout(fs_env: FSEnv, cf_api_respx: MockRouter) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+
+    result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN, "--timeout", "10"])
+
+    assert result.success
+    zip_size = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}.zip").stat().st_size
+    request = cf_api_respx.routes["upload-file"].calls[0].request
+    timeout = request.extensions["timeout"]
+    assert timeout["connect"] == 10
+    assert (
+        timeout["read"]
+        == timeout["write"]
+        == pytest.approx(10 + zip_size / CurseForgeAPI.UPLOAD_TIMEOUT_BYTES_PER_SECOND)
+    )
+
+
+def test_upload_reports_progress() -> None:
+    data = random.randbytes(1024 * 1024)
+    reports: list[tuple[int, int]] = []
+
+    async def upload() -> int | None:
+        async with CurseForgeAPI.open(api_token=CURSEFORGE_TOKEN) as cf_api:
+            return await cf_api.upload(
+                project_id="1234",
+                file=BytesIO(data),
+                file_name="Package-1.2.3.zip",
+                display_name="Package-1.2.3",
+                changelog=Changelog.from_text(""),
+                game_version_ids=[GameVersionId(1001)],
+                release_type="alpha",
+                on_progress=lambda sent, total: reports.append((sent, total)),
+            )
+
+    asyncio.run(upload())
+
+    (total,) = {total for _, total in reports}
+    assert total > len(data)
+    sent = [sent for sent, _ in reports]
+    assert sent[0] == 0
+    assert sent[-1] == total
+    # streamed in chunks, rather than all at once
+    assert len(sent) > 3
+    assert sent == sorted(sent)
+
+
+def test_publish_zips_while_getting_versions(
+    fs_env: FSEnv, cf_api_respx: MockRouter, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_output_dir("basic")
+    versions_requested = threading.Event()
+    versions_route = cf_api_respx.routes["versions"]
+    versions_response = versions_route.side_effect
+
+    def versions(request: httpx.Request, **kwargs: str) -> httpx.Response:
+        versions_requested.set()
+        return versions_response(request, **kwargs)  # type: ignore
+
+    versions_route.mock(side_effect=versions)
+    open_zip = publish.open_zip
+
+    def open_zip_while_getting_versions(**kwargs: Any) -> BinaryIO:
+        # if publishing were serial, the versions wouldn't be requested until after
+        assert versions_requested.wait(timeout=5)
+        return open_zip(**kwargs)
+
+    monkeypatch.setattr(publish, "open_zip", open_zip_while_getting_versions)
+
+    result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN])
+
+    assert result.success
+    assert cf_api_respx.routes["upload-file"].called
+
+
+def test_publish_missing_changelog_file(
+    fs_env: FSEnv, cf_api_respx: MockRouter
+) -> None:
+    config = get_basic_config()
+    assign(config, "publish.curseforge.changelogFile", "./CHANGELOG.md")
+    fs_env.write_config(config)
+    fs_env.place_output_dir("basic")
+
+    result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN])
+
+    assert isinstance(result.exception, PathMissingError)
+    assert not cf_api_respx.routes["upload-file"].called
+
+
+def test_publish_batch_missing_changelog_file(
+    fs_env: FSEnv, cf_api_respx: MockRouter
+) -> None:
+    config_paths = [
+        _place_batch_project(fs_env, f"project{index}", str(1000 + index))
+        for index in range(2)
+    ]
+    config = get_basic_config()
+    assign(config, "publish.curseforge.projectId", "1001")
+    assign(config, "publish.curseforge.changelogFile", "./CHANGELOG.md")
+    fs_env.write_config(config, config_paths[1])
+
+    result = invoke_publish(
+        [
+            "--curseforge-token",
+            CURSEFORGE_TOKEN,
+            *(arg for path in config_paths for arg in ["--config-path", path]),
+        ]
+    )
+
+    # found before the first project is uploaded
+    assert isinstance(result.exception, PathMissingError)
+    assert not cf_api_respx.routes["upload-file"].called
+
+
+def test_publish_batch_bad_auth(fs_env: FSEnv, cf_api_respx: MockRouter) -> None:
+    config_paths = [
+        _place_batch_project(fs_env, f"project{index}", str(1000 + index))
+        for index in range(2)
+    ]
+
+    result = invoke_publish(
+        [
+            "--curseforge-token",
+            str(uuid.uuid4()),
+            *(arg for path in config_paths for arg in ["--config-path", path]),
+        ]
+    )
+
+    # reported once, rather than for each project
+    assert isinstance(result.exception, CurseForgeAPIError)
+    assert not cf_api_respx.routes["upload-file"].called
+
+
+def _place_project_source(fs_env: FSEnv) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_addon("basic")
+    fs_env.place_addon("basic", "Addon2/Sub")
+    fs_env.place_file("LICENSE")
+
+
+def test_manifest_archive_entries_match_scan(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    # nested directories, to check the order of entries
+    config["package"].append({"path": "./Addon2", "include": ["./LICENSE"]})
+    _place_project_source(fs_env)
+    fs_env.write_config(config)
+    assert invoke_build().success
+    build_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}").resolve()
+    manifests_path = get_manifests_path(build_path)
+
+    entries = manifest_archive_entries(
+        build_path,
+        {
+            addon_name: Manifest.from_path(manifests_path / f"{addon_name}.json")
+            for addon_name in ["Addon", "Addon2"]
+        },
+    )
+
+    assert entries == scan_archive_entries(build_path, manifests_path)
+    assert any(entry.arcname == "Addon2/Sub" for entry in entries)
+
+
+def test_publish_build(
+    fs_env: FSEnv, cf_api_respx: MockRouter, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _place_project_source(fs_env)
+
+    def scan_archive_entries(*args: Any, **kwargs: Any) -> Any:
+        raise AssertionError("the output directory should not be scanned")
+
+    monkeypatch.setattr(publish, "scan_archive_entries", scan_archive_entries)
+
+    result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN, "--build"])
+
+    assert result.success
+    assert f"Built package {PACKAGE_NAME}-{PACKAGE_VERSION}" in result.stderr
+    dir_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}")
+    zip_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}.zip")
+    assert Archive.from_dir(dir_path, root_at=dir_path) == Archive.from_zip(zip_path)
+    assert cf_api_respx.routes["upload-file"].called
+
+
+def test_publish_build_unresolved_config_path(
+    fs_env: FSEnv, cf_api_respx: MockRouter
+) -> None:
+    _place_project_source(fs_env)
+
+    result = invoke_publish(
+        [
+            "--curseforge-token",
+            CURSEFORGE_TOKEN,
+            "--build",
+            "--config-path",
+            "Addon/../wap.json",
+        ]
+    )
+
+    assert result.success
+    # reported like wap build does, at the resolved paths
+    assert "Built addon Addon at" in result.stderr
+    assert "Addon/.." not in result.stderr
+    assert cf_api_respx.routes["upload-file"].called
+
+
+def test_publish_build_same_zip(fs_env: FSEnv) -> None:
+    _place_project_source(fs_env)
+    zip_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}.zip")
+
+    assert invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN, "--build"]).success
+    built_zip = zip_path.read_bytes()
+    shutil.rmtree("dist/.wap/artifacts")
+    assert invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN]).success
+
+    # zipping what was built is the same as zipping the output directory
+    assert zip_path.read_bytes() == built_zip
+
+
+def test_publish_build_same_zip_after_removing_addon(fs_env: FSEnv) -> None:
+    config = get_basic_config()
+    config["package"].append({"path": "./Addon2"})
+    _place_project_source(fs_env)
+    fs_env.write_config(config)
+    assert invoke_build().success
+    fs_env.write_config(get_basic_config())
+    zip_path = Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}.zip")
+
+    assert invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN, "--build"]).success
+    built_zip = zip_path.read_bytes()
+    shutil.rmtree("dist/.wap/artifacts")
+    assert invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN]).success
+
+    # the removed addon's output is in neither zip
+    assert zip_path.read_bytes() == built_zip
+    assert not any(name.startswith("Addon2/") for name in ZipFile(zip_path).namelist())
+    assert not Path(f"dist/{PACKAGE_NAME}-{PACKAGE_VERSION}/Addon2").exists()
+
+
+def test_publish_build_fails(fs_env: FSEnv, cf_api_respx: MockRouter) -> None:
+    fs_env.write_config(get_basic_config())
+    fs_env.place_file("LICENSE")
+
+    result = invoke_publish(["--curseforge-token", CURSEFORGE_TOKEN, "--build"])
+
+    assert isinstance(result.exception, PathTypeError)
+    assert not cf_api_respx.routes["upload-file"].called
@@ -0,0 +1,47 @@
+"""
+Guards against regressions in how long it takes `wap` to start up. Importing modules is
+most of that time, so these check which modules are imported rather than timing them,
+which would be flaky.
+"""
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["arrow", "httpx", "jsonschema", "watchfiles"]
+
+
+def _imported_heavy_modules(code: str) -> list[str]:
+    check = (
+        f"{code}\n"
+        "import json, sys\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", check], capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def test_startup_base_imports_no_heavy_modules() -> None:
+    assert _imported_heavy_modules("import wap.__main__") == []
+
+
+@pytest.mark.parametrize(
+    "subcommand,allowed",
+    [
+        ("validate", {"jsonschema"}),
+        ("new-config", {"jsonschema"}),
+        ("build", {"arrow", "jsonschema", "watchfiles"}),
+        ("publish", set(HEAVY_MODULES)),
+    ],
+)
+def test_startup_subcommand_imports(subcommand: str, allowed: set[str]) -> None:
+    code = (
+        "import click\n"
+        "from wap.commands.base import base\n"
+        f"base.get_command(click.Context(base), {subcommand!r})"
+    )
+    assert set(_imported_heavy_modules(code)) <= allowed
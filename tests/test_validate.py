@@ -1,6 +1,10 @@
+import pytest
+
 from tests.cmd_util import invoke_validate
 from tests.fixture.config import get_basic_config
 from tests.fixture.fsenv import FSEnv
+from wap.config import Config
+from wap.exception import ConfigSchemaError
 
 
 def test_valid_validation(fs_env: FSEnv) -> None:
@@ -21,3 +25,27 @@ def test_invalid_validation(fs_env: FSEnv) -> None:
     # running the command... standalone mode, perhaps.
     assert result.success
     assert result.stdout == "invalid"
+
+
+def test_unchanged_config_is_reused(fs_env: FSEnv) -> None:
+    config_path = fs_env.write_config(get_basic_config())
+
+    first = Config.from_path(config_path)
+    second = Config.from_path(config_path)
+    uncached = Config.from_path(config_path, use_cache=False)
+
+    assert second is first
+    assert uncached is not first
+    assert uncached == first
+
+
+def test_changed_config_is_revalidated(fs_env: FSEnv) -> None:
+    config_path = fs_env.write_config(get_basic_config())
+    Config.from_path(config_path)
+
+    config_obj = get_basic_config()
+    del config_obj["package"]
+    fs_env.write_config(config_obj)
+
+    with pytest.raises(ConfigSchemaError):
+        Config.from_path(config_path)